@@ -0,0 +1,419 @@
+import io
+import sys
+import time
+import tempfile
+import tracemalloc
+import unittest
+import functools
+import contextlib
+import plox
+import plox_scanner
+import plox_parser
+import plox_cache
+import plox_optimizer
+import plox_operators
+
+# Programs are wrapped in a block so that their declarations stay local to each run.
+fibonacci = "{" \
+            "    fun fib(n)" \
+            "    {" \
+            "        if (n <= 1)" \
+            "        {" \
+            "            return n;" \
+            "        }" \
+            "        return fib(n - 1) + fib(n - 2);" \
+            "    }" \
+            "    print fib(17);" \
+            "}"
+
+loop = "{" \
+       "    var i = 0;" \
+       "    var total = 0;" \
+       "    while (i < 20000)" \
+       "    {" \
+       "        total = total + i * 2;" \
+       "        i = i + 1;" \
+       "    }" \
+       "    print total;" \
+       "}"
+
+closures = "{" \
+           "    fun make_counter()" \
+           "    {" \
+           "        var count = 0;" \
+           "        fun increment()" \
+           "        {" \
+           "            count = count + 1;" \
+           "            return count;" \
+           "        }" \
+           "        return increment;" \
+           "    }" \
+           "    var counter = make_counter();" \
+           "    var i = 0;" \
+           "    while (i < 5000)" \
+           "    {" \
+           "        counter();" \
+           "        i = i + 1;" \
+           "    }" \
+           "    print counter();" \
+           "}"
+
+classes = "{" \
+          "    class Store" \
+          "    {" \
+          "        fun __init__(price)" \
+          "        {" \
+          "            this.price = price;" \
+          "        }" \
+          "        fun cost(amount)" \
+          "        {" \
+          "            return this.price * amount;" \
+          "        }" \
+          "    }" \
+          "    class Bakery > Store" \
+          "    {" \
+          "        fun total_cost(amount)" \
+          "        {" \
+          "            return this.cost(amount) + 1;" \
+          "        }" \
+          "    }" \
+          "    var bakery = Bakery(2);" \
+          "    var i = 0;" \
+          "    var total = 0;" \
+          "    while (i < 3000)" \
+          "    {" \
+          "        total = total + bakery.total_cost(i);" \
+          "        i = i + 1;" \
+          "    }" \
+          "    print total;" \
+          "}"
+
+arithmetic = "{" \
+             "    var i = 0;" \
+             "    var total = 0;" \
+             "    while (i < 20000)" \
+             "    {" \
+             "        total = total + (i * 3 - i / 2) * 2 - (i + 1) / 4;" \
+             "        if (total >= 1000000) { if (i != 0) { total = total - 1000000; } }" \
+             "        i = i + 1;" \
+             "    }" \
+             "    print total;" \
+             "}"
+
+breaks = "{" \
+         "    var i = 0;" \
+         "    var total = 0;" \
+         "    while (i < 3000)" \
+         "    {" \
+         "        var j = 0;" \
+         "        while (true)" \
+         "        {" \
+         "            if (j >= 3) { break; }" \
+         "            j = j + 1;" \
+         "        }" \
+         "        total = total + j;" \
+         "        i = i + 1;" \
+         "    }" \
+         "    print total;" \
+         "}"
+
+constants = "{" \
+            "    var i = 0;" \
+            "    var total = 0;" \
+            "    while (i < 10000)" \
+            "    {" \
+            "        if (true) { total = total + (3 + 7) * (8 - 2) - -(4 / 2); }" \
+            "        else { total = 0; }" \
+            "        while (false) { total = 0; }" \
+            "        i = i + 1;" \
+            "    }" \
+            "    print total;" \
+            "}"
+
+hierarchy = "{" \
+            "    class Level0 { fun base(n) { return n + 1; } }" \
+            "    class Level1 > Level0 { fun one() { return 1; } }" \
+            "    class Level2 > Level1 { fun two() { return 2; } }" \
+            "    class Level3 > Level2 { fun three() { return 3; } }" \
+            "    class Level4 > Level3 { fun four() { return 4; } }" \
+            "    class Level5 > Level4 { fun five() { return 5; } }" \
+            "    var leaf = Level5();" \
+            "    var i = 0;" \
+            "    var total = 0;" \
+            "    var method = nil;" \
+            "    while (i < 20000)" \
+            "    {" \
+            "        method = leaf.base;" \
+            "        method = leaf.one;" \
+            "        method = leaf.two;" \
+            "        total = method() + total;" \
+            "        i = i + 1;" \
+            "    }" \
+            "    print total;" \
+            "}"
+
+records = "{" \
+          "    class Record" \
+          "    {" \
+          "        fun __init__(value, next)" \
+          "        {" \
+          "            this.value = value;" \
+          "            this.label = \"record\";" \
+          "            this.next = next;" \
+          "        }" \
+          "    }" \
+          "    var head = nil;" \
+          "    var i = 0;" \
+          "    while (i < 20000)" \
+          "    {" \
+          "        head = Record(i, head);" \
+          "        i = i + 1;" \
+          "    }" \
+          "    var total = 0;" \
+          "    while (head != nil)" \
+          "    {" \
+          "        total = total + head.value;" \
+          "        head = head.next;" \
+          "    }" \
+          "    print total;" \
+          "}"
+
+deep_recursion = "{" \
+                 "    fun depth(n)" \
+                 "    {" \
+                 "        if (n <= 0)" \
+                 "        {" \
+                 "            return 0;" \
+                 "        }" \
+                 "        return depth(n - 1) + 1;" \
+                 "    }" \
+                 "    print depth(5000);" \
+                 "}"
+
+programs = {"fibonacci": fibonacci, "loop": loop, "closures": closures, "classes": classes}
+
+
+def time_program(program, engine, repeat=3, **options):
+    best = None
+    for i in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            plox.run_program(program, engine=engine, **options)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(program, engine):
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        plox.run_program(program, engine=engine)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def benchmark_operators():
+    print("%-12s %12s %12s" % ("program", "tree (s)", "vm (s)"))
+    print("%-12s %12.4f %12.4f" % ("arithmetic", time_program(arithmetic, plox.ENGINE_TREE),
+                                   time_program(arithmetic, plox.ENGINE_VM)))
+
+
+def benchmark_control_flow():
+    print("%-12s %12s" % ("program", "tree (s)"))
+    for name, program in (("fibonacci", fibonacci), ("closures", closures), ("breaks", breaks)):
+        print("%-12s %12.4f" % (name, time_program(program, plox.ENGINE_TREE)))
+
+
+def benchmark_optimizer():
+    print("%-12s %12s %12s %12s" % ("engine", "-O0 (s)", "-O2 (s)", "speedup"))
+    for engine in plox.engines:
+        plain = time_program(constants, engine)
+        optimized = time_program(constants, engine, optimize=plox_optimizer.OPTIMIZE_PRUNE)
+        print("%-12s %12.4f %12.4f %11.1fx" % (engine, plain, optimized, plain / optimized))
+
+
+def benchmark_methods():
+    print("%-12s %12s %12s" % ("program", "tree (s)", "vm (s)"))
+    print("%-12s %12.4f %12.4f" % ("hierarchy", time_program(hierarchy, plox.ENGINE_TREE),
+                                   time_program(hierarchy, plox.ENGINE_VM)))
+
+
+def benchmark_objects():
+    print("%-12s %12s %12s %12s" % ("engine", "time (s)", "peak (KB)", "per object"))
+    for engine in plox.engines:
+        peak = peak_memory(records, engine)
+        print("%-12s %12.4f %12d %11dB" % (engine, time_program(records, engine), peak // 1024, peak // 20000))
+
+
+def benchmark_stack():
+    print("%-12s %12s %12s %10s" % ("program", "tree (s)", "stack (s)", "slowdown"))
+    for name, program in programs.items():
+        tree_time = time_program(program, plox.ENGINE_TREE)
+        stack_time = time_program(program, plox.ENGINE_STACK)
+        print("%-12s %12.4f %12.4f %9.1fx" % (name, tree_time, stack_time, stack_time / tree_time))
+    print("%-12s %12s %12.4f" % ("recursion", "-", time_program(deep_recursion, plox.ENGINE_STACK)))
+
+
+def time_test_programs(engine, repeat=3):
+    # Runs the TestPrograms suite with its run_program bound to the engine, the tests' own asserts still apply
+    import tests
+    run_program = tests.run_program
+    tests.run_program = functools.partial(plox.run_program, engine=engine)
+    best = None
+    try:
+        for i in range(repeat):
+            suite = unittest.defaultTestLoader.loadTestsFromTestCase(tests.TestPrograms)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                suite.run(unittest.TestResult())
+                elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        tests.run_program = run_program
+    return best
+
+
+def benchmark_closures():
+    print("%-12s %12s %12s %10s" % ("program", "tree (s)", "closure (s)", "speedup"))
+    timings = [(name, time_program(program, plox.ENGINE_TREE), time_program(program, plox.ENGINE_CLOSURE))
+               for name, program in programs.items()]
+    timings.append(("tests.py", time_test_programs(plox.ENGINE_TREE), time_test_programs(plox.ENGINE_CLOSURE)))
+    for name, tree_time, closure_time in timings:
+        print("%-12s %12.4f %12.4f %9.1fx" % (name, tree_time, closure_time, tree_time / closure_time))
+
+
+def benchmark_quickening():
+    # Generic keeps recording type feedback but never reaches the threshold, so no node is specialised
+    print("%-12s %12s %12s %10s" % ("program", "generic (s)", "quick (s)", "speedup"))
+    threshold = plox_operators.QUICKEN_THRESHOLD
+    for name, program in list(programs.items()) + [("arithmetic", arithmetic)]:
+        plox_operators.QUICKEN_THRESHOLD = sys.maxsize
+        try:
+            generic_time = time_program(program, plox.ENGINE_TREE)
+        finally:
+            plox_operators.QUICKEN_THRESHOLD = threshold
+        quick_time = time_program(program, plox.ENGINE_TREE)
+        print("%-12s %12.4f %12.4f %9.1fx" % (name, generic_time, quick_time, generic_time / quick_time))
+
+
+def benchmark_transpiler():
+    print("%-12s %12s %12s %10s" % ("program", "tree (s)", "python (s)", "speedup"))
+    for name, program in programs.items():
+        tree_time = time_program(program, plox.ENGINE_TREE)
+        python_time = time_program(program, plox.ENGINE_PYTHON)
+        print("%-12s %12.4f %12.4f %9.1fx" % (name, tree_time, python_time, tree_time / python_time))
+
+
+def benchmark_engines():
+    print("%-12s %12s %12s %10s" % ("program", "tree (s)", "vm (s)", "speedup"))
+    for name, program in programs.items():
+        tree_time = time_program(program, plox.ENGINE_TREE)
+        vm_time = time_program(program, plox.ENGINE_VM)
+        print("%-12s %12.4f %12.4f %9.1fx" % (name, tree_time, vm_time, tree_time / vm_time))
+
+
+def generate_source(size):
+    # Concatenates the benchmark programs until the source is at least size characters long
+    parts = []
+    length = 0
+    while length < size:
+        for program in programs.values():
+            parts.append(program)
+            parts.append("\nprint \"multi line\nstring\";\n")
+            length += len(program) + 40
+    return "\n".join(parts)
+
+
+def time_scanner(source, fast, repeat=3):
+    scanner = plox_scanner.Scanner()
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        scanner.scan(source, fast=fast)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, [(t.type, t.literal, t.line) for t in scanner.get_scanned_tokens()]
+
+
+def benchmark_scanner():
+    source = generate_source(500000)
+    slow_time, slow_tokens = time_scanner(source, False)
+    fast_time, fast_tokens = time_scanner(source, True)
+    print("%d characters, %d tokens, identical streams: %s" % (len(source), len(fast_tokens),
+                                                               slow_tokens == fast_tokens))
+    print("%-12s %12s %12s %10s" % ("scanner", "chars (s)", "regex (s)", "speedup"))
+    print("%-12s %12.4f %12.4f %9.1fx" % ("source", slow_time, fast_time, slow_time / fast_time))
+
+
+def measure_tokens(source, buffer, repeat=3):
+    # Returns the memory held by the scanned tokens and the best times taken to scan and parse them
+    scanner = plox_scanner.Scanner()
+    parser = plox_parser.Parser()
+    tracemalloc.start()
+    scanner.scan(source, fast=True, buffer=buffer)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    scan_time = parse_time = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        scanner.scan(source, fast=True, buffer=buffer)
+        middle = time.perf_counter()
+        parser.parse(scanner.get_scanned_tokens())
+        end = time.perf_counter()
+        scan_time = middle - start if scan_time is None else min(scan_time, middle - start)
+        parse_time = end - middle if parse_time is None else min(parse_time, end - middle)
+    return memory, scan_time, parse_time
+
+
+def benchmark_tokens():
+    source = generate_source(500000)
+    print("%-12s %12s %12s %12s %12s" % ("tokens", "memory (KB)", "scan (s)", "parse (s)", "total (s)"))
+    for name, buffer in (("list", False), ("buffer", True)):
+        memory, scan_time, parse_time = measure_tokens(source, buffer)
+        print("%-12s %12d %12.4f %12.4f %12.4f" % (name, memory // 1024, scan_time, parse_time,
+                                                   scan_time + parse_time))
+
+
+def benchmark_ast():
+    source = generate_source(500000)
+    scanner = plox_scanner.Scanner()
+    parser = plox_parser.Parser()
+    scanner.scan(source, fast=True)
+    tracemalloc.start()
+    parser.parse(scanner.get_scanned_tokens())
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%d statements parsed from %d characters hold %d KB" % (len(parser.get_parsed_statements()),
+                                                                  len(source), memory // 1024))
+
+
+def benchmark_cache():
+    source = generate_source(500000)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = plox_cache.ProgramCache(directory)
+        start = time.perf_counter()
+        statements = plox.analyse_program(source, fast_scan=True)
+        cold_time = time.perf_counter() - start
+        cache.store(source, statements)
+        start = time.perf_counter()
+        cache.load(source)
+        warm_time = time.perf_counter() - start
+    print("%-12s %12s %12s %10s" % ("startup", "cold (s)", "warm (s)", "speedup"))
+    print("%-12s %12.4f %12.4f %9.1fx" % ("source", cold_time, warm_time, cold_time / warm_time))
+
+
+benchmarks = {"engines": benchmark_engines, "operators": benchmark_operators,
+              "control": benchmark_control_flow, "optimizer": benchmark_optimizer,
+              "methods": benchmark_methods, "objects": benchmark_objects, "stack": benchmark_stack,
+              "closures": benchmark_closures, "transpiler": benchmark_transpiler,
+              "quickening": benchmark_quickening,
+              "scanner": benchmark_scanner, "tokens": benchmark_tokens, "ast": benchmark_ast,
+              "cache": benchmark_cache}
+
+
+if __name__ == '__main__':
+    selected = sys.argv[1:] if len(sys.argv) > 1 else benchmarks.keys()
+    for benchmark in selected:
+        print("== " + benchmark)
+        benchmarks[benchmark]()
@@ -12,6 +12,14 @@ ast_defines = {'Binary': ['left_expr', 'operator', 'right_expr'],
                'Get': ["object", "field_name", "line"], 'Set': ['object', 'field_name', 'right_side', 'line'],
                'ThisStmt': ["token"], 'Construct': ["line"], 'SuperCall': ['token']}
 
+# Members filled in after construction rather than passed to the constructor, e.g. the operation
+# handler the Parser binds to an operator or the scope depth and slot the Resolver found for a variable.
+ast_annotations = {'Binary': ['operation', 'specialised', 'left_type', 'right_type', 'feedback'], 'Unary': ['operation'], 'Idnt': ['depth', 'slot'], 'Assign': ['depth', 'slot'], 'ThisStmt': ['depth', 'slot'],
+                   'SuperCall': ['depth', 'slot', 'this'], 'Dclr': ['captured'],
+                   'FuncDclr': ['captured', 'captured_parameters', 'upvalues'], 'ClassDclr': ['captured'],
+                   'Get': ['cached_class', 'cached_method', 'cached_shape', 'cached_index'],
+                   'Set': ['cached_shape', 'cached_index', 'cached_transition'], 'ReturnStmt': ['tail_call']}
+
 def write_line(file_name, line, indentation=0):
     for i in range(indentation):
         file_name.write('    ')
@@ -25,11 +33,16 @@ def write_ast_class(output_file, ast_type):
     for m in members:
         arguments += m + ', '
     arguments = arguments[:-2]
+    slots = members + ast_annotations.get(ast_type, [])
     write_line(output_file, 'class ' + ast_type + ':')
+    slot_names = ', '.join("'" + slot + "'" for slot in slots)
+    write_line(output_file, '__slots__ = (' + slot_names + (',)' if len(slots) == 1 else ')'), 1)
+    output_file.write('\n')
     write_line(output_file, 'def __init__(self, ' + arguments + '):', 1)
     for member in members:
         write_line(output_file, 'self.'+member+' = ' + member, 2)
-    write_line(output_file, 'self.type = ' + 'Type_' + ast_type, 2)
+    for annotation in ast_annotations.get(ast_type, []):
+        write_line(output_file, 'self.' + annotation + ' = None', 2)
     output_file.write('\n')
     write_line(output_file, 'def accept(self, visitor): ', 1)
     write_line(output_file, 'val = visitor.visit_' + str(ast_type) + '(self)', 2)
@@ -1,37 +1,172 @@
+import io
+import os
 import sys
+import mmap
+import time
+import signal
+import argparse
+import multiprocessing
 import plox_scanner
 import plox_parser
 import plox_interpreter
 import plox_resolver
+import plox_optimizer
+import plox_vm
+import plox_stack
+import plox_closures
+import plox_transpiler
+import plox_profiler
+import plox_sampler
+import plox_cache
 import plox_utilities as utilities
 
+ENGINE_TREE = "tree"
+ENGINE_VM = "vm"
+ENGINE_STACK = "stack"
+ENGINE_CLOSURE = "closure"
+ENGINE_PYTHON = "python"
+engines = [ENGINE_TREE, ENGINE_VM, ENGINE_STACK, ENGINE_CLOSURE, ENGINE_PYTHON]
+profiled_engines = [ENGINE_TREE, ENGINE_CLOSURE, ENGINE_PYTHON]  # Engines whose calls go through PloxFunction
 
-def run_program(program, console=False):
-    scanner = plox_scanner.Scanner()
-    parser = plox_parser.Parser()
-    resolver = plox_resolver.Resolver()
-    interpreter = plox_interpreter.Interpreter(console_mode=console)
-    scanner.scan(program)
-    if scanner.error_occurred():
-        print("Unable to interpret program. Invalid symbols detected.")
-        return
-    parser.parse(scanner.get_scanned_tokens())
-    if parser.error_occurred():
-        print("Unable to interpret program. Syntax errors detected.")
-        return
-    resolver.resolve(interpreter, parser.get_parsed_statements())
-    if resolver.error_occurred():
-        print("Runtime errors have occurred. Aborting program execution.")
-    interpreter.interpret(parser.get_parsed_statements())
-
-
-def command_line():
+EXIT_SUCCESS = 0
+EXIT_PROGRAM_ERROR = 1
+EXIT_FILE_ERROR = 2
+
+# Sources at least this large are decoded straight from a memory map instead of being read into a buffer first
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+BATCH_EXTENSION = ".lox"
+BATCH_OK = "ok"
+BATCH_ERROR = "error"
+BATCH_TIMEOUT = "timeout"
+BATCH_UNREADABLE = "unreadable"
+batch_statuses = [BATCH_OK, BATCH_ERROR, BATCH_TIMEOUT, BATCH_UNREADABLE]
+
+
+def create_interpreter(engine, console=False, max_call_depth=plox_stack.MAX_CALL_DEPTH, output=None):
+    if engine == ENGINE_VM:
+        return plox_vm.VM(console_mode=console, output=output)
+    if engine == ENGINE_STACK:
+        interpreter = plox_stack.StackInterpreter(console_mode=console, output=output)
+        interpreter.max_call_depth = max_call_depth
+        return interpreter
+    if engine == ENGINE_CLOSURE:
+        return plox_closures.ClosureInterpreter(console_mode=console, output=output)
+    if engine == ENGINE_PYTHON:
+        return plox_transpiler.TranspiledInterpreter(console_mode=console, output=output)
+    return plox_interpreter.Interpreter(console_mode=console, output=output)
+
+
+def record_phase(timings, phase, start):
+    # Adds the time since start to phase when timings are being collected, returns the start of the next phase
+    now = time.perf_counter()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + now - start
+    return now
+
+
+def report_timings(timings):
+    for phase, seconds in timings.items():
+        print("%-12s %10.4f s" % (phase, seconds), file=sys.stderr)
+    print("%-12s %10.4f s" % ("total", sum(timings.values())), file=sys.stderr)
+
+
+class PloxContext:
+    '''
+    An independent session with its own scanner, parser, optimizer, resolver and interpreter. Globals
+    declared by one program stay visible to the next program run in the same context. Contexts
+    share no state, so separate contexts can run on separate threads at the same time. output is
+    the stream programs and errors print to, None prints to sys.stdout.
+    '''
+
+    def __init__(self, engine=ENGINE_TREE, console=False, output=None, max_call_depth=plox_stack.MAX_CALL_DEPTH):
+        self.engine = engine
+        self.console = console
+        self.max_call_depth = max_call_depth
+        self.output = output
+        self.scanner = plox_scanner.Scanner(output)
+        self.parser = plox_parser.Parser(output)
+        self.optimizer = plox_optimizer.Optimizer()
+        self.resolver = plox_resolver.Resolver(output)
+        self.interpreter = create_interpreter(engine, console, max_call_depth, output)
+
+    def reset(self):
+        # Forgets the globals of the programs run so far, the other stages are kept as they are
+        self.interpreter = create_interpreter(self.engine, self.console, self.max_call_depth, self.output)
+
+    def analyse(self, program, fast_scan=False, stream=False, token_buffer=False, timings=None,
+                optimize=plox_optimizer.OPTIMIZE_NONE):
+        # Scans, parses, optimizes and resolves program, returning its statements or None when an error was reported
+        scanner = self.scanner
+        parser = self.parser
+        start = time.perf_counter()
+        if stream:
+            parser.parse(scanner.tokenize(program, fast=fast_scan))
+            start = record_phase(timings, "scan+parse", start)
+        else:
+            scanner.scan(program, fast=fast_scan, buffer=token_buffer)
+            start = record_phase(timings, "scan", start)
+            if not scanner.error_occurred():
+                parser.parse(scanner.get_scanned_tokens())
+                start = record_phase(timings, "parse", start)
+        if scanner.error_occurred():
+            print("Unable to interpret program. Invalid symbols detected.", file=self.output)
+            return None
+        if parser.error_occurred():
+            print("Unable to interpret program. Syntax errors detected.", file=self.output)
+            return None
+        statements = self.optimizer.optimize(parser.get_parsed_statements(), optimize)
+        start = record_phase(timings, "optimize", start)
+        self.resolver.resolve(statements)
+        record_phase(timings, "resolve", start)
+        if self.resolver.error_occurred():
+            print("Runtime errors have occurred. Aborting program execution.", file=self.output)
+            return None
+        return statements
+
+    def run(self, program, fast_scan=False, stream=False, token_buffer=False, cache_dir=None, cold=False,
+            timings=None, optimize=plox_optimizer.OPTIMIZE_NONE):
+        # Returns True when the program ran without reporting an error
+        cache = plox_cache.ProgramCache(cache_dir) if cache_dir is not None and isinstance(program, str) else None
+        statements = None
+        if cache is not None and not cold:
+            start = time.perf_counter()
+            statements = cache.load(program, optimize)
+            record_phase(timings, "cache load", start)
+        if statements is None:
+            statements = self.analyse(program, fast_scan, stream, token_buffer, timings, optimize)
+            if statements is None:
+                return False
+            if cache is not None:
+                start = time.perf_counter()
+                cache.store(program, statements, optimize)
+                record_phase(timings, "cache store", start)
+        start = time.perf_counter()
+        self.interpreter.interpret(statements)
+        record_phase(timings, "interpret", start)
+        return not self.interpreter.error_occurred()
+
+
+def analyse_program(program, fast_scan=False, stream=False, token_buffer=False, timings=None,
+                    optimize=plox_optimizer.OPTIMIZE_NONE):
+    return PloxContext().analyse(program, fast_scan, stream, token_buffer, timings, optimize)
+
+
+def run_program(program, console=False, engine=ENGINE_TREE, fast_scan=False, stream=False, token_buffer=False,
+                cache_dir=None, cold=False, timings=None, optimize=plox_optimizer.OPTIMIZE_NONE,
+                max_call_depth=plox_stack.MAX_CALL_DEPTH, output=None):
+    # Runs program in a new context of its own, returns True when it ran without reporting an error
+    context = PloxContext(engine, console, output, max_call_depth)
+    return context.run(program, fast_scan, stream, token_buffer, cache_dir, cold, timings, optimize)
+
+
+def command_line(engine=ENGINE_TREE):
     print("WELCOME TO THE PLOX CONSOLE")
     print(" ")
     src_in = ""
     scanner = plox_scanner.Scanner()
     parser = plox_parser.Parser()
-    interpreter = plox_interpreter.Interpreter(console_mode=True)
+    interpreter = create_interpreter(engine, console=True)
 
     while True:
         try:
@@ -49,15 +184,223 @@ def command_line():
             utilities.report_error(se)
 
 
-def interpret_source(source):
+def read_source(path):
+    # One bulk read, or a memory map for very large files, with newlines translated as text mode would
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    source = str(view, "utf-8")
+        else:
+            source = f.read().decode("utf-8")
+    if "\r" in source:
+        source = source.replace("\r\n", "\n").replace("\r", "\n")
+    return source
+
+
+def interpret_source(source, engine=ENGINE_TREE, fast_scan=False, stream=False, token_buffer=False,
+                     cache_dir=None, cold=False, show_timings=False, optimize=plox_optimizer.OPTIMIZE_NONE,
+                     max_call_depth=plox_stack.MAX_CALL_DEPTH, profile=False, profile_json=None, sample=None,
+                     sample_interval=plox_sampler.SAMPLE_INTERVAL):
+    # Runs the program in the file source and returns the process exit status
+    timings = {} if show_timings else None
+    profiler = plox_profiler.Profiler() if profile or profile_json is not None else None
+    sampler = plox_sampler.SamplingProfiler(sample_interval) if sample is not None else None
+    start = time.perf_counter()
+    try:
+        program = read_source(source)
+    except (OSError, UnicodeDecodeError) as e:
+        print("plox: can't read file '%s': %s" % (source, e), file=sys.stderr)
+        return EXIT_FILE_ERROR
+    record_phase(timings, "read", start)
+    if profiler is not None:
+        profiler.start()
+    if sampler is not None:
+        sampler.start()
+    try:
+        succeeded = run_program(program, engine=engine, fast_scan=fast_scan, stream=stream,
+                                token_buffer=token_buffer, cache_dir=cache_dir, cold=cold, timings=timings,
+                                optimize=optimize, max_call_depth=max_call_depth)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if sampler is not None:
+            sampler.stop()
+    if show_timings:
+        report_timings(timings)
+    if profile:
+        profiler.report()
+    if profile_json is not None:
+        try:
+            profiler.write_json(profile_json)
+        except OSError as e:
+            print("plox: can't write profile '%s': %s" % (profile_json, e), file=sys.stderr)
+            return EXIT_FILE_ERROR
+    if sample is not None:
+        try:
+            with open(sample, "w") as f:
+                sampler.write_collapsed(f)
+        except OSError as e:
+            print("plox: can't write samples '%s': %s" % (sample, e), file=sys.stderr)
+            return EXIT_FILE_ERROR
+    return EXIT_SUCCESS if succeeded else EXIT_PROGRAM_ERROR
+
+
+def dump_python(source, fast_scan=False, optimize=plox_optimizer.OPTIMIZE_NONE):
+    # Prints the Python source the python engine would run for the program in the file source
+    try:
+        program = read_source(source)
+    except (OSError, UnicodeDecodeError) as e:
+        print("plox: can't read file '%s': %s" % (source, e), file=sys.stderr)
+        return EXIT_FILE_ERROR
+    statements = PloxContext().analyse(program, fast_scan, optimize=optimize)
+    if statements is None:
+        return EXIT_PROGRAM_ERROR
+    try:
+        print(plox_transpiler.Transpiler().transpile(statements).source, end="")
+    except plox_interpreter.PloxRuntimeError as e:
+        utilities.report_error(e)
+        return EXIT_PROGRAM_ERROR
+    return EXIT_SUCCESS
+
+
+class ScriptTimeout(BaseException):
+    # Not an Exception, so the interpreters' own error handling lets it unwind the whole script
     pass
 
 
+batch_context = None  # The context a batch worker process reuses for every script it runs
+batch_options = None
+
+
+def raise_script_timeout(signum, frame):
+    raise ScriptTimeout()
+
+
+def start_batch_worker(engine, max_call_depth, options):
+    global batch_context, batch_options
+    batch_context = PloxContext(engine, output=io.StringIO(), max_call_depth=max_call_depth)
+    batch_options = options
+    if hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, raise_script_timeout)
+
+
+def run_batch_script(task):
+    # Runs one script in the worker's context, returns (path, status, seconds, captured output)
+    path, timeout = task
+    output = batch_context.output
+    output.seek(0)
+    output.truncate()
+    batch_context.reset()
+    start = time.perf_counter()
+    try:
+        program = read_source(path)
+    except (OSError, UnicodeDecodeError) as e:
+        return path, BATCH_UNREADABLE, 0.0, "plox: can't read file '%s': %s\n" % (path, e)
+    timed = timeout is not None and hasattr(signal, "setitimer")
+    try:
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        status = BATCH_OK if batch_context.run(program, **batch_options) else BATCH_ERROR
+        if timed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except ScriptTimeout:
+        status = BATCH_TIMEOUT
+        print("plox: timed out after %g s" % timeout, file=output)
+    return path, status, time.perf_counter() - start, output.getvalue()
+
+
+def batch_scripts(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(BATCH_EXTENSION))
+
+
+def run_batch(directory, jobs=None, engine=ENGINE_TREE, timeout=None, max_call_depth=plox_stack.MAX_CALL_DEPTH,
+              **options):
+    '''
+    Runs every .lox script in directory on a pool of jobs worker processes, all cores by default.
+    Each worker keeps one context warm and resets its globals between scripts, so scripts don't
+    see each other. options are passed on to PloxContext.run. Returns a (path, status, seconds,
+    output) tuple per script in name order, a script still running after timeout seconds is
+    abandoned with BATCH_TIMEOUT.
+    '''
+    scripts = batch_scripts(directory)
+    jobs = jobs or os.cpu_count()
+    chunk_size = max(1, len(scripts) // (jobs * 4))
+    with multiprocessing.Pool(jobs, start_batch_worker, (engine, max_call_depth, options)) as pool:
+        return list(pool.imap(run_batch_script, [(path, timeout) for path in scripts], chunk_size))
+
+
+def report_batch(results, elapsed, output=None):
+    for path, status, seconds, script_output in results:
+        print("== %s: %s in %.4f s" % (path, status, seconds), file=output)
+        print(script_output, end="", file=output)
+    counts = ", ".join("%d %s" % (len([r for r in results if r[1] == status]), status) for status in batch_statuses)
+    print("%d scripts (%s) in %.4f s, %.4f s spent in scripts" % (len(results), counts, elapsed,
+                                                                  sum(r[2] for r in results)), file=output)
+
+
+def interpret_batch(directory, jobs=None, engine=ENGINE_TREE, timeout=None, max_call_depth=plox_stack.MAX_CALL_DEPTH,
+                    **options):
+    # Runs and reports on every script in directory, returns the process exit status
+    start = time.perf_counter()
+    try:
+        results = run_batch(directory, jobs, engine, timeout, max_call_depth, **options)
+    except OSError as e:
+        print("plox: can't read directory '%s': %s" % (directory, e), file=sys.stderr)
+        return EXIT_FILE_ERROR
+    report_batch(results, time.perf_counter() - start)
+    return EXIT_SUCCESS if all(result[1] == BATCH_OK for result in results) else EXIT_PROGRAM_ERROR
+
+
+def parse_arguments(argv):
+    arg_parser = argparse.ArgumentParser(prog="plox", description="Plox interpreter")
+    arg_parser.add_argument("source", nargs="?", help="Lox source file, starts the console when omitted")
+    arg_parser.add_argument("--engine", choices=engines, default=ENGINE_TREE,
+                            help="tree walking interpreter, bytecode virtual machine, explicit stack tree walker, "
+                                 "syntax trees compiled to Python closures or programs transpiled to Python source")
+    arg_parser.add_argument("--fast-scan", action="store_true", help="scan the source with the regex scanner")
+    arg_parser.add_argument("--stream", action="store_true", help="parse tokens as they are scanned")
+    arg_parser.add_argument("--token-buffer", action="store_true", help="store scanned tokens in compact arrays")
+    arg_parser.add_argument("--cache-dir", help="directory of .ploxc files holding already resolved programs")
+    arg_parser.add_argument("--cold", action="store_true", help="ignore cached programs and refresh the cache")
+    arg_parser.add_argument("--timings", action="store_true", help="report the time spent in each phase on stderr")
+    arg_parser.add_argument("-O", "--optimize", type=int, choices=plox_optimizer.optimization_levels,
+                            default=plox_optimizer.OPTIMIZE_NONE,
+                            help="1 folds constant expressions, 2 also removes branches that can never run")
+    arg_parser.add_argument("--max-call-depth", type=int, default=plox_stack.MAX_CALL_DEPTH,
+                            help="nested calls the stack engine allows before reporting a stack overflow")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="report calls and time spent in each Lox function on stderr")
+    arg_parser.add_argument("--profile-json", metavar="PATH", help="write the --profile figures to PATH as JSON")
+    arg_parser.add_argument("--sample", metavar="PATH",
+                            help="sample the Lox call stack while running and write collapsed stacks to PATH")
+    arg_parser.add_argument("--sample-interval", type=float, default=plox_sampler.SAMPLE_INTERVAL,
+                            help="seconds between --sample samples")
+    arg_parser.add_argument("--dump-python", action="store_true",
+                            help="print the Python source the python engine runs instead of running the program")
+    arg_parser.add_argument("--batch", metavar="DIRECTORY", help="run every .lox script in DIRECTORY in parallel")
+    arg_parser.add_argument("--jobs", type=int, help="worker processes for --batch, all cores by default")
+    arg_parser.add_argument("--timeout", type=float, help="seconds each --batch script may run")
+    arguments = arg_parser.parse_args(argv)
+    if (arguments.profile or arguments.profile_json is not None) and arguments.engine not in profiled_engines:
+        arg_parser.error("--profile needs one of the engines %s" % ", ".join(profiled_engines))
+    return arguments
+
+
 if __name__ == '__main__':
-    if len(sys.argv) == 1:
-        command_line()
+    arguments = parse_arguments(sys.argv[1:])
+    if arguments.batch is not None:
+        sys.exit(interpret_batch(arguments.batch, arguments.jobs, arguments.engine, arguments.timeout,
+                                 arguments.max_call_depth, fast_scan=arguments.fast_scan, stream=arguments.stream,
+                                 token_buffer=arguments.token_buffer, cache_dir=arguments.cache_dir,
+                                 cold=arguments.cold, optimize=arguments.optimize))
+    elif arguments.source is None:
+        command_line(arguments.engine)
+    elif arguments.dump_python:
+        sys.exit(dump_python(arguments.source, arguments.fast_scan, arguments.optimize))
 
     else:
-        source = sys.argv[1]
-        interpret_source(source)
-
+        sys.exit(interpret_source(arguments.source, arguments.engine, arguments.fast_scan, arguments.stream,
+                                  arguments.token_buffer, arguments.cache_dir, arguments.cold, arguments.timings,
+                                  arguments.optimize, arguments.max_call_depth, arguments.profile,
+                                  arguments.profile_json, arguments.sample, arguments.sample_interval))
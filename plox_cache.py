@@ -0,0 +1,63 @@
+import gc
+import os
+import sys
+import pickle
+import threading
+import hashlib
+
+# Bump whenever the syntax trees or the annotations the Resolver leaves on them change,
+# so that programs cached by an older interpreter are parsed again.
+CACHE_VERSION = 7
+CACHE_EXTENSION = ".ploxc"
+
+collector_lock = threading.Lock()
+
+
+class ProgramCache:
+    '''
+    Stores resolved programs in a directory, one .ploxc file per source text and optimization
+    level. Entries are keyed by a hash of the source, the optimization level, the cache version
+    and the Python version, so a changed script or interpreter simply misses.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, source, optimize=0):
+        digest = hashlib.sha256()
+        digest.update(("%d:%d.%d:%d:" % (CACHE_VERSION, sys.version_info[0], sys.version_info[1],
+                                         optimize)).encode())
+        digest.update(source.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def path(self, source, optimize=0):
+        return os.path.join(self.directory, self.key(source, optimize) + CACHE_EXTENSION)
+
+    def load(self, source, optimize=0):
+        # Returns the cached statements of source, or None when there is no usable entry
+        with collector_lock:  # Loads on other threads would otherwise see the collector already disabled
+            collecting = gc.isenabled()
+            gc.disable()  # Unpickling creates nothing but live nodes, collections in between are wasted
+            try:
+                with open(self.path(source, optimize), "rb") as f:
+                    key, statements = pickle.load(f)
+            except Exception:
+                return None  # A truncated or stale entry is treated as a miss and rewritten
+            finally:
+                if collecting:
+                    gc.enable()
+        return statements if key == self.key(source, optimize) else None
+
+    def store(self, source, statements, optimize=0):
+        # Caching is best effort, the program still runs when its entry can't be written
+        path = self.path(source, optimize)
+        temporary_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary_path, "wb") as f:
+                pickle.dump((self.key(source, optimize), statements), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+        except (OSError, RecursionError, pickle.PicklingError):
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            return False
+        return True
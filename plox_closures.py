@@ -0,0 +1,372 @@
+import plox_syntax_trees as syntax_trees
+from plox_interpreter import *
+
+
+class ClosureCompiler:
+    '''
+    Turns resolved syntax trees into nested Python closures, one per node, each taking the
+    Environment it runs in. Everything a node decides on every visit in the Interpreter, which
+    handler an operator uses, where a variable lives or whether an operand is a constant, is
+    decided once here and bound into the closure, so running a program is plain function calls.
+    Expressions return their value, statements return a completion signal like the Interpreter's.
+    '''
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def compile(self, syntax):
+        return syntax.accept(self)
+
+    def compile_arguments(self, expressions):
+        # Calls with few arguments skip building the list in a loop
+        arguments = [self.compile(expr) for expr in expressions]
+        if len(arguments) == 0:
+            return lambda env: []
+        if len(arguments) == 1:
+            first, = arguments
+            return lambda env: [first(env)]
+        if len(arguments) == 2:
+            first, second = arguments
+            return lambda env: [first(env), second(env)]
+        return lambda env: [argument(env) for argument in arguments]
+
+    def compile_variable(self, depth, slot, name, line):
+        if depth == GLOBAL:
+            def global_variable(env):
+                try:
+                    return env.globals[slot]
+                except KeyError:
+                    raise PloxRuntimeError("Implicit declaration of identifier %s." % name, line)
+            return global_variable
+        if depth == UPVALUE:
+            return lambda env: env.upvalues[slot].value
+        index = -1 - depth
+
+        def local_variable(env):
+            value = env.scopes[index][slot]
+            return value.value if type(value) is Cell else value
+        return local_variable
+
+    def compile_function_body(self, block):
+        stmts = tuple(self.compile(stmt) for stmt in block.stmts)
+
+        def function_body(env, call_args):
+            scopes = env.scopes
+            scopes.append([arg for param, arg in call_args])
+            try:
+                for stmt in stmts:
+                    signal = stmt(env)
+                    if signal is not None:
+                        return signal
+            finally:
+                scopes.pop()
+            return None
+        return function_body
+
+    def define(self, env, name, value, line):
+        try:
+            env.add(name, value)
+        except PloxRuntimeError as e:
+            raise PloxRuntimeError(e.message, line)
+
+    def visit_Literal(self, ltrl):
+        value = ltrl.literal.get_value()
+        return lambda env: value
+
+    def visit_Grouping(self, grouping):
+        return self.compile(grouping.expr)
+
+    def visit_Idnt(self, idnt):
+        return self.compile_variable(idnt.depth, idnt.slot, idnt.identifier.get_value(), idnt.identifier.line)
+
+    def visit_ThisStmt(self, this):
+        return self.compile_variable(this.depth, this.slot, "this", this.token.line)
+
+    def visit_SuperCall(self, spr):
+        return self.compile_variable(spr.depth, spr.slot, "super", spr.token.line)
+
+    def visit_Binary(self, binary):
+        operation = binary.operation
+        operator = binary.operator
+        left = self.compile(binary.left_expr)
+        if type(binary.right_expr) is syntax_trees.Literal:
+            constant = binary.right_expr.literal.get_value()
+            return lambda env: operation(left(env), constant, operator)
+        right = self.compile(binary.right_expr)
+        return lambda env: operation(left(env), right(env), operator)
+
+    def visit_Unary(self, unary):
+        operation = unary.operation
+        operator = unary.operator
+        expr = self.compile(unary.expr)
+        return lambda env: operation(expr(env), operator)
+
+    def visit_Assign(self, assign):
+        right_side = self.compile(assign.right_side)
+        slot = assign.slot
+        if assign.depth == GLOBAL:
+            def assign_global(env):
+                value = env.globals[slot] = right_side(env)
+                return value
+            return assign_global
+        if assign.depth == UPVALUE:
+            def assign_upvalue(env):
+                value = env.upvalues[slot].value = right_side(env)
+                return value
+            return assign_upvalue
+        index = -1 - assign.depth
+
+        def assign_local(env):
+            value = right_side(env)
+            scope = env.scopes[index]
+            if type(scope[slot]) is Cell:
+                scope[slot].value = value
+            else:
+                scope[slot] = value
+            return value
+        return assign_local
+
+    def visit_Call(self, call):
+        interpreter = self.interpreter
+        callee = self.compile(call.callee)
+        arguments = self.compile_arguments(call.arguments)
+        line = call.line
+
+        def call_callee(env):
+            try:
+                function = callee(env)
+            except Exception:
+                raise PloxRuntimeError("Implicit declaration of function %s." % str(call.callee), line)
+            if not callable(function):
+                raise PloxRuntimeError("Attempting to call a non-callable object .", line)
+            return function(interpreter, arguments(env))
+        return call_callee
+
+    def visit_Get(self, get):
+        interpreter = self.interpreter
+        object_value = self.compile(get.object)
+        line = get.line
+        if type(get.object) is syntax_trees.SuperCall:
+            this = self.compile(get.object.this)
+            field_name = get.field_name
+
+            def get_super(env):
+                super_class = object_value(env)
+                if not isinstance(super_class, PloxClass):
+                    return interpreter.get_property(get, super_class)
+                try:
+                    method = super_class.get_method(field_name)
+                except Exception:
+                    raise PloxRuntimeError("Class %s has no such method %s" % (str(super_class), field_name), line)
+                return BoundMethod(this(env), method)
+            return get_super
+
+        def get_property(env):
+            try:
+                object = object_value(env)
+            except Exception:
+                raise PloxRuntimeError("Accessing unknown object", line)
+            return interpreter.get_property(get, object)
+        return get_property
+
+    def visit_Set(self, set):
+        interpreter = self.interpreter
+        right_side = self.compile(set.right_side)
+        object_value = self.compile(set.object)
+        line = set.line
+
+        def set_property(env):
+            value = right_side(env)
+            try:
+                object = object_value(env)
+            except Exception:
+                raise PloxRuntimeError("Attempting to set unknown object", line)
+            interpreter.set_property(set, object, value)
+        return set_property
+
+    def visit_ExprStmt(self, exprstmt):
+        interpreter = self.interpreter
+        expr = self.compile(exprstmt.expr)
+        if interpreter._console_mode:
+            def console_expression(env):
+                interpreter.console_print(expr(env))
+            return console_expression
+
+        def expression(env):
+            expr(env)
+        return expression
+
+    def visit_PrintStmt(self, prnt):
+        interpreter = self.interpreter
+        expr = self.compile(prnt.expr)
+
+        def print_value(env):
+            print(str(expr(env)), file=interpreter.output)
+        return print_value
+
+    def visit_Dclr(self, dclr):
+        name = dclr.var_name
+        captured = dclr.captured
+        line = dclr.line
+        assign_expr = None if dclr.assign_expr is None else self.compile(dclr.assign_expr)
+
+        def declare(env):
+            self.define(env, name, Cell(None) if captured else None, line)
+            if assign_expr is not None:
+                assign_expr(env)  # The Assign stores the value into the new slot
+        return declare
+
+    def visit_Block(self, blk):
+        stmts = tuple(self.compile(stmt) for stmt in blk.stmts)
+
+        def block(env):
+            scopes = env.scopes
+            scopes.append([])
+            try:
+                for stmt in stmts:
+                    signal = stmt(env)
+                    if signal is not None:
+                        return signal
+            finally:
+                scopes.pop()
+            return None
+        return block
+
+    def visit_IfStmt(self, ifstmt):
+        condition = self.compile(ifstmt.expr)
+        if_block = self.compile(ifstmt.if_block)
+        else_block = None if ifstmt.else_block is None else self.compile(ifstmt.else_block)
+
+        def if_statement(env):
+            value = condition(env)
+            if not (value is None or value == 0.0 or value is False):
+                return if_block(env)
+            if else_block is not None:
+                return else_block(env)
+            return None
+        return if_statement
+
+    def visit_WhileStmt(self, whilestmt):
+        condition = self.compile(whilestmt.expr)
+        while_block = self.compile(whilestmt.while_block)
+
+        def while_statement(env):
+            while True:
+                value = condition(env)
+                if value is None or value == 0.0 or value is False:
+                    return None
+                signal = while_block(env)
+                if signal is not None:
+                    return None if signal is BREAK else signal
+        return while_statement
+
+    def visit_ReturnStmt(self, rtrn):
+        interpreter = self.interpreter
+        if rtrn.ret_val is None:
+            def return_nothing(env):
+                interpreter.return_value = None
+                return RETURN
+            return return_nothing
+        ret_val = self.compile(rtrn.ret_val)
+        if not rtrn.tail_call or rtrn.ret_val.callee.depth is None:
+            def return_value(env):
+                interpreter.return_value = ret_val(env)
+                return RETURN
+            return return_value
+        callee = rtrn.ret_val.callee
+        depth, slot = callee.depth, callee.slot
+        lookup = self.compile_variable(depth, slot, callee.identifier.get_value(), callee.identifier.line)
+        arguments = self.compile_arguments(rtrn.ret_val.arguments)
+
+        def tail_return(env):
+            function = env.function
+            if function is not None and (depth != GLOBAL or slot in env.globals) and lookup(env) is function:
+                interpreter.tail_call_arguments = arguments(env)
+                return TAIL_CALL
+            interpreter.return_value = ret_val(env)
+            return RETURN
+        return tail_return
+
+    def visit_BrkStmt(self, bstmt):
+        return lambda env: BREAK
+
+    def visit_FuncDclr(self, f_dclr):
+        handle = f_dclr.handle
+        body = self.compile_function_body(f_dclr.body)
+        parameters = f_dclr.parameters
+        captured_parameters = f_dclr.captured_parameters
+        upvalues = f_dclr.upvalues
+        line = f_dclr.line
+        captured = f_dclr.captured
+
+        def declare_function(env):
+            cell = None
+            if captured:  # The cell goes in first so the function can capture itself
+                cell = Cell(None)
+                self.define(env, handle, cell, line)
+            function = PloxFunction(handle, body, env.capture_upvalues(upvalues), parameters, captured_parameters,
+                                    line)
+            if cell is None:
+                self.define(env, handle, function, line)
+            else:
+                cell.value = function
+        return declare_function
+
+    def visit_ClassDclr(self, clsdclr):
+        class_name = clsdclr.class_name
+        super_value = None if clsdclr.super is None else self.compile(clsdclr.super)
+        methods = [(method.handle, self.compile_function_body(method.body), method.parameters,
+                    method.captured_parameters, method.upvalues, method.line) for method in clsdclr.methods]
+        line = clsdclr.line
+        captured = clsdclr.captured
+
+        def declare_class(env):
+            super_class = None
+            if super_value is not None:
+                super_class = super_value(env)
+                if not isinstance(super_class, PloxClass):
+                    raise PloxRuntimeError("Inheriting from something other than another class.", line)
+            cell = None
+            if captured:
+                cell = Cell(None)
+                self.define(env, class_name, cell, line)
+            class_methods = {} if super_class is None else dict(super_class.methods)
+            for handle, body, parameters, captured_parameters, upvalues, method_line in methods:
+                this = Cell(None)
+                env.scopes.append([this, Cell(super_class)])
+                try:
+                    class_method = PloxFunction(handle, body, env.capture_upvalues(upvalues), parameters,
+                                                captured_parameters, method_line)
+                finally:
+                    env.scopes.pop()
+                for index, upvalue in enumerate(class_method.upvalues):
+                    if upvalue is this:
+                        class_method.this_upvalue = index
+                class_methods[handle] = class_method
+            new_class = PloxClass(class_name, class_methods, super_class, line)
+            if cell is None:
+                self.define(env, class_name, new_class, line)
+            else:
+                cell.value = new_class
+        return declare_class
+
+
+class ClosureInterpreter(Interpreter):
+    '''
+    Runs programs compiled by the ClosureCompiler. PloxFunctions made here hold a compiled body
+    in place of their Block, everything else, environments, classes, instances and errors, is
+    shared with the Interpreter.
+    '''
+
+    def __init__(self, console_mode=False, output=None):
+        super().__init__(console_mode, output)
+        self.compiler = ClosureCompiler(self)
+
+    def execute(self, stmt):
+        return self.compiler.compile(stmt)(self.environments[0])
+
+    def evaluate(self, expr):
+        return self.compiler.compile(expr)(self.environments[-1])
+
+    def execute_function_body(self, func_body, call_args, upvalues, function=None):
+        return func_body(Environment(self.environments[0], upvalues, function), call_args)
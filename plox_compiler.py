@@ -0,0 +1,445 @@
+from array import array
+import plox_scanner as scanner
+import plox_syntax_trees as syntax_trees
+
+OP_CONSTANT = 0
+OP_NIL = 1
+OP_POP = 2
+OP_GET_LOCAL = 3
+OP_SET_LOCAL = 4
+OP_GET_GLOBAL = 5
+OP_DEFINE_GLOBAL = 6
+OP_SET_GLOBAL = 7
+OP_GET_UPVALUE = 8
+OP_SET_UPVALUE = 9
+OP_GET_PROPERTY = 10
+OP_SET_PROPERTY = 11
+OP_GET_SUPER = 12
+OP_EQUAL = 13
+OP_GREATER = 14
+OP_GREATER_EQUAL = 15
+OP_LESS = 16
+OP_LESS_EQUAL = 17
+OP_ADD = 18
+OP_SUBTRACT = 19
+OP_MULTIPLY = 20
+OP_DIVIDE = 21
+OP_NOT = 22
+OP_NEGATE = 23
+OP_PRINT = 24
+OP_PRINT_RESULT = 25
+OP_JUMP = 26
+OP_JUMP_IF_FALSE = 27
+OP_LOOP = 28
+OP_CALL = 29
+OP_CLOSURE = 30
+OP_CLOSE_UPVALUE = 31
+OP_RETURN = 32
+OP_CLASS = 33
+OP_METHOD = 34
+OP_ERROR = 35
+
+TYPE_SCRIPT = 0
+TYPE_FUNCTION = 1
+TYPE_METHOD = 2
+TYPE_INITIALIZER = 3
+
+binary_opcodes = {scanner.ADD: OP_ADD, scanner.MINUS: OP_SUBTRACT, scanner.STAR: OP_MULTIPLY,
+                  scanner.DIV: OP_DIVIDE, scanner.GREATER_THAN: OP_GREATER,
+                  scanner.GREATER_THAN_EQUALS: OP_GREATER_EQUAL, scanner.LESS_THAN: OP_LESS,
+                  scanner.LESS_THAN_EQUALS: OP_LESS_EQUAL, scanner.EQUALS: OP_EQUAL}
+
+
+class Chunk:
+    def __init__(self):
+        self.code = array('l')
+        self.lines = array('l')
+        self.constants = []
+        self.constant_indices = {}
+
+    def write(self, value, line):
+        self.code.append(value)
+        self.lines.append(line)
+
+    def add_constant(self, value):
+        if isinstance(value, CompiledFunction):
+            self.constants.append(value)
+            return len(self.constants) - 1
+        key = (type(value), value)  # Keeps 1.0 and True in separate slots
+        if key not in self.constant_indices:
+            self.constant_indices[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_indices[key]
+
+
+class CompiledFunction:
+    def __init__(self, name, function_type, line=0):
+        self.name = name
+        self.function_type = function_type
+        self.line = line
+        self.arity = 0
+        self.upvalue_count = 0
+        self.chunk = Chunk()
+
+    def __str__(self):
+        return "<fn " + self.name + ">"
+
+
+class Local:
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.captured = False
+
+
+class FunctionState:
+    def __init__(self, enclosing, function, receiver_name=""):
+        self.enclosing = enclosing
+        self.function = function
+        # Slot 0 holds the callee, or the receiver ("this") for methods
+        self.locals = [Local(receiver_name, 0)]
+        self.upvalues = []
+        self.loops = []
+        self.scope_depth = 0
+
+
+class Loop:
+    def __init__(self, scope_depth):
+        self.scope_depth = scope_depth
+        self.breaks = []
+
+
+class Compiler:
+
+    def __init__(self):
+        self.state = None
+        self.console_mode = False
+        self.line = 0
+
+    def compile(self, stmt, console_mode=False):
+        '''
+        Each top level statement is lowered into its own script function so that a
+        runtime error only abandons the statement it occurred in, like the Interpreter.
+        '''
+        self.console_mode = console_mode
+        self.line = 0
+        self.state = FunctionState(None, CompiledFunction("script", TYPE_SCRIPT))
+        self._compile(stmt)
+        self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+        function = self.state.function
+        self.state = None
+        return function
+
+    def _compile(self, syntax):
+        syntax.accept(self)
+
+    def current_chunk(self):
+        return self.state.function.chunk
+
+    def emit(self, *values):
+        chunk = self.current_chunk()
+        for value in values:
+            chunk.write(value, self.line)
+
+    def emit_constant(self, value):
+        self.emit(OP_CONSTANT, self.current_chunk().add_constant(value))
+
+    def emit_error(self, message, line):
+        self.line = line
+        self.emit(OP_ERROR, self.current_chunk().add_constant(message))
+
+    def emit_jump(self, op):
+        self.emit(op, 0)
+        return len(self.current_chunk().code) - 1
+
+    def patch_jump(self, offset):
+        code = self.current_chunk().code
+        code[offset] = len(code) - offset - 1
+
+    def emit_loop(self, loop_start):
+        self.emit(OP_LOOP, 0)
+        code = self.current_chunk().code
+        code[-1] = len(code) - 1 - loop_start
+
+    def name_constant(self, name):
+        return self.current_chunk().add_constant(name)
+
+    def begin_scope(self):
+        self.state.scope_depth += 1
+
+    def end_scope(self):
+        state = self.state
+        state.scope_depth -= 1
+        while len(state.locals) > 0 and state.locals[-1].depth > state.scope_depth:
+            self.emit(OP_CLOSE_UPVALUE if state.locals[-1].captured else OP_POP)
+            state.locals.pop()
+
+    def discard_locals(self, depth):
+        # Pops the locals deeper than depth without forgetting them, used when jumping out of scopes
+        for local in reversed(self.state.locals):
+            if local.depth <= depth:
+                break
+            self.emit(OP_CLOSE_UPVALUE if local.captured else OP_POP)
+
+    def resolve_local(self, state, name):
+        for i in range(len(state.locals) - 1, -1, -1):
+            if state.locals[i].name == name:
+                return i
+        return -1
+
+    def add_upvalue(self, state, index, is_local):
+        for i, upvalue in enumerate(state.upvalues):
+            if upvalue == (is_local, index):
+                return i
+        state.upvalues.append((is_local, index))
+        state.function.upvalue_count = len(state.upvalues)
+        return len(state.upvalues) - 1
+
+    def resolve_upvalue(self, state, name):
+        if state.enclosing is None:
+            return -1
+        local = self.resolve_local(state.enclosing, name)
+        if local != -1:
+            state.enclosing.locals[local].captured = True
+            return self.add_upvalue(state, local, True)
+        upvalue = self.resolve_upvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self.add_upvalue(state, upvalue, False)
+        return -1
+
+    def declare_variable(self, name, line):
+        # Returns True when name is a new local of the current scope, False for globals
+        state = self.state
+        if state.scope_depth == 0:
+            return False
+        for local in reversed(state.locals):
+            if local.depth < state.scope_depth:
+                break
+            if local.name == name:
+                self.emit_error("Redeclaration of variable %s" % name, line)
+                break
+        state.locals.append(Local(name, state.scope_depth))
+        return True
+
+    def define_variable(self, name, is_local):
+        if not is_local:
+            self.emit(OP_DEFINE_GLOBAL, self.name_constant(name))
+
+    def named_variable(self, name, get):
+        state = self.state
+        slot = self.resolve_local(state, name)
+        if slot != -1:
+            self.emit(OP_GET_LOCAL if get else OP_SET_LOCAL, slot)
+            return
+        slot = self.resolve_upvalue(state, name)
+        if slot != -1:
+            self.emit(OP_GET_UPVALUE if get else OP_SET_UPVALUE, slot)
+            return
+        self.emit(OP_GET_GLOBAL if get else OP_SET_GLOBAL, self.name_constant(name))
+
+    def function(self, f_dclr, function_type):
+        receiver = "this" if function_type in (TYPE_METHOD, TYPE_INITIALIZER) else ""
+        function = CompiledFunction(f_dclr.handle, function_type, f_dclr.line)
+        function.arity = len(f_dclr.parameters)
+        self.state = FunctionState(self.state, function, receiver)
+        self.begin_scope()
+        for param in f_dclr.parameters:
+            self.declare_variable(param, f_dclr.line)
+        for stmt in f_dclr.body.stmts:
+            self._compile(stmt)
+        self.emit_return()
+        state = self.state
+        self.state = state.enclosing
+        self.line = f_dclr.line
+        self.emit(OP_CLOSURE, self.current_chunk().add_constant(function))
+        for is_local, index in state.upvalues:
+            self.emit(1 if is_local else 0, index)
+
+    def emit_return(self):
+        if self.state.function.function_type == TYPE_INITIALIZER:
+            self.emit(OP_GET_LOCAL, 0)  # Constructors always hand back the new instance
+        else:
+            self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+
+    def visit_ExprStmt(self, exprstmt):
+        self._compile(exprstmt.expr)
+        self.emit(OP_PRINT_RESULT if self.console_mode else OP_POP)
+
+    def visit_PrintStmt(self, printstmt):
+        self._compile(printstmt.expr)
+        self.emit(OP_PRINT)
+
+    def visit_Dclr(self, dclr):
+        self.line = dclr.line
+        is_local = self.declare_variable(dclr.var_name, dclr.line)
+        if dclr.assign_expr is not None:
+            self._compile(dclr.assign_expr.right_side)
+        else:
+            self.emit(OP_NIL)
+        self.line = dclr.line
+        self.define_variable(dclr.var_name, is_local)
+
+    def visit_FuncDclr(self, f_dclr):
+        self.line = f_dclr.line
+        is_local = self.declare_variable(f_dclr.handle, f_dclr.line)
+        self.function(f_dclr, TYPE_FUNCTION)
+        self.define_variable(f_dclr.handle, is_local)
+
+    def visit_ClassDclr(self, clsdclr):
+        self.line = clsdclr.line
+        if clsdclr.super is not None:
+            self._compile(clsdclr.super)
+        self.line = clsdclr.line
+        self.emit(OP_CLASS, self.name_constant(clsdclr.class_name), 1 if clsdclr.super is not None else 0)
+        is_local = self.declare_variable(clsdclr.class_name, clsdclr.line)
+        self.define_variable(clsdclr.class_name, is_local)
+
+        if clsdclr.super is not None:
+            self.begin_scope()
+            self._compile(clsdclr.super)
+            self.state.locals.append(Local("super", self.state.scope_depth))
+
+        self.named_variable(clsdclr.class_name, True)
+        for method in clsdclr.methods:
+            function_type = TYPE_INITIALIZER if method.handle == "__init__" else TYPE_METHOD
+            self.function(method, function_type)
+            self.emit(OP_METHOD, self.name_constant(method.handle))
+        self.emit(OP_POP)
+
+        if clsdclr.super is not None:
+            self.end_scope()
+
+    def visit_Block(self, block):
+        self.begin_scope()
+        for stmt in block.stmts:
+            self._compile(stmt)
+        self.end_scope()
+
+    def visit_IfStmt(self, ifstmt):
+        self._compile(ifstmt.expr)
+        else_jump = self.emit_jump(OP_JUMP_IF_FALSE)
+        self._compile(ifstmt.if_block)
+        if ifstmt.else_block is not None:
+            end_jump = self.emit_jump(OP_JUMP)
+            self.patch_jump(else_jump)
+            self._compile(ifstmt.else_block)
+            self.patch_jump(end_jump)
+        else:
+            self.patch_jump(else_jump)
+
+    def visit_WhileStmt(self, whilestmt):
+        loop_start = len(self.current_chunk().code)
+        self._compile(whilestmt.expr)
+        exit_jump = self.emit_jump(OP_JUMP_IF_FALSE)
+        loop = Loop(self.state.scope_depth)
+        self.state.loops.append(loop)
+        self._compile(whilestmt.while_block)
+        self.state.loops.pop()
+        self.emit_loop(loop_start)
+        self.patch_jump(exit_jump)
+        for break_jump in loop.breaks:
+            self.patch_jump(break_jump)
+
+    def visit_BrkStmt(self, brk):
+        if len(self.state.loops) == 0:
+            self.emit_error("Break must be called within a loop context.", brk.line)
+            return
+        loop = self.state.loops[-1]
+        self.line = brk.line
+        self.discard_locals(loop.scope_depth)
+        loop.breaks.append(self.emit_jump(OP_JUMP))
+
+    def visit_ReturnStmt(self, ret_stmt):
+        self.line = ret_stmt.line
+        if self.state.function.function_type == TYPE_INITIALIZER:
+            if ret_stmt.ret_val is not None:
+                self._compile(ret_stmt.ret_val)
+                self.emit(OP_POP)
+            self.emit_return()
+            return
+        if ret_stmt.ret_val is not None:
+            self._compile(ret_stmt.ret_val)
+        else:
+            self.emit(OP_NIL)
+        self.emit(OP_RETURN)
+
+    def visit_Binary(self, binary):
+        self._compile(binary.left_expr)
+        self._compile(binary.right_expr)
+        self.line = binary.operator.line
+        operator = binary.operator.type
+        if operator in binary_opcodes:
+            self.emit(binary_opcodes[operator])
+        elif operator == scanner.NOT_EQUALS:
+            self.emit(OP_EQUAL)
+            self.emit(OP_NOT)
+        else:
+            self.emit_error(" " + binary.operator.literal + " unsupported operator", binary.operator.line)
+
+    def visit_Unary(self, unary):
+        self._compile(unary.expr)
+        self.line = unary.operator.line
+        if unary.operator.type == scanner.BANG:
+            self.emit(OP_NOT)
+        else:
+            self.emit(OP_NEGATE)
+
+    def visit_Grouping(self, grouping):
+        self._compile(grouping.expr)
+
+    def visit_Literal(self, literal):
+        self.line = literal.literal.line
+        self.emit_constant(literal.literal.get_value())
+
+    def visit_Idnt(self, idnt):
+        self.line = idnt.identifier.line
+        name = idnt.identifier.get_value()
+        if idnt.depth is None:
+            self.emit_error("Implicit declaration of identifier %s." % name, idnt.identifier.line)
+            return
+        self.named_variable(name, True)
+
+    def visit_Assign(self, assign):
+        self._compile(assign.right_side)
+        self.line = assign.line
+        if assign.depth is None:
+            self.emit_error("Implicit declaration of variable %s." % assign.var_name, assign.line)
+            return
+        self.named_variable(assign.var_name, False)
+
+    def visit_Call(self, call):
+        self._compile(call.callee)
+        for argument in call.arguments:
+            self._compile(argument)
+        self.line = call.line
+        self.emit(OP_CALL, len(call.arguments))
+
+    def visit_Get(self, get):
+        if isinstance(get.object, syntax_trees.SuperCall):
+            self.named_variable("this", True)
+            self._compile(get.object)
+            self.line = get.line
+            self.emit(OP_GET_SUPER, self.name_constant(get.field_name))
+            return
+        self._compile(get.object)
+        self.line = get.line
+        self.emit(OP_GET_PROPERTY, self.name_constant(get.field_name))
+
+    def visit_Set(self, set):
+        self._compile(set.right_side)
+        self._compile(set.object)
+        self.line = set.line
+        self.emit(OP_SET_PROPERTY, self.name_constant(set.field_name))
+
+    def visit_ThisStmt(self, this):
+        self.line = this.token.line
+        self.named_variable("this", True)
+
+    def visit_SuperCall(self, spr):
+        self.line = spr.token.line
+        self.named_variable("super", True)
+
+    def visit_Construct(self, construct):
+        self.emit_error("Explicit invocation of a constructor is not allowed.", construct.line)
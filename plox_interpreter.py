@@ -1,15 +1,51 @@
 import plox_scanner as scanner
+import plox_operators as operators
 import plox_syntax_trees as syntax_trees
 import plox_utilities as utilties
 
-GLOBAL = 1
+GLOBAL = -1  # Scope depth of identifiers resolved to the global scope, their slot is the name
+UPVALUE = -2  # Scope depth of variables a closure captured, their slot indexes the closure's upvalues
+
+# Completion signals statements return to unwind to the enclosing loop or call, None means carry on
+BREAK = 1
+RETURN = 2  # The returned value is left in Interpreter.return_value
+TAIL_CALL = 3  # The running function returned a call to itself, the arguments are left in
+               # Interpreter.tail_call_arguments
+
+
+class Shape:
+    '''
+    The layout shared by every instance that had the same fields set in the same order. slots maps
+    a field name to its index in the instance's values, adding a field moves the instance along a
+    transition to the next shape so instances built alike end up sharing one shape.
+    '''
+    __slots__ = ('slots', 'transitions')
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.transitions = {}
+
+    def add_field(self, field_name):
+        shape = self.transitions.get(field_name)
+        if shape is None:
+            slots = dict(self.slots)
+            slots[field_name] = len(slots)
+            shape = self.transitions[field_name] = Shape(slots)
+        return shape
 
 
 class PloxClass:
-    def __init__(self, name, methods, super_class=None):
+    '''
+    methods holds every method the class responds to, inherited ones included, so a lookup is a
+    single dict access however deep the hierarchy. The table never changes once the class exists.
+    Instances start out with the class's empty root shape.
+    '''
+    def __init__(self, name, methods, super_class=None, line=0):
         self.name = name
         self.methods = methods
         self.super_class = super_class
+        self.shape = Shape({})
+        self.line = line  # Where the class was declared
 
     def __call__(self, interpreter, args=[]):
 
@@ -25,71 +61,125 @@ class PloxClass:
         return self.name
 
     def get_method(self, method_name):
-        if method_name in self.methods:
-            return self.methods[method_name]
-        return self.super_class.get_method(method_name)
+        return self.methods[method_name]
 
 
 class PloxInstance:
+    __slots__ = ('class_type', 'shape', 'values')
+
     def __init__(self, cls):
         self.class_type = cls
-        self.fields = {}
+        self.shape = cls.shape
+        self.values = []
 
     def __str__(self):
-        return str(self.class_type())
+        return self.class_type.name + " instance"
 
     def bind(self, method):
-        method.bind_class_method(self)
-        return method
+        return BoundMethod(self, method)
 
     def get(self, field_name):
-        if field_name in self.fields:
-            return self.fields[field_name]
+        index = self.shape.slots.get(field_name)
+        if index is not None:
+            return self.values[index]
         return self.bind(self.class_type.get_method(field_name))
 
     def set(self, field_name, value):
-        self.fields[field_name] = value
+        index = self.shape.slots.get(field_name)
+        if index is None:
+            self.shape = self.shape.add_field(field_name)
+            self.values.append(value)
+        else:
+            self.values[index] = value
 
 
 
 class PloxFunction:
 
-    def __init__(self, name, block_stmt, closure, parameter_names=[]):
+    def __init__(self, name, block_stmt, upvalues, parameter_names=[], captured_parameters=None, line=0):
         self.function_body = block_stmt
         self.parameter_names = parameter_names
         self.callable_name = name
-        self.closure = closure
+        self.upvalues = upvalues
+        self.captured_parameters = captured_parameters if captured_parameters and any(captured_parameters) else None
+        self.this_upvalue = None  # Index of the upvalue a class method reaches "this" through
+        self.line = line  # Where the function was declared
 
     def arity(self):
         return len(self.parameter_names)
 
-    def __call__(self, interpreter, args=[]):
+    def __call__(self, interpreter, args=[], upvalues=None):
         ret_val = None
-        if len(args) != self.arity():
-            raise PloxRuntimeError("Function %s expects %d arguments but %d given." % (self.callable_name,
-                                                                                       len(self.parameter_names),
-                                                                                       len(args)))
-        try:
-            interpreter.execute_function_body(self.function_body, zip(self.parameter_names, args), self.closure)
-        except Return as ret:
-            ret_val = ret.value
+        # Only plain calls can be rerun for a tail call, a bound method's "this" isn't passed again
+        function = self if upvalues is None else None
+        upvalues = self.upvalues if upvalues is None else upvalues
+        while True:
+            if len(args) != self.arity():
+                raise PloxRuntimeError("Function %s expects %d arguments but %d given." % (self.callable_name,
+                                                                                           len(self.parameter_names),
+                                                                                           len(args)))
+            if self.captured_parameters is not None:
+                args = [Cell(arg) if captured else arg for arg, captured in zip(args, self.captured_parameters)]
+            signal = interpreter.execute_function_body(self.function_body, zip(self.parameter_names, args),
+                                                       upvalues, function)
+            if signal is not TAIL_CALL:
+                break
+            args = interpreter.tail_call_arguments
+            interpreter.tail_call_arguments = None
+        if signal is RETURN:
+            ret_val = interpreter.return_value
+            interpreter.return_value = None
+        elif signal is BREAK:
+            raise PloxRuntimeError("Break must be called within a loop context.")
         return ret_val
 
-    def bind_class_method(self, instance):
-        self.closure.bind_class_instance(instance)
+    def bind_upvalues(self, instance):
+        # The closure is shared by every instance, so a call gets its own copy with "this" filled in
+        if self.this_upvalue is None:
+            return self.upvalues
+        upvalues = list(self.upvalues)
+        upvalues[self.this_upvalue] = Cell(instance)
+        return upvalues
 
     def to_string(self):
         return "<fn " + self.name + ": " + len(self.parameter_names) + ">"
 
 
-class Environment:
+class BoundMethod:
+    __slots__ = ('instance', 'method')
+
+    def __init__(self, instance, method):
+        self.instance = instance
+        self.method = method
+
+    def __call__(self, interpreter, args=[]):
+        return self.method(interpreter, args, self.method.bind_upvalues(self.instance))
+
+
+class Cell:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
 
-    def __init__(self, base_environment=None):
-        self.scopes = [{}] if base_environment is None else base_environment.create_closure()
-        self.resolved_identifiers = {} if base_environment is None else base_environment.resolved_identifiers
+class Environment:
+    '''
+    Local scopes are lists indexed by the slot the Resolver assigned to each declaration,
+    identifier nodes carry the (depth, slot) pair counted from the innermost scope of the
+    running function. Variables that closures capture are kept in Cells shared between the
+    scope and the closures' upvalues, so a function only keeps alive what it references.
+    Globals stay keyed by name so they persist between programs run on the same interpreter.
+    '''
+
+    def __init__(self, base_environment=None, upvalues=(), function=None):
+        self.scopes = []
+        self.upvalues = upvalues
+        self.function = function  # The PloxFunction running in this environment when it can be tail called
+        self.globals = {} if base_environment is None else base_environment.globals
 
     def push_scope(self):
-        self.scopes.append({})
+        self.scopes.append([])
 
     def pop_scope(self):
         if len(self.scopes) == 0:
@@ -106,67 +196,53 @@ class Environment:
             # To add the function arguments to the local environment
             if len(param) > 0:
                 param_name, arg = param
-                self.add(param_name, arg)
+                self.scopes[-1].append(arg)
 
     def exit_block(self):
         self.pop_scope()
 
-    def resolve_identifier(self, expr, scope_depth):
-        self.resolved_identifiers[expr] = scope_depth
-
     def add(self, name, value):
-        if name in self.scopes[-1]:
-            raise PloxRuntimeError("Redeclaration of variable %s" % name)
-        self.scopes[-1][name] = value
-
-    def find(self, name):
-        c = None
-        i = 0
-        self.scopes.reverse()
-        for scope in self.scopes:
-            if name in scope:
-                c = scope
-                break
-            i += 1
-        self.scopes.reverse() # Put the list back to its original order
-        context_level = len(self.scopes) - i
-        return c, context_level
-
-    def get_at(self, context_level, name):
-        abs_context_level = len(self.scopes) - context_level - 1
-        return self.scopes[abs_context_level][name]
-
-    def set_at(self, context_level, name, value):
-        abs_context_level = len(self.scopes) - context_level - 1
-        self.scopes[abs_context_level][name] = value
+        if len(self.scopes) == 0:
+            if name in self.globals:
+                raise PloxRuntimeError("Redeclaration of variable %s" % name)
+            self.globals[name] = value
+            return
+        # Declarations run in the order the Resolver handed out slots, so the next slot is the end of the scope
+        self.scopes[-1].append(value)
+
+    def get_at(self, context_level, slot):
+        if context_level >= 0:
+            value = self.scopes[-1 - context_level][slot]
+            return value.value if type(value) is Cell else value
+        if context_level == UPVALUE:
+            return self.upvalues[slot].value
+        return self.globals[slot]
+
+    def set_at(self, context_level, slot, value):
+        if context_level >= 0:
+            scope = self.scopes[-1 - context_level]
+            if type(scope[slot]) is Cell:
+                scope[slot].value = value
+            else:
+                scope[slot] = value
+        elif context_level == UPVALUE:
+            self.upvalues[slot].value = value
+        else:
+            self.globals[slot] = value
 
     def assign(self, assign_expr, value):
-        if not isinstance(assign_expr, syntax_trees.Assign):
-            raise Exception("Expected Assignment Expression")
-        return self.set_at(self.resolved_identifiers[assign_expr], assign_expr.var_name, value)
+        self.set_at(assign_expr.depth, assign_expr.slot, value)
 
     def get_value(self, expr):
-        if isinstance(expr, syntax_trees.Idnt):
-            name = expr.identifier.get_value()
-        elif isinstance(expr, syntax_trees.ThisStmt):
-            name = "this"
-        elif isinstance(expr, syntax_trees.SuperCall):
-            name = "super"
-        else:
-            raise Exception("Invalid lookup value")
-        return self.get_at(self.resolved_identifiers[expr], name)
+        return self.get_at(expr.depth, expr.slot)
 
     def get_global_context(self):
-        return self.scopes[0]  # The first context in the stack is the global context
-
-    def create_closure(self):
-        closure = []
-        closure.extend(self.scopes)
-        return closure
+        return self.globals
 
-    def bind_class_instance(self, instance):
-        instance_context = {'this': instance, 'super': instance.class_type.super_class}
-        self.scopes.append(instance_context)
+    def capture_upvalues(self, descriptors):
+        # Collects the cells a new closure refers to, see Resolver.resolve_upvalue
+        return [self.upvalues[slot] if context_level == UPVALUE else self.scopes[-1 - context_level][slot]
+                for context_level, slot in descriptors]
 
 
 class PloxRuntimeError(utilties.PloxError):
@@ -177,33 +253,30 @@ class PloxRuntimeError(utilties.PloxError):
         return " Runtime Error: " + self.message
 
 
-class Return(Exception):
-    def __init__(self, ret_value):
-        self.value = ret_value
-
 
-class Break(Exception):
-    pass
-
-@utilties.singleton
 class Interpreter:
 
-    def __init__(self, console_mode=False):
+    def __init__(self, console_mode=False, output=None):
         super().__init__()
         self._console_mode = console_mode
+        self.output = output  # Stream the program prints to, None prints to sys.stdout
         self.environments = [Environment()]
+        self.return_value = None
+        self.tail_call_arguments = None
+        self.has_error = False
+
+    def error_occurred(self):
+        return self.has_error
 
     def interpret(self, statements):
+        self.has_error = False
         for stmt in statements:
             try:
-                self.execute(stmt)
+                if self.execute(stmt) is BREAK:
+                    raise PloxRuntimeError("Break must be called within a loop context.")
             except PloxRuntimeError as e:
-                utilties.report_error(e)
-            except Break:
-                raise PloxRuntimeError("Break must be called within a loop context.")
-
-    def resolve_identifier(self, expr, scope_level):
-        self.environments[-1].resolve_identifier(expr, scope_level)
+                utilties.report_error(e, self.output)
+                self.has_error = True
 
     def enter_function_call(self, function_closure):
         self.environments.append(function_closure)
@@ -211,10 +284,12 @@ class Interpreter:
     def exit_function_call(self):
         self.environments.pop()
 
-    def execute_function_body(self, func_body_block, call_args, function_env):
-        self.enter_function_call(function_env)
-        self.visit_Block(func_body_block, call_args)
-        self.exit_function_call()
+    def execute_function_body(self, func_body_block, call_args, upvalues, function=None):
+        self.enter_function_call(Environment(self.environments[-1], upvalues, function))
+        try:
+            return self.visit_Block(func_body_block, call_args)
+        finally:
+            self.exit_function_call()
 
     def is_true(self, value):
         if value is None:
@@ -229,56 +304,79 @@ class Interpreter:
         return expr.accept(self)
 
     def execute(self, stmt):
-        stmt.accept(self)
+        return stmt.accept(self)
 
     def console_print(self, result):
-        print("    Result: ")
-        print("            " + str(result))
-        print("")
+        print("    Result: ", file=self.output)
+        print("            " + str(result), file=self.output)
+        print("", file=self.output)
 
     def visit_Dclr(self, dclr):
         var_name = dclr.var_name
         try:
-            self.environments[-1].add(var_name, None)
+            self.environments[-1].add(var_name, Cell(None) if dclr.captured else None)
         except PloxRuntimeError as e:
             raise PloxRuntimeError(e.message, dclr.line)
         if dclr.assign_expr is not None:
-            value = self.evaluate(dclr.assign_expr)
-            try:
-                self.environments[-1].assign(dclr.assign_expr, value)
-            except Exception:
-                raise PloxRuntimeError("Redefinition of variable %s\n" % var_name, dclr.line)
+            self.evaluate(dclr.assign_expr)  # The Assign node stores the value into the new slot
 
-    def visit_FuncDclr(self, f_dclr):
-        function = PloxFunction(f_dclr.handle, f_dclr.body,
-                                Environment(self.environments[-1]), f_dclr.parameters)
+    def declare(self, name, captured, line):
+        # Captured declarations get their cell before the value exists so recursive closures can refer to it
+        if not captured:
+            return None
+        cell = Cell(None)
         try:
-            self.environments[-1].add(f_dclr.handle, function)
+            self.environments[-1].add(name, cell)
         except PloxRuntimeError as e:
-            raise PloxRuntimeError(e.message, f_dclr.line)
+            raise PloxRuntimeError(e.message, line)
+        return cell
 
-    def visit_ClassDclr(self, clsdclr):
-        methods = {}
-        for method in clsdclr.methods:
-            class_method = PloxFunction(method.handle, method.body,
-                                        Environment(self.environments[-1]), method.parameters)
-            methods[method.handle] = class_method
+    def define(self, name, value, cell, line):
+        if cell is not None:
+            cell.value = value
+            return
+        try:
+            self.environments[-1].add(name, value)
+        except PloxRuntimeError as e:
+            raise PloxRuntimeError(e.message, line)
+
+    def create_function(self, f_dclr):
+        return PloxFunction(f_dclr.handle, f_dclr.body, self.environments[-1].capture_upvalues(f_dclr.upvalues),
+                            f_dclr.parameters, f_dclr.captured_parameters, f_dclr.line)
+
+    def visit_FuncDclr(self, f_dclr):
+        cell = self.declare(f_dclr.handle, f_dclr.captured, f_dclr.line)
+        self.define(f_dclr.handle, self.create_function(f_dclr), cell, f_dclr.line)
 
+    def visit_ClassDclr(self, clsdclr):
         super_class = None
         if clsdclr.super is not None:
             super_class = self.evaluate(clsdclr.super)
             if not isinstance(super_class, PloxClass):
                 raise PloxRuntimeError("Inheriting from something other than another class.", clsdclr.line)
 
-        new_class = PloxClass(clsdclr.class_name, methods, super_class)
-        try:
-            self.environments[-1].add(clsdclr.class_name, new_class)
-        except PloxRuntimeError as e:
-            raise PloxRuntimeError(e.message, clsdclr.line)
+        cell = self.declare(clsdclr.class_name, clsdclr.captured, clsdclr.line)
+        environment = self.environments[-1]
+        methods = {} if super_class is None else dict(super_class.methods)
+        for method in clsdclr.methods:
+            # Methods close over a "this" and "super" scope, "this" is only a placeholder a bound call replaces
+            this = Cell(None)
+            environment.scopes.append([this, Cell(super_class)])
+            try:
+                class_method = self.create_function(method)
+            finally:
+                environment.scopes.pop()
+            for index, upvalue in enumerate(class_method.upvalues):
+                if upvalue is this:
+                    class_method.this_upvalue = index
+            methods[method.handle] = class_method
+
+        new_class = PloxClass(clsdclr.class_name, methods, super_class, clsdclr.line)
+        self.define(clsdclr.class_name, new_class, cell, clsdclr.line)
 
     def visit_PrintStmt(self, printstmt):
         expr_result = self.evaluate(printstmt.expr)
-        print(str(expr_result))
+        print(str(expr_result), file=self.output)
         return None
 
     def visit_ExprStmt(self, exprstmt):
@@ -288,89 +386,46 @@ class Interpreter:
         return None
 
     def visit_Block(self, block, func_call_args=[]):
-        self.environments[-1].enter_block(func_call_args)
-        excpt = None
+        environment = self.environments[-1]
+        environment.enter_block(func_call_args)
         try:
             for stmt in block.stmts:
-                self.execute(stmt)
-        except Exception as e:  # Need to make sure we pop the environment stack before exiting
-            excpt = e
-        self.environments[-1].exit_block()
-        if excpt is not None:
-            raise excpt
+                signal = stmt.accept(self)
+                if signal is not None:
+                    return signal
+        finally:  # Runtime errors still have to pop the scope before unwinding
+            environment.exit_block()
         return None
 
     def visit_IfStmt(self, ifstmt):
         if_expr_result = self.is_true(self.evaluate(ifstmt.expr))
         if if_expr_result is True:
-            self.execute(ifstmt.if_block)
+            return self.execute(ifstmt.if_block)
         elif ifstmt.else_block is not None:
-            self.execute(ifstmt.else_block)
+            return self.execute(ifstmt.else_block)
         return None
 
     def visit_WhileStmt(self, whilestmt):
         while_expr = self.is_true(self.evaluate(whilestmt.expr))
         while while_expr:
-            try:
-                self.execute(whilestmt.while_block)
-            except Break:
-                return
+            signal = self.execute(whilestmt.while_block)
+            if signal is not None:
+                return None if signal is BREAK else signal
             while_expr = self.is_true(self.evaluate(whilestmt.expr))
+        return None
 
     def visit_Binary(self, binary):
-        left_result = binary.left_expr.accept(self)
-        right_result = binary.right_expr.accept(self)
-
-        operator = binary.operator.type
-
-        if operator == scanner.ADD:
-            if isinstance(left_result, str):
-                return left_result + str(right_result)
-            elif isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result + right_result
-            elif isinstance(left_result, float) and isinstance(right_result, str):
-                return str(left_result) + right_result
-            else:
-                raise PloxRuntimeError(" + Operator: Expected NUMBER or STRING", binary.operator.line)
-        elif operator == scanner.MINUS:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result - right_result
-            else:
-                raise PloxRuntimeError(" - Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.STAR:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result * right_result
-            else:
-                raise PloxRuntimeError(" * Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.DIV:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result / right_result
-            else:
-                raise PloxRuntimeError(" / Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.GREATER_THAN:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result > right_result
-            else:
-                raise PloxRuntimeError(" > Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.LESS_THAN:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result < right_result
-            else:
-                raise PloxRuntimeError(" < Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.LESS_THAN_EQUALS:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result <= right_result
-            else:
-                raise PloxRuntimeError(" <= Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.GREATER_THAN_EQUALS:
-            if isinstance(left_result, float) and isinstance(right_result, float):
-                return left_result >= right_result
-            else:
-                raise PloxRuntimeError(" >= Operator: Expected NUMBER", binary.operator.line)
-        elif operator == scanner.EQUALS:
-            return left_result == right_result
-        else:
-            raise PloxRuntimeError(" " + binary.operator.literal + " unsupported operator", binary.operator.line)
+        left = binary.left_expr.accept(self)
+        right = binary.right_expr.accept(self)
+        # Quickened nodes call their specialised variant while the operand types match what they were chosen for
+        specialised = binary.specialised
+        if specialised is not None:
+            if type(left) is binary.left_type and type(right) is binary.right_type:
+                return specialised(left, right)
+            operators.deoptimise(binary)
+        elif binary.feedback != operators.GENERIC:
+            operators.record_feedback(binary, left, right)
+        return binary.operation(left, right, binary.operator)
 
     def visit_Grouping(self, grouping):
         return grouping.expr.accept(self)
@@ -387,17 +442,7 @@ class Interpreter:
         return value
 
     def visit_Unary(self, unary):
-        result = unary.expr.accept(self)
-        operator = unary.operator.type
-
-        if operator == scanner.BANG:
-            bool_result = self.is_true(result)
-            return not bool_result
-
-        elif operator == scanner.MINUS:
-            if not isinstance(result, float):
-                raise PloxRuntimeError(" Negation expects NUMBER", unary.operator.line)
-            return -result
+        return unary.operation(unary.expr.accept(self), unary.operator)
 
     def visit_Assign(self, assign):
         assign_value = self.evaluate(assign.right_side)
@@ -423,17 +468,36 @@ class Interpreter:
             object = self.evaluate(get.object)
         except Exception:
             raise PloxRuntimeError("Accessing unknown object", get.line)
-        if isinstance(object, PloxInstance):
-            try:
-                return object.get(get.field_name)
-            except Exception:
-                raise PloxRuntimeError("Object %s has no such field %s" % (str(object),
-                                                                          get.field_name), get.line)
+        return self.get_property(get, object)
+
+    def get_property(self, get, object):
+        if type(object) is PloxInstance:
+            shape = object.shape
+            if shape is get.cached_shape:
+                return object.values[get.cached_index]
+            index = shape.slots.get(get.field_name)
+            if index is not None:
+                get.cached_shape = shape
+                get.cached_index = index
+                return object.values[index]
+            # Inline cache, a class's method table never changes so a redefined class is a different key
+            class_type = object.class_type
+            if get.cached_class is not class_type:
+                try:
+                    get.cached_method = class_type.get_method(get.field_name)
+                except Exception:
+                    raise PloxRuntimeError("Object %s has no such field %s" % (str(object),
+                                                                              get.field_name), get.line)
+                get.cached_class = class_type
+            return object.bind(get.cached_method)
         elif isinstance(object, PloxClass):
             try:
-                return object.get_method(get.field_name)
+                method = object.get_method(get.field_name)
             except Exception:
                 raise PloxRuntimeError("Class %s has no such method %s" % (str(object), get.field_name), get.line)
+            if type(get.object) is syntax_trees.SuperCall:
+                return BoundMethod(self.evaluate(get.object.this), method)
+            return method
 
         raise PloxRuntimeError("Attempting to access something other than a class or object instance", get.line)
 
@@ -443,19 +507,47 @@ class Interpreter:
             object = self.evaluate(set.object)
         except Exception:
             raise PloxRuntimeError("Attempting to set unknown object", set.line)
+        self.set_property(set, object, set_value)
+
+    def set_property(self, set, object, set_value):
         if not isinstance(object, PloxInstance):
             raise PloxRuntimeError("Accessing something other than an object instance", set.line)
+        shape = object.shape
+        if shape is set.cached_shape:
+            if set.cached_transition is None:
+                object.values[set.cached_index] = set_value
+            else:  # The cached shape is missing the field, take the same transition as last time
+                object.values.append(set_value)
+                object.shape = set.cached_transition
+            return
         object.set(set.field_name, set_value)
+        set.cached_shape = shape
+        set.cached_index = object.shape.slots[set.field_name]
+        set.cached_transition = None if object.shape is shape else object.shape
         
 
     def visit_ReturnStmt(self, ret_stmt):
         ret_value = None
+        if ret_stmt.tail_call and self.is_tail_call(ret_stmt.ret_val):
+            self.tail_call_arguments = [self.evaluate(x) for x in ret_stmt.ret_val.arguments]
+            return TAIL_CALL
         if ret_stmt.ret_val is not None:
             ret_value = self.evaluate(ret_stmt.ret_val)
-        raise Return(ret_value)
+        self.return_value = ret_value
+        return RETURN
+
+    def is_tail_call(self, call):
+        # The callee is an identifier so looking it up has no side effects, anything else runs as an ordinary call
+        environment = self.environments[-1]
+        callee = call.callee
+        if environment.function is None or callee.depth is None:
+            return False
+        if callee.depth == GLOBAL and callee.slot not in environment.globals:
+            return False  # Left for the ordinary call to report
+        return environment.get_value(callee) is environment.function
 
     def visit_BrkStmt(self, brk):
-        raise Break()
+        return BREAK
 
     def visit_ThisStmt(self, this):
         return self.environments[-1].get_value(this)
@@ -0,0 +1,156 @@
+'''
+Operation handlers for Binary and Unary nodes. The parser binds each node to the handler of
+its operator, so evaluating an operator is a single call with the type checks that operator
+needs. Handlers are module level functions so that bound syntax trees can still be pickled.
+'''
+import operator as python_operator
+import plox_scanner as scanner
+import plox_interpreter as interpreter
+
+QUICKEN_THRESHOLD = 8  # Executions seeing the same operand types before a Binary node is specialised
+GENERIC = -1  # Binary.feedback of a node that stays on its generic handler
+
+
+def is_true(value):
+    return not (value is None or value == 0.0 or value is False)
+
+
+def add(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left + right
+    if type(left) is str:
+        return left + str(right)
+    if type(left) is float and type(right) is str:
+        return str(left) + right
+    raise interpreter.PloxRuntimeError(" + Operator: Expected NUMBER or STRING", operator.line)
+
+
+def subtract(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left - right
+    raise interpreter.PloxRuntimeError(" - Operator: Expected NUMBER", operator.line)
+
+
+def multiply(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left * right
+    raise interpreter.PloxRuntimeError(" * Operator: Expected NUMBER", operator.line)
+
+
+def divide(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left / right
+    raise interpreter.PloxRuntimeError(" / Operator: Expected NUMBER", operator.line)
+
+
+def greater(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left > right
+    raise interpreter.PloxRuntimeError(" > Operator: Expected NUMBER", operator.line)
+
+
+def less(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left < right
+    raise interpreter.PloxRuntimeError(" < Operator: Expected NUMBER", operator.line)
+
+
+def less_equal(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left <= right
+    raise interpreter.PloxRuntimeError(" <= Operator: Expected NUMBER", operator.line)
+
+
+def greater_equal(left, right, operator):
+    if type(left) is float and type(right) is float:
+        return left >= right
+    raise interpreter.PloxRuntimeError(" >= Operator: Expected NUMBER", operator.line)
+
+
+def equal(left, right, operator):
+    return left == right
+
+
+def not_equal(left, right, operator):
+    return left != right
+
+
+def unsupported(left, right, operator):
+    raise interpreter.PloxRuntimeError(" " + operator.literal + " unsupported operator", operator.line)
+
+
+def negate(value, operator):
+    if type(value) is not float:
+        raise interpreter.PloxRuntimeError(" Negation expects NUMBER", operator.line)
+    return -value
+
+
+def logical_not(value, operator):
+    return not is_true(value)
+
+
+binary_operations = {scanner.ADD: add, scanner.MINUS: subtract, scanner.STAR: multiply, scanner.DIV: divide,
+                     scanner.GREATER_THAN: greater, scanner.LESS_THAN: less,
+                     scanner.LESS_THAN_EQUALS: less_equal, scanner.GREATER_THAN_EQUALS: greater_equal,
+                     scanner.EQUALS: equal, scanner.NOT_EQUALS: not_equal}
+unary_operations = {scanner.BANG: logical_not, scanner.MINUS: negate}
+
+
+def binary_operation(operator):
+    return binary_operations.get(operator.type, unsupported)
+
+
+def unary_operation(operator):
+    return unary_operations[operator.type]
+
+
+# Specialised variants run without the operator's type checks, the Interpreter guards them with the
+# operand types the node observed instead. They are only valid for the exact types they were chosen for.
+
+def concatenate(left, right):
+    return left + str(right)
+
+
+def concatenate_number(left, right):
+    return str(left) + right
+
+
+number_specialisations = {add: python_operator.add, subtract: python_operator.sub, multiply: python_operator.mul,
+                          divide: python_operator.truediv, greater: python_operator.gt, less: python_operator.lt,
+                          greater_equal: python_operator.ge, less_equal: python_operator.le}
+
+
+def specialise(operation, left_type, right_type):
+    # Returns the fast variant of operation for these operand types, None when there is none
+    if operation is equal:
+        return python_operator.eq
+    if operation is not_equal:
+        return python_operator.ne
+    if left_type is float and right_type is float:
+        return number_specialisations.get(operation)
+    if operation is add:
+        if left_type is str:
+            return python_operator.add if right_type is str else concatenate
+        if left_type is float and right_type is str:
+            return concatenate_number
+    return None
+
+
+def record_feedback(binary, left, right):
+    # Counts executions of a generic Binary node with unchanged operand types and quickens it once they are stable
+    if type(left) is binary.left_type and type(right) is binary.right_type:
+        binary.feedback += 1
+        if binary.feedback >= QUICKEN_THRESHOLD:
+            binary.specialised = specialise(binary.operation, binary.left_type, binary.right_type)
+            if binary.specialised is None:
+                binary.feedback = GENERIC
+    else:
+        binary.left_type = type(left)
+        binary.right_type = type(right)
+        binary.feedback = 1
+
+
+def deoptimise(binary):
+    # A guard failed, the node goes back to its generic handler and is not specialised again
+    binary.specialised = None
+    binary.feedback = GENERIC
@@ -0,0 +1,161 @@
+import plox_scanner as scanner
+import plox_syntax_trees as syntax_trees
+import plox_operators as operators
+
+OPTIMIZE_NONE = 0
+OPTIMIZE_FOLD = 1  # Fold operators applied to literals into a single Literal
+OPTIMIZE_PRUNE = 2  # Also drop if branches and while loops whose condition is a literal that never runs them
+optimization_levels = [OPTIMIZE_NONE, OPTIMIZE_FOLD, OPTIMIZE_PRUNE]
+
+
+def literal_token_type(value):
+    if value is True:
+        return scanner.KEYWORD_TRUE
+    if value is False:
+        return scanner.KEYWORD_FALSE
+    return scanner.NUMBER if type(value) is float else scanner.STRING
+
+
+class Optimizer:
+    '''
+    Rewrites parsed statements before they are resolved. Visiting a node returns the node that
+    replaces it, statements return None when they can be removed. Folding evaluates operators
+    with the same handlers the Interpreter uses, so an operation that would fail at runtime is
+    left in place to report its error when it runs.
+    '''
+
+    def __init__(self):
+        self.level = OPTIMIZE_NONE
+
+    def optimize(self, statements, level=OPTIMIZE_PRUNE):
+        self.level = level
+        if level == OPTIMIZE_NONE:
+            return statements
+        return self.optimize_statements(statements)
+
+    def optimize_statements(self, stmts):
+        optimized = []
+        for stmt in stmts:
+            stmt = stmt.accept(self)
+            if stmt is not None:
+                optimized.append(stmt)
+        return optimized
+
+    def _optimize(self, syntax):
+        if syntax is None:
+            return None
+        return syntax.accept(self)
+
+    def fold(self, operation, operands, line):
+        try:
+            value = operation(*operands)
+        except Exception:
+            return None
+        return syntax_trees.Literal(scanner.Token(literal_token_type(value), value, line))
+
+    def is_literal(self, expr):
+        return type(expr) is syntax_trees.Literal
+
+    def visit_Binary(self, binary):
+        binary.left_expr = self._optimize(binary.left_expr)
+        binary.right_expr = self._optimize(binary.right_expr)
+        if self.is_literal(binary.left_expr) and self.is_literal(binary.right_expr):
+            folded = self.fold(binary.operation, (binary.left_expr.literal.get_value(),
+                                                  binary.right_expr.literal.get_value(), binary.operator),
+                               binary.operator.line)
+            if folded is not None:
+                return folded
+        return binary
+
+    def visit_Unary(self, unary):
+        unary.expr = self._optimize(unary.expr)
+        if self.is_literal(unary.expr):
+            folded = self.fold(unary.operation, (unary.expr.literal.get_value(), unary.operator),
+                               unary.operator.line)
+            if folded is not None:
+                return folded
+        return unary
+
+    def visit_Grouping(self, grouping):
+        grouping.expr = self._optimize(grouping.expr)
+        return grouping.expr if self.is_literal(grouping.expr) else grouping
+
+    def visit_Literal(self, ltrl):
+        return ltrl
+
+    def visit_Idnt(self, idnt):
+        return idnt
+
+    def visit_Assign(self, assign):
+        assign.right_side = self._optimize(assign.right_side)
+        return assign
+
+    def visit_Call(self, call):
+        call.callee = self._optimize(call.callee)
+        call.arguments = [self._optimize(arg) for arg in call.arguments]
+        return call
+
+    def visit_Get(self, get):
+        get.object = self._optimize(get.object)
+        return get
+
+    def visit_Set(self, set):
+        set.object = self._optimize(set.object)
+        set.right_side = self._optimize(set.right_side)
+        return set
+
+    def visit_ThisStmt(self, this):
+        return this
+
+    def visit_SuperCall(self, spr):
+        return spr
+
+    def visit_Construct(self, construct):
+        return construct
+
+    def visit_ExprStmt(self, exprstmt):
+        exprstmt.expr = self._optimize(exprstmt.expr)
+        return exprstmt
+
+    def visit_PrintStmt(self, prnt):
+        prnt.expr = self._optimize(prnt.expr)
+        return prnt
+
+    def visit_Dclr(self, dclr):
+        dclr.assign_expr = self._optimize(dclr.assign_expr)
+        return dclr
+
+    def visit_Block(self, blk):
+        blk.stmts = self.optimize_statements(blk.stmts)
+        return blk
+
+    def visit_IfStmt(self, ifstmt):
+        ifstmt.expr = self._optimize(ifstmt.expr)
+        ifstmt.if_block = self._optimize(ifstmt.if_block)
+        ifstmt.else_block = self._optimize(ifstmt.else_block)
+        if self.level >= OPTIMIZE_PRUNE and self.is_literal(ifstmt.expr):
+            return ifstmt.if_block if operators.is_true(ifstmt.expr.literal.get_value()) else ifstmt.else_block
+        return ifstmt
+
+    def visit_WhileStmt(self, whilestmt):
+        whilestmt.expr = self._optimize(whilestmt.expr)
+        whilestmt.while_block = self._optimize(whilestmt.while_block)
+        if (self.level >= OPTIMIZE_PRUNE and self.is_literal(whilestmt.expr) and
+                not operators.is_true(whilestmt.expr.literal.get_value())):
+            return None
+        return whilestmt
+
+    def visit_ReturnStmt(self, rtrn):
+        rtrn.ret_val = self._optimize(rtrn.ret_val)
+        return rtrn
+
+    def visit_BrkStmt(self, bstmt):
+        return bstmt
+
+    def visit_FuncDclr(self, fdclr):
+        fdclr.body = self._optimize(fdclr.body)
+        return fdclr
+
+    def visit_ClassDclr(self, cldclr):
+        cldclr.methods = [self._optimize(method) for method in cldclr.methods]
+        return cldclr
@@ -1,6 +1,7 @@
 import plox_scanner as ps
 import plox_syntax_trees as syntax_trees
 import plox_utilities as utilities
+import plox_operators as operators
 
 class TreePrinter:
     def visit_Binary(self, binary):
@@ -36,9 +37,52 @@ class TreePrinter:
         return idnt.name
 
 
-class TokenIterator(utilities.PloxIterator):
+class TokenIterator:
+    '''
+    Walks a list or a lazy stream of tokens. Only the previous token and at most two tokens
+    of lookahead are held, so a streamed program never has all of its tokens in memory.
+    '''
     def __init__(self, tokens):
-        super().__init__(tokens)
+        self._tokens = iter(tokens)
+        self._index = 0
+        self._previous = None
+        self._current = next(self._tokens, None)
+        self._next = None
+        self._next_read = False
+
+    def list_end(self):
+        return self._current is None
+
+    def get_index(self):
+        return self._index
+
+    def advance(self):
+        token = self._current
+        if token is None:
+            return None
+        self._previous = token
+        if self._next_read:
+            self._current = self._next
+            self._next = None
+            self._next_read = False
+        else:
+            self._current = next(self._tokens, None)
+        self._index += 1
+        return token
+
+    def peek(self):
+        return self._current
+
+    def peek_next(self):
+        if self._current is None:
+            return None
+        if not self._next_read:
+            self._next = next(self._tokens, None)
+            self._next_read = True
+        return self._next
+
+    def previous(self):
+        return self._previous
 
     def match(self, match_list):
         token = self.peek()
@@ -58,6 +102,54 @@ class TokenIterator(utilities.PloxIterator):
         return False
 
 
+class TokenBufferIterator(TokenIterator):
+    '''
+    TokenIterator view over a TokenBuffer. Matching reads the type array directly, Token
+    objects are only built for the tokens the parser asks for.
+    '''
+    def __init__(self, buffer):
+        self._buffer = buffer
+        self._types = buffer.types
+        self._count = len(buffer)
+        self._index = 0
+        self._previous_index = -1
+        self._previous = None
+
+    def list_end(self):
+        return self._index >= self._count
+
+    def advance(self):
+        if self._index >= self._count:
+            return None
+        self._index += 1
+        return self.previous()
+
+    def peek(self):
+        return self._buffer.get_token(self._index) if self._index < self._count else None
+
+    def peek_next(self):
+        return self._buffer.get_token(self._index + 1) if self._index + 1 < self._count else None
+
+    def previous(self):
+        index = self._index - 1
+        if index < 0:
+            return None
+        if index != self._previous_index:
+            self._previous = self._buffer.get_token(index)
+            self._previous_index = index
+        return self._previous
+
+    def match(self, match_list):
+        index = self._index
+        if index < self._count and self._types[index] in match_list:
+            self._index = index + 1
+            return True
+        return False
+
+    def match_previous(self, match_list):
+        return self._index > 0 and self._types[self._index - 1] in match_list
+
+
 class PloxSyntaxError(utilities.PloxError):
     def __init__(self, message, line):
         super().__init__(line, message)
@@ -66,23 +158,21 @@ class PloxSyntaxError(utilities.PloxError):
         return " Syntax Error: " + self.message
 
 
-@utilities.singleton
 class Parser:
     parser = None
 
-    def __init__(self):
+    def __init__(self, output=None):
+        self.output = output
         self.has_error = False
         self.tokens = None
         self.statements = []
 
     def parse(self, scanned_tokens=[]):
         self.has_error = False
-        if not isinstance(scanned_tokens, list):
-            raise Exception("Parser expected tokens to be in a list!")
         try:
             self._parse(scanned_tokens)
-        except PloxSyntaxError as e:
-            utilities.report_error(e)
+        except (PloxSyntaxError, ps.LexicalError) as e:  # Streamed tokens are scanned while parsing
+            utilities.report_error(e, self.output)
             self.has_error = True
 
     def error_occurred(self):
@@ -93,7 +183,10 @@ class Parser:
 
     def _parse(self, scanned_tokens):
         self.statements = []
-        self.tokens = TokenIterator(scanned_tokens)
+        if isinstance(scanned_tokens, ps.TokenBuffer):
+            self.tokens = TokenBufferIterator(scanned_tokens)
+        else:
+            self.tokens = TokenIterator(scanned_tokens)
         while self.tokens.list_end() is False:
             dclr = self.declaration()
             if dclr is not None:
@@ -264,12 +357,17 @@ class Parser:
             raise PloxSyntaxError("Assignment target wrong type.", self.tokens.previous().line)
         return expr
 
+    def binary(self, left, operator, right):
+        binary = syntax_trees.Binary(left, operator, right)
+        binary.operation = operators.binary_operation(operator)
+        return binary
+
     def equality(self):
         expr = self.comparision()
         while self.tokens.match([ps.NOT_EQUALS, ps.EQUALS]):
             operator = self.tokens.previous()
             right = self.comparision()
-            expr = syntax_trees.Binary(expr, operator, right)
+            expr = self.binary(expr, operator, right)
         return expr
 
     def comparision(self):
@@ -277,7 +375,7 @@ class Parser:
         while self.tokens.match([ps.GREATER_THAN_EQUALS, ps.GREATER_THAN, ps.LESS_THAN, ps.LESS_THAN_EQUALS]):
             operator = self.tokens.previous()
             right = self.term()
-            expr = syntax_trees.Binary(expr, operator, right)
+            expr = self.binary(expr, operator, right)
         return expr
 
     def term(self):
@@ -285,7 +383,7 @@ class Parser:
         while self.tokens.match([ps.ADD, ps.MINUS]):
             operator = self.tokens.previous()
             right = self.factor()
-            expr = syntax_trees.Binary(expr, operator, right)
+            expr = self.binary(expr, operator, right)
         return expr
 
     def factor(self):
@@ -293,12 +391,14 @@ class Parser:
         while self.tokens.match([ps.STAR, ps.DIV]):
             operator = self.tokens.previous()
             right = self.unary()
-            expr = syntax_trees.Binary(expr, operator, right)
+            expr = self.binary(expr, operator, right)
         return expr
 
     def unary(self):
         if self.tokens.match([ps.BANG, ps.MINUS]):
-            return syntax_trees.Unary(self.tokens.previous(), self.unary())
+            unary = syntax_trees.Unary(self.tokens.previous(), self.unary())
+            unary.operation = operators.unary_operation(unary.operator)
+            return unary
         else:
             return self.call()
 
@@ -0,0 +1,89 @@
+import sys
+import json
+import time
+from plox_interpreter import PloxFunction, PloxClass
+
+
+class FunctionProfile:
+    __slots__ = ('name', 'line', 'calls', 'inclusive', 'exclusive', 'active')
+
+    def __init__(self, name, line):
+        self.name = name
+        self.line = line
+        self.calls = 0
+        self.inclusive = 0.0  # Wall time from entry to return, recursive calls counted once
+        self.exclusive = 0.0  # Wall time not spent in other profiled calls
+        self.active = 0  # Calls of this function currently running
+
+    def to_dict(self):
+        return {"name": self.name, "line": self.line, "calls": self.calls, "inclusive": self.inclusive,
+                "exclusive": self.exclusive}
+
+
+class Profiler:
+    '''
+    Times every Lox function and class call, keyed by name and declaration line. start() swaps
+    the __call__ of PloxFunction and PloxClass for timed versions and stop() puts the originals
+    back, so nothing is measured, or paid for, while no profiler is running. The hooks are on
+    the classes, so a running profiler sees calls from every interpreter in the process. Engines
+    that invoke functions without going through __call__, the vm and stack engines, are not seen.
+    '''
+
+    def __init__(self):
+        self.profiles = {}
+        self.child_times = []  # Time spent in calls made by each running profiled call
+        self.originals = None
+
+    def start(self):
+        if self.originals is not None:
+            return
+        self.originals = (PloxFunction.__call__, PloxClass.__call__)
+        PloxFunction.__call__ = self.timed(PloxFunction.__call__)
+        PloxClass.__call__ = self.timed(PloxClass.__call__)
+
+    def stop(self):
+        if self.originals is None:
+            return
+        PloxFunction.__call__, PloxClass.__call__ = self.originals
+        self.originals = None
+
+    def timed(self, call):
+        profiles = self.profiles
+        child_times = self.child_times
+        perf_counter = time.perf_counter
+
+        def timed_call(callee, interpreter, *args):
+            key = (callee.name if type(callee) is PloxClass else callee.callable_name, callee.line)
+            profile = profiles.get(key)
+            if profile is None:
+                profile = profiles[key] = FunctionProfile(*key)
+            profile.calls += 1
+            profile.active += 1
+            child_times.append(0.0)
+            start = perf_counter()
+            try:
+                return call(callee, interpreter, *args)
+            finally:
+                elapsed = perf_counter() - start
+                profile.active -= 1
+                if profile.active == 0:
+                    profile.inclusive += elapsed
+                profile.exclusive += elapsed - child_times.pop()
+                if child_times:
+                    child_times[-1] += elapsed
+        return timed_call
+
+    def sorted_profiles(self):
+        return sorted(self.profiles.values(), key=lambda profile: profile.inclusive, reverse=True)
+
+    def report(self, output=None):
+        output = sys.stderr if output is None else output
+        print("%-24s %6s %10s %14s %14s" % ("function", "line", "calls", "inclusive (s)", "exclusive (s)"),
+              file=output)
+        for profile in self.sorted_profiles():
+            print("%-24s %6d %10d %14.4f %14.4f" % (profile.name, profile.line, profile.calls, profile.inclusive,
+                                                    profile.exclusive), file=output)
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump([profile.to_dict() for profile in self.sorted_profiles()], f, indent=2)
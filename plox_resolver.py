@@ -3,39 +3,59 @@ from plox_syntax_trees import *
 from plox_interpreter import *
 
 
-@utilities.singleton
+class FunctionScope:
+    def __init__(self, declaration, base):
+        self.declaration = declaration  # None for the top level of the program
+        self.base = base  # Index of the first scope that belongs to this function
+        self.upvalues = {}
+
+    def add_upvalue(self, descriptor):
+        if descriptor not in self.upvalues:
+            self.upvalues[descriptor] = len(self.upvalues)
+        return self.upvalues[descriptor]
+
+
 class Resolver:
 
-    def __init__(self):
+    def __init__(self, output=None):
+        self.output = output
         self.scopes = [{}]
+        self.slots = [{}]
+        self.declarations = [{}]
+        self.functions = [FunctionScope(None, 1)]
         self.has_error = False
-        self.interpreter = None
         self.loop_depth = 0
         self.func_depth = 0
         self.class_depth = 0
 
     def push_scope(self):
         self.scopes.append({})
+        self.slots.append({})
+        self.declarations.append({})
 
     def pop_scope(self):
         if len(self.scopes) == 0:
             return
         self.scopes.pop()
+        self.slots.pop()
+        self.declarations.pop()
 
     def error_occurred(self):
         return self.has_error
 
-    def resolve(self, interpreter, syntaxes):
-        self.interpreter = interpreter
+    def resolve(self, syntaxes):
         self.has_error = False
         self.scopes = [{}]
+        self.slots = [{}]
+        self.declarations = [{}]
+        self.functions = [FunctionScope(None, 1)]
         self.loop_depth = 0
         self.func_depth = 0
 
         try:
             self.resolve_statements(syntaxes)
         except PloxRuntimeError as e:
-            utilities.report_error(e)
+            utilities.report_error(e, self.output)
             self.has_error = True
 
     def resolve_statements(self, stmts):
@@ -47,9 +67,15 @@ class Resolver:
             return
         syntax.accept(self)
 
-    def declare(self, name):
+    def declare(self, name, line=0, declaration=None, parameter_index=None):
         if len(self.scopes) == 0:
             return
+        slots = self.slots[-1]
+        if name in slots and len(self.scopes) > 1:
+            # Local slots are handed out once, globals are checked when the declaration runs
+            raise PloxRuntimeError("Redeclaration of variable %s" % name, line)
+        slots[name] = len(slots)
+        self.declarations[-1][name] = (declaration, parameter_index)
         self.get_current_scope()[name] = False
 
     def define(self, name):
@@ -70,22 +96,61 @@ class Resolver:
         Look back "up" the context stack to see in which context
         the matching identifier is declared. 0 means the declaration is in
         the same context as the usage, 1 means the previous context, etc. 
+        The outermost context holds the globals which are looked up by name.
         '''
         for i in range(scopes_depth):
-            if name in self.scopes[scopes_depth - (i + 1)]:
-                self.interpreter.resolve_identifier(expr, i)
+            scope_index = scopes_depth - (i + 1)
+            if name in self.scopes[scope_index]:
+                if scope_index == 0:
+                    expr.depth = GLOBAL
+                    expr.slot = name
+                elif scope_index >= self.functions[-1].base:
+                    expr.depth = i
+                    expr.slot = self.slots[scope_index][name]
+                else:
+                    self.capture(scope_index, name)
+                    expr.depth = UPVALUE
+                    expr.slot = self.resolve_upvalue(len(self.functions) - 1, scope_index, name)
                 break
-
-    def visit_Block(self, blk, function_params=[]):
+        else:  # Globals are late bound, the name may be declared later or by an earlier program in the context
+            expr.depth = GLOBAL
+            expr.slot = name
+
+    def capture(self, scope_index, name):
+        # The variable outlives its scope inside a closure, so its declaration has to store it in a Cell
+        declaration, parameter_index = self.declarations[scope_index][name]
+        if declaration is None:
+            return  # "this" and "super" are always kept in cells
+        if parameter_index is None:
+            declaration.captured = True
+        else:
+            declaration.captured_parameters[parameter_index] = True
+
+    def resolve_upvalue(self, function_index, scope_index, name):
+        '''
+        Returns the index of the upvalue through which the function at function_index reaches
+        the variable declared in scope_index, threading it through every function in between.
+        Upvalues are described by the (depth, slot) of the variable at the point the closure
+        is created, or (UPVALUE, index) when the enclosing function captured it itself.
+        '''
+        function = self.functions[function_index]
+        enclosing = self.functions[function_index - 1]
+        if scope_index >= enclosing.base:
+            descriptor = (function.base - 1 - scope_index, self.slots[scope_index][name])
+        else:
+            descriptor = (UPVALUE, self.resolve_upvalue(function_index - 1, scope_index, name))
+        return function.add_upvalue(descriptor)
+
+    def visit_Block(self, blk, function_params=[], function=None):
         self.push_scope()
-        for param in function_params:
-            self.declare(param)
+        for i, param in enumerate(function_params):
+            self.declare(param, function.line, function, i)
             self.define(param)
         self.resolve_statements(blk.stmts)
         self.pop_scope()
 
     def visit_Dclr(self, dclr):
-        self.declare(dclr.var_name)
+        self.declare(dclr.var_name, dclr.line, dclr)
         if dclr.assign_expr is not None:
             self._resolve(dclr.assign_expr)
         self.define(dclr.var_name)
@@ -97,12 +162,12 @@ class Resolver:
     def visit_FuncDclr(self, fdclr):
         if fdclr.handle == "__init__" and self.class_depth == 0:
             raise PloxRuntimeError("Declaring a constructor in an illegal non-class context.", fdclr.line)
-        self.declare(fdclr.handle)
+        self.declare(fdclr.handle, fdclr.line, fdclr)
         self.define(fdclr.handle)
         self.resolve_function(fdclr)
 
     def visit_ClassDclr(self, cldclr):
-        self.declare(cldclr.class_name)
+        self.declare(cldclr.class_name, cldclr.line, cldclr)
         if cldclr.super is not None:  # This class inherits from another
             self._resolve(cldclr.super)
         self.push_scope()
@@ -159,6 +224,11 @@ class Resolver:
         if self.func_depth == 0:
             raise PloxRuntimeError("Illegal return from an invalid context.", rtrn.line)
         self._resolve(rtrn.ret_val)
+        # A function returning a call to its own name can rerun in place, the Interpreter checks the callee is itself
+        function = self.functions[-1].declaration
+        call = rtrn.ret_val
+        rtrn.tail_call = (function is not None and type(call) is Call and type(call.callee) is Idnt and
+                          call.callee.identifier.get_value() == function.handle)
 
     def visit_Call(self, call):
         self._resolve(call.callee)
@@ -185,10 +255,15 @@ class Resolver:
         if self.class_depth == 0:
             raise PloxRuntimeError("Calling \"super\" from an illegal non-class context", spr.token.line)
         self.resolve_identifier(spr, "super")
+        spr.this = ThisStmt(spr.token)  # A method looked up on super is bound to the running "this"
+        self.resolve_identifier(spr.this, "this")
 
     def resolve_function(self, function):
         self.func_depth +=1
-        self.visit_Block(function.body, function.parameters)
+        function.captured_parameters = [False] * len(function.parameters)
+        self.functions.append(FunctionScope(function, len(self.scopes)))
+        self.visit_Block(function.body, function.parameters, function)
+        function.upvalues = list(self.functions.pop().upvalues.keys())
         self.func_depth -= 1
 
 
@@ -0,0 +1,108 @@
+import sys
+import threading
+from collections import Counter
+from plox_interpreter import PloxFunction, PloxClass
+from plox_compiler import TYPE_SCRIPT
+from plox_stack import StackInterpreter
+from plox_vm import VM
+
+SAMPLE_INTERVAL = 0.005  # Seconds between samples
+ROOT_FRAME = "<script>"
+
+function_call = PloxFunction.__call__.__code__
+class_call = PloxClass.__call__.__code__
+stack_run = StackInterpreter.run.__code__
+stack_invoke = StackInterpreter.invoke.__code__
+vm_run = VM.run.__code__
+
+
+def frame_label(name, line):
+    return "%s:%d" % (name, line)
+
+
+def lox_calls(frame):
+    # Labels of the Lox calls running in frame and the frames below it, innermost first
+    calls = []
+    while frame is not None:
+        code = frame.f_code
+        if code is function_call:
+            function = frame.f_locals["self"]
+            calls.append(frame_label(function.callable_name, function.line))
+        elif code is class_call:
+            cls = frame.f_locals["self"]
+            calls.append(frame_label(cls.name, cls.line))
+        elif code is stack_run:
+            for generator in reversed(frame.f_locals.get("stack", ())):
+                if generator.gi_code is not stack_invoke:
+                    continue
+                invocation = generator.gi_frame.f_locals
+                function = invocation.get("function")
+                if function is not None:
+                    calls.append(frame_label(function.callable_name, function.line))
+                instance = invocation.get("instance")
+                if instance is not None:
+                    calls.append(frame_label(instance.class_type.name, instance.class_type.line))
+        elif code is vm_run:
+            for call_frame in reversed(frame.f_locals.get("frames", ())):
+                function = call_frame.closure.function
+                if function.function_type != TYPE_SCRIPT:
+                    calls.append(frame_label(function.name, function.line))
+        frame = frame.f_back
+    return calls
+
+
+class SamplingProfiler:
+    '''
+    Samples the Lox call stack of the thread that started it every interval seconds from a
+    background thread, counting how often each stack is seen. Nothing is hooked, so the program
+    runs at full speed and every engine is seen: the Lox calls are read off the Python frames of
+    PloxFunction and PloxClass calls and off the call stacks the stack and vm engines keep.
+    write_collapsed() writes the counts as collapsed stacks, one "outer;inner count" line per
+    stack, the input flamegraph.pl and speedscope take.
+    '''
+
+    def __init__(self, interval=SAMPLE_INTERVAL, root=ROOT_FRAME):
+        self.interval = interval
+        self.root = root
+        self.stacks = Counter()
+        self.thread_id = None
+        self.sampler = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        if self.sampler is not None:
+            return
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self.run, name="plox-sampler", daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        if self.sampler is None:
+            return
+        self.stopped.set()
+        self.sampler.join()
+        self.sampler = None
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        try:
+            calls = lox_calls(frame)
+        except (AttributeError, KeyError):
+            return  # Caught a call half set up, the next sample will see it
+        calls.append(self.root)
+        calls.reverse()
+        self.stacks[tuple(calls)] += 1
+
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def write_collapsed(self, output):
+        for stack, count in sorted(self.stacks.items()):
+            print("%s %d" % (";".join(stack), count), file=output)
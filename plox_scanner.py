@@ -1,3 +1,6 @@
+import re
+import sys
+from array import array
 import plox_utilities as utilities
 
 OPEN_PAREN = 0
@@ -44,6 +47,16 @@ KEYWORD_THIS = 40
 KEYWORD_CONSTRUCTOR = 41
 KEYWORD_SUPER = 42
 
+# Master pattern for the fast scanner. Only ASCII sources are scanned with it, where the
+# character classes agree exactly with the str.isalpha/isnumeric/isalnum checks of _scan.
+token_pattern = re.compile(r'(?P<space>[ \t\n]+)'
+                           r'|(?P<name>[A-Za-z_][A-Za-z0-9_]*)'
+                           r'|(?P<number>[0-9][0-9.]*)'
+                           r'|(?P<string>"[^"]*"?)'
+                           r'|(?P<symbol>//|<=|>=|==|!=|[(){}+\-*;,/!<>=.])'
+                           r'|(?P<error>.)', re.DOTALL)
+
+
 class SourceIterator(utilities.PloxIterator):
     def __init__(self, source):
         super().__init__(source)
@@ -71,6 +84,10 @@ class SourceIterator(utilities.PloxIterator):
     def get_current_line(self):
         return self._line
 
+    def get_token_span(self):
+        end = self.get_index() if not self.list_end() else len(self._list)
+        return self._start, end
+
     def match(self, char):
         ret = True if self.peek() == char else False
         if ret:
@@ -87,6 +104,8 @@ class LexicalError(utilities.PloxError):
 
 
 class Token:
+    __slots__ = ('type', 'literal', 'line')
+
     def __init__(self, token_type, literal, line):
         self.type = token_type
         self.literal = literal
@@ -99,7 +118,62 @@ class Token:
         return self.literal
 
 
-@utilities.singleton
+# Token types whose literal is not simply their lexeme
+converted_literals = frozenset((IDENTIFIER, NUMBER, KEYWORD_TRUE, KEYWORD_FALSE))
+
+
+class TokenBuffer:
+    '''
+    Struct-of-arrays token store. Each token costs a type byte, a line and a source span;
+    literals are rebuilt from the source when asked for, with identifiers interned so that
+    every use of a name shares one string.
+    '''
+    def __init__(self, source):
+        self.source = source
+        self.types = array('B')
+        self.lines = array('I')
+        self.starts = array('I')
+        self.ends = array('I')
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        for i in range(len(self.types)):
+            yield self.get_token(i)
+
+    def append(self, token_type, start, end, line):
+        self.types.append(token_type)
+        self.lines.append(line)
+        self.starts.append(start)
+        self.ends.append(end)
+
+    def get_type(self, index):
+        return self.types[index]
+
+    def get_line(self, index):
+        return self.lines[index]
+
+    def get_literal(self, index):
+        lexeme = self.source[self.starts[index]:self.ends[index]]
+        token_type = self.types[index]
+        if token_type == IDENTIFIER:
+            return sys.intern(lexeme)
+        if token_type == NUMBER:
+            return float(lexeme)
+        if token_type == KEYWORD_TRUE:
+            return True
+        if token_type == KEYWORD_FALSE:
+            return False
+        return lexeme
+
+    def get_token(self, index):
+        token_type = self.types[index]
+        if token_type in converted_literals:
+            return Token(token_type, self.get_literal(index), self.lines[index])
+        return Token(token_type, self.source[self.starts[index]:self.ends[index]], self.lines[index])
+
+
 class Scanner:
     source = None
     start = 0
@@ -114,11 +188,18 @@ class Scanner:
                       'var': KEYWORD_VAR, 'fun': KEYWORD_FUN, 'print': KEYWORD_PRINT, 'nil': KEYWORD_NIL,
                       'break': KEYWORD_BREAK, 'this': KEYWORD_THIS, '__init__': KEYWORD_CONSTRUCTOR,
                       'super': KEYWORD_SUPER}
+    keyword_literals = {'true': True, 'false': False}
     compound_symbols = {DIV: [COMMENT, '/'], LESS_THAN: [LESS_THAN_EQUALS, '='],
                         GREATER_THAN: [GREATER_THAN_EQUALS, '='], ASSIGN: [EQUALS, '='],
                         BANG: [NOT_EQUALS, '=']}
-
-    def __init__(self):
+    symbol_lookup = {'(': OPEN_PAREN, ')': CLOSE_PAREN, '{': OPEN_BRACE, '}': CLOSE_BRACE,
+                     '+': ADD, '-': MINUS, '*': STAR, ';': SEMI_COLON, ',': COMMA, '/': DIV,
+                     "!": BANG, ">": GREATER_THAN, "<": LESS_THAN, "=": ASSIGN, ".": DOT,
+                     '//': COMMENT, '<=': LESS_THAN_EQUALS, '>=': GREATER_THAN_EQUALS, '==': EQUALS,
+                     '!=': NOT_EQUALS}
+
+    def __init__(self, output=None):
+        self.output = output
         self._init_members()
 
     def _init_members(self):
@@ -134,15 +215,49 @@ class Scanner:
     def raise_lexical_error(self, line, message):
         raise LexicalError(line, message)
 
-    def scan(self, source):
+    def scan(self, source, fast=False, buffer=False):
+        self._init_members()
+        try:
+            if buffer:
+                self.tokens = TokenBuffer(source)
+                self.fill_buffer(self.tokens, fast)
+            else:
+                self.tokens.extend(self.tokenize(source, fast))
+        except LexicalError as e:
+            utilities.report_error(e, self.output)
+
+    def fill_buffer(self, buffer, fast=False):
         self.has_error = False
         try:
+            source = buffer.source
             if not isinstance(source, str):
                 self.raise_lexical_error(0, "Plox expected text program")
-            self._scan(source)
-        except LexicalError as e:
-            utilities.report_error(e)
+            if fast and source.isascii():
+                self._scan_fast_buffer(buffer)
+            else:
+                for token in self._scan(source):
+                    start, end = self.source.get_token_span()
+                    buffer.append(token.type, start, end, token.line)
+        except LexicalError:
             self.has_error = True
+            raise
+
+    def tokenize(self, source, fast=False):
+        '''
+        Lazily yields the tokens of source. A LexicalError propagates to the consumer after
+        the tokens that precede it have been yielded, and marks the scanner as failed.
+        '''
+        self.has_error = False
+        try:
+            if not isinstance(source, str):
+                self.raise_lexical_error(0, "Plox expected text program")
+            if fast and source.isascii():
+                yield from self._scan_fast(source)
+            else:
+                yield from self._scan(source)
+        except LexicalError:
+            self.has_error = True
+            raise
 
     def set_source(self, source):
         self._init_members(source)
@@ -150,7 +265,7 @@ class Scanner:
     def get_scanned_tokens(self):
         return self.tokens
 
-    def add_token(self, token_type):
+    def make_token(self, token_type):
         current_string = self.source.source_current_string()
         if token_type == KEYWORD_TRUE:
             literal = True
@@ -158,7 +273,7 @@ class Scanner:
             literal = False
         else:
             literal = float(current_string) if token_type == NUMBER else current_string
-        self.tokens.append(Token(token_type, literal, self.source.get_current_line()))
+        return Token(token_type, literal, self.source.get_current_line())
 
     def is_valid_numeric_symbol(self, symbol):
         return True if symbol is not None and (symbol.isnumeric() or symbol == '.') else False
@@ -168,10 +283,11 @@ class Scanner:
         while self.is_valid_numeric_symbol(self.source.peek()):
             c = self.source.advance()
             if c == '.' and floating_point:
-                self.raise_lexical_error("Lexical Error: Too many decimal points in numeric.")
+                self.raise_lexical_error(self.source.get_current_line(),
+                                         "Lexical Error: Too many decimal points in numeric.")
             elif c == '.':
                 floating_point = True
-        self.add_token(NUMBER)
+        return self.make_token(NUMBER)
 
     def is_valid_name_or_keyword_symbol(self, symbol):
         return False if symbol is None or (symbol != '_' and not symbol.isalnum()) else True
@@ -182,15 +298,15 @@ class Scanner:
 
         symbol = self.source.source_current_string()
         token_id = IDENTIFIER if symbol not in self.keyword_lookup.keys() else self.keyword_lookup[symbol]
-        self.add_token(token_id) # Token is an identifier
+        return self.make_token(token_id) # Token is an identifier
 
     def could_be_compound_symbol(self, token_id):
         return True if token_id in self.compound_symbols.keys() else False
 
     def scan_string(self):
         if self.source.seek('"') is None:
-            self.raise_lexical_error("Lexical Error: Reached EOF without closing \" ")
-        self.add_token(STRING)
+            self.raise_lexical_error(self.source.get_current_line(), "Lexical Error: Reached EOF without closing \" ")
+        return self.make_token(STRING)
 
     def scan_comment(self):
         # Comments are just ignored. Scan until the next new line
@@ -200,18 +316,16 @@ class Scanner:
         if self.could_be_compound_symbol(token_id):
             match = self.compound_symbols[token_id]
             if self.source.match(match[1]):
-                self.add_token(match[0])
-            else:
-                self.add_token(token_id)
+                return self.make_token(match[0])
+            return self.make_token(token_id)
         elif token_id == STRING:
-            self.scan_string()
+            return self.scan_string()
         elif token_id == COMMENT:
             self.scan_comment()
         else:
-            self.add_token(token_id)
+            return self.make_token(token_id)
 
     def _scan(self, source):
-        self._init_members()
         self.source = SourceIterator(source)
         while not self.source.peek() is None:
             c = self.source.advance()
@@ -219,16 +333,76 @@ class Scanner:
             if c is None:
                 return
             if c.isalpha() or c == '_':
-                self.read_alpha_symbol()
+                yield self.read_alpha_symbol()
             elif c.isnumeric():
-                self.read_numeric_symbol()
+                yield self.read_numeric_symbol()
             else:
                 token_id = None if c not in self.simple_token_lookup.keys() else self.simple_token_lookup[c]
                 if token_id is None:
                     self.raise_lexical_error(self.source.get_current_line(),
                                              "Lexical Error: Unrecognized symbol %c." % c)
                 else:
-                    self.scan_simple_symbol(token_id)
-
-
-
+                    token = self.scan_simple_symbol(token_id)
+                    if token is not None:
+                        yield token
+
+    def _scan_fast(self, source):
+        '''
+        Produces the same tokens as _scan with one regex match per token instead of a method
+        call per character. A token's line is the number of newlines up to its end, as _scan
+        counts the newlines it skips before reading each character.
+        '''
+        keyword_lookup = self.keyword_lookup
+        keyword_literals = self.keyword_literals
+        symbol_lookup = self.symbol_lookup
+        line = 0
+        for match in token_pattern.finditer(source):
+            kind = match.lastgroup
+            lexeme = match.group()
+            if kind == 'space':
+                line += lexeme.count('\n')
+            elif kind == 'name':
+                yield Token(keyword_lookup.get(lexeme, IDENTIFIER), keyword_literals.get(lexeme, lexeme), line)
+            elif kind == 'symbol':
+                yield Token(symbol_lookup[lexeme], lexeme, line)
+            elif kind == 'number':
+                if lexeme.count('.') > 1:
+                    self.raise_lexical_error(line, "Lexical Error: Too many decimal points in numeric.")
+                yield Token(NUMBER, float(lexeme), line)
+            elif kind == 'string':
+                line += lexeme.count('\n')
+                yield Token(STRING, lexeme, line)
+            else:
+                self.raise_lexical_error(line, "Lexical Error: Unrecognized symbol %c." % lexeme)
+
+    def _scan_fast_buffer(self, buffer):
+        # _scan_fast writing straight into the arrays of a TokenBuffer, no Token objects are created
+        keyword_lookup = self.keyword_lookup
+        symbol_lookup = self.symbol_lookup
+        append_type = buffer.types.append
+        append_line = buffer.lines.append
+        append_start = buffer.starts.append
+        append_end = buffer.ends.append
+        line = 0
+        for match in token_pattern.finditer(buffer.source):
+            kind = match.lastgroup
+            if kind == 'space':
+                line += match.group().count('\n')
+                continue
+            if kind == 'name':
+                token_type = keyword_lookup.get(match.group(), IDENTIFIER)
+            elif kind == 'symbol':
+                token_type = symbol_lookup[match.group()]
+            elif kind == 'number':
+                if match.group().count('.') > 1:
+                    self.raise_lexical_error(line, "Lexical Error: Too many decimal points in numeric.")
+                token_type = NUMBER
+            elif kind == 'string':
+                line += match.group().count('\n')
+                token_type = STRING
+            else:
+                self.raise_lexical_error(line, "Lexical Error: Unrecognized symbol %c." % match.group())
+            append_type(token_type)
+            append_line(line)
+            append_start(match.start())
+            append_end(match.end())
@@ -0,0 +1,263 @@
+import types
+from plox_interpreter import *
+
+MAX_CALL_DEPTH = 10000  # Nested Lox calls allowed before a stack overflow is reported
+
+GeneratorType = types.GeneratorType
+
+
+class StackInterpreter(Interpreter):
+    '''
+    Evaluates the same syntax trees as the Interpreter without recursing on the Python stack.
+    Visiting a node that has children returns a generator which yields each child it needs and
+    is sent back the child's value, run() keeps those generators on an explicit stack. Leaves
+    such as literals and identifiers are still evaluated directly. Lox calls push the callee's
+    body onto the same stack, so recursion depth is bounded by max_call_depth instead of the
+    Python recursion limit.
+    '''
+
+    def __init__(self, console_mode=False, output=None):
+        super().__init__(console_mode, output)
+        self.max_call_depth = MAX_CALL_DEPTH
+        self.call_depth = 0
+
+    def run(self, request):
+        if type(request) is not GeneratorType:
+            request = request.accept(self)
+            if type(request) is not GeneratorType:
+                return request
+        stack = [request]
+        value = None
+        error = None
+        while True:
+            generator = stack[-1]
+            try:
+                if error is None:
+                    request = generator.send(value)
+                else:
+                    thrown, error = error, None
+                    request = generator.throw(thrown)
+            except StopIteration as stop:
+                stack.pop()
+                if not stack:
+                    return stop.value
+                value = stop.value
+                continue
+            except Exception as e:  # Unwind into the parent so its handlers and finally blocks run
+                stack.pop()
+                if not stack:
+                    raise
+                error = e
+                continue
+            if type(request) is not GeneratorType:
+                try:
+                    request = request.accept(self)
+                except Exception as e:
+                    error = e
+                    continue
+                if type(request) is not GeneratorType:
+                    value = request
+                    continue
+            stack.append(request)
+            value = None
+
+    def evaluate(self, expr):
+        return self.run(expr)
+
+    def execute(self, stmt):
+        return self.run(stmt)
+
+    def execute_function_body(self, func_body_block, call_args, upvalues, function=None):
+        self.enter_function_call(Environment(self.environments[-1], upvalues, function))
+        try:
+            return self.run(self.visit_Block(func_body_block, call_args))
+        finally:
+            self.exit_function_call()
+
+    def invoke(self, callee, args, line):
+        instance = None
+        if type(callee) is PloxClass:
+            instance = PloxInstance(callee)
+            try:
+                callee = instance.bind(callee.get_method("__init__"))
+            except Exception:
+                return instance  # No constructor declared just return the instance
+        if type(callee) is BoundMethod:
+            function = callee.method
+            upvalues = function.bind_upvalues(callee.instance)
+            tail_callable = None
+        elif type(callee) is PloxFunction:
+            function = tail_callable = callee
+            upvalues = function.upvalues
+        else:
+            return callee(self, args)
+        if self.call_depth >= self.max_call_depth:
+            raise PloxRuntimeError("Stack overflow, calls nested deeper than %d." % self.max_call_depth, line)
+        while True:
+            if len(args) != function.arity():
+                raise PloxRuntimeError("Function %s expects %d arguments but %d given." % (function.callable_name,
+                                                                                           function.arity(),
+                                                                                           len(args)), line)
+            if function.captured_parameters is not None:
+                args = [Cell(arg) if captured else arg for arg, captured in zip(args, function.captured_parameters)]
+            self.call_depth += 1
+            self.enter_function_call(Environment(self.environments[-1], upvalues, tail_callable))
+            try:
+                signal = yield self.visit_Block(function.function_body, zip(function.parameter_names, args))
+            finally:
+                self.exit_function_call()
+                self.call_depth -= 1
+            if signal is not TAIL_CALL:
+                break
+            args = self.tail_call_arguments
+            self.tail_call_arguments = None
+        ret_val = None
+        if signal is RETURN:
+            ret_val = self.return_value
+            self.return_value = None
+        elif signal is BREAK:
+            raise PloxRuntimeError("Break must be called within a loop context.")
+        return ret_val if instance is None else instance
+
+    def interpret(self, statements):
+        self.call_depth = 0
+        super().interpret(statements)
+
+    def visit_Dclr(self, dclr):
+        var_name = dclr.var_name
+        try:
+            self.environments[-1].add(var_name, Cell(None) if dclr.captured else None)
+        except PloxRuntimeError as e:
+            raise PloxRuntimeError(e.message, dclr.line)
+        if dclr.assign_expr is not None:
+            yield dclr.assign_expr
+
+    # Children are visited in place and only yielded to run() when they turn out to need the stack
+
+    def visit_PrintStmt(self, printstmt):
+        expr_result = printstmt.expr.accept(self)
+        if type(expr_result) is GeneratorType:
+            expr_result = yield expr_result
+        print(str(expr_result), file=self.output)
+
+    def visit_ExprStmt(self, exprstmt):
+        expr_result = exprstmt.expr.accept(self)
+        if type(expr_result) is GeneratorType:
+            expr_result = yield expr_result
+        if self._console_mode:
+            self.console_print(expr_result)
+
+    def visit_Block(self, block, func_call_args=[]):
+        environment = self.environments[-1]
+        environment.enter_block(func_call_args)
+        try:
+            for stmt in block.stmts:
+                signal = stmt.accept(self)
+                if type(signal) is GeneratorType:
+                    signal = yield signal
+                if signal is not None:
+                    return signal
+        finally:
+            environment.exit_block()
+        return None
+
+    def visit_IfStmt(self, ifstmt):
+        if_expr_result = ifstmt.expr.accept(self)
+        if type(if_expr_result) is GeneratorType:
+            if_expr_result = yield if_expr_result
+        if self.is_true(if_expr_result):
+            return (yield ifstmt.if_block)
+        elif ifstmt.else_block is not None:
+            return (yield ifstmt.else_block)
+        return None
+
+    def visit_WhileStmt(self, whilestmt):
+        while True:
+            while_expr = whilestmt.expr.accept(self)
+            if type(while_expr) is GeneratorType:
+                while_expr = yield while_expr
+            if not self.is_true(while_expr):
+                return None
+            signal = yield whilestmt.while_block
+            if signal is not None:
+                return None if signal is BREAK else signal
+
+    def visit_Binary(self, binary):
+        left = binary.left_expr.accept(self)
+        if type(left) is GeneratorType:
+            left = yield left
+        right = binary.right_expr.accept(self)
+        if type(right) is GeneratorType:
+            right = yield right
+        return binary.operation(left, right, binary.operator)
+
+    def visit_Grouping(self, grouping):
+        return (yield grouping.expr)
+
+    def visit_Unary(self, unary):
+        value = unary.expr.accept(self)
+        if type(value) is GeneratorType:
+            value = yield value
+        return unary.operation(value, unary.operator)
+
+    def visit_Assign(self, assign):
+        assign_value = assign.right_side.accept(self)
+        if type(assign_value) is GeneratorType:
+            assign_value = yield assign_value
+        try:
+            self.environments[-1].assign(assign, assign_value)
+        except Exception as e:
+            raise PloxRuntimeError("Implicit declaration of variable %s." % assign.var_name,
+                                   assign.line)
+        return assign_value
+
+    def visit_Call(self, call):
+        try:
+            callable_obj = yield call.callee
+        except Exception as e:
+            raise PloxRuntimeError("Implicit declaration of function %s." % str(call.callee),
+                                   call.line)
+        if not callable(callable_obj):
+            raise PloxRuntimeError("Attempting to call a non-callable object .", call.line)
+        arguments = []
+        for argument in call.arguments:
+            value = argument.accept(self)
+            if type(value) is GeneratorType:
+                value = yield value
+            arguments.append(value)
+        return (yield self.invoke(callable_obj, arguments, call.line))
+
+    def visit_Get(self, get):
+        try:
+            object = yield get.object
+        except Exception:
+            raise PloxRuntimeError("Accessing unknown object", get.line)
+        return self.get_property(get, object)
+
+    def visit_Set(self, set):
+        set_value = set.right_side.accept(self)
+        if type(set_value) is GeneratorType:
+            set_value = yield set_value
+        try:
+            object = yield set.object
+        except Exception:
+            raise PloxRuntimeError("Attempting to set unknown object", set.line)
+        self.set_property(set, object, set_value)
+
+    def visit_ReturnStmt(self, ret_stmt):
+        ret_value = None
+        if ret_stmt.tail_call and self.is_tail_call(ret_stmt.ret_val):
+            arguments = []
+            for argument in ret_stmt.ret_val.arguments:
+                value = argument.accept(self)
+                if type(value) is GeneratorType:
+                    value = yield value
+                arguments.append(value)
+            self.tail_call_arguments = arguments
+            return TAIL_CALL
+        if ret_stmt.ret_val is not None:
+            ret_value = ret_stmt.ret_val.accept(self)
+            if type(ret_value) is GeneratorType:
+                ret_value = yield ret_value
+        self.return_value = ret_value
+        return RETURN
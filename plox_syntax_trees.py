@@ -23,11 +23,17 @@ Type_SuperCall = 21
 
 
 class Binary:
+    __slots__ = ('left_expr', 'operator', 'right_expr', 'operation', 'specialised', 'left_type', 'right_type', 'feedback')
+
     def __init__(self, left_expr, operator, right_expr):
         self.left_expr = left_expr
         self.operator = operator
         self.right_expr = right_expr
-        self.type = Type_Binary
+        self.operation = None
+        self.specialised = None
+        self.left_type = None
+        self.right_type = None
+        self.feedback = None
 
     def accept(self, visitor): 
         val = visitor.visit_Binary(self)
@@ -35,9 +41,10 @@ class Binary:
 
 
 class Grouping:
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
-        self.type = Type_Grouping
 
     def accept(self, visitor): 
         val = visitor.visit_Grouping(self)
@@ -45,9 +52,10 @@ class Grouping:
 
 
 class Literal:
+    __slots__ = ('literal',)
+
     def __init__(self, literal):
         self.literal = literal
-        self.type = Type_Literal
 
     def accept(self, visitor): 
         val = visitor.visit_Literal(self)
@@ -55,10 +63,12 @@ class Literal:
 
 
 class Unary:
+    __slots__ = ('operator', 'expr', 'operation')
+
     def __init__(self, operator, expr):
         self.operator = operator
         self.expr = expr
-        self.type = Type_Unary
+        self.operation = None
 
     def accept(self, visitor): 
         val = visitor.visit_Unary(self)
@@ -66,9 +76,10 @@ class Unary:
 
 
 class ExprStmt:
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
-        self.type = Type_ExprStmt
 
     def accept(self, visitor): 
         val = visitor.visit_ExprStmt(self)
@@ -76,9 +87,10 @@ class ExprStmt:
 
 
 class PrintStmt:
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
-        self.type = Type_PrintStmt
 
     def accept(self, visitor): 
         val = visitor.visit_PrintStmt(self)
@@ -86,11 +98,13 @@ class PrintStmt:
 
 
 class Dclr:
+    __slots__ = ('var_name', 'assign_expr', 'line', 'captured')
+
     def __init__(self, var_name, assign_expr, line):
         self.var_name = var_name
         self.assign_expr = assign_expr
         self.line = line
-        self.type = Type_Dclr
+        self.captured = None
 
     def accept(self, visitor): 
         val = visitor.visit_Dclr(self)
@@ -98,9 +112,12 @@ class Dclr:
 
 
 class Idnt:
+    __slots__ = ('identifier', 'depth', 'slot')
+
     def __init__(self, identifier):
         self.identifier = identifier
-        self.type = Type_Idnt
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor): 
         val = visitor.visit_Idnt(self)
@@ -108,11 +125,14 @@ class Idnt:
 
 
 class Assign:
+    __slots__ = ('var_name', 'right_side', 'line', 'depth', 'slot')
+
     def __init__(self, var_name, right_side, line):
         self.var_name = var_name
         self.right_side = right_side
         self.line = line
-        self.type = Type_Assign
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor): 
         val = visitor.visit_Assign(self)
@@ -120,9 +140,10 @@ class Assign:
 
 
 class Block:
+    __slots__ = ('stmts',)
+
     def __init__(self, stmts):
         self.stmts = stmts
-        self.type = Type_Block
 
     def accept(self, visitor): 
         val = visitor.visit_Block(self)
@@ -130,11 +151,12 @@ class Block:
 
 
 class IfStmt:
+    __slots__ = ('expr', 'if_block', 'else_block')
+
     def __init__(self, expr, if_block, else_block):
         self.expr = expr
         self.if_block = if_block
         self.else_block = else_block
-        self.type = Type_IfStmt
 
     def accept(self, visitor): 
         val = visitor.visit_IfStmt(self)
@@ -142,10 +164,11 @@ class IfStmt:
 
 
 class WhileStmt:
+    __slots__ = ('expr', 'while_block')
+
     def __init__(self, expr, while_block):
         self.expr = expr
         self.while_block = while_block
-        self.type = Type_WhileStmt
 
     def accept(self, visitor): 
         val = visitor.visit_WhileStmt(self)
@@ -153,11 +176,12 @@ class WhileStmt:
 
 
 class Call:
+    __slots__ = ('callee', 'arguments', 'line')
+
     def __init__(self, callee, arguments, line):
         self.callee = callee
         self.arguments = arguments
         self.line = line
-        self.type = Type_Call
 
     def accept(self, visitor): 
         val = visitor.visit_Call(self)
@@ -165,12 +189,16 @@ class Call:
 
 
 class FuncDclr:
+    __slots__ = ('handle', 'parameters', 'body', 'line', 'captured', 'captured_parameters', 'upvalues')
+
     def __init__(self, handle, parameters, body, line):
         self.handle = handle
         self.parameters = parameters
         self.body = body
         self.line = line
-        self.type = Type_FuncDclr
+        self.captured = None
+        self.captured_parameters = None
+        self.upvalues = None
 
     def accept(self, visitor): 
         val = visitor.visit_FuncDclr(self)
@@ -178,10 +206,12 @@ class FuncDclr:
 
 
 class ReturnStmt:
+    __slots__ = ('ret_val', 'line', 'tail_call')
+
     def __init__(self, ret_val, line):
         self.ret_val = ret_val
         self.line = line
-        self.type = Type_ReturnStmt
+        self.tail_call = None
 
     def accept(self, visitor): 
         val = visitor.visit_ReturnStmt(self)
@@ -189,9 +219,10 @@ class ReturnStmt:
 
 
 class BrkStmt:
+    __slots__ = ('line',)
+
     def __init__(self, line):
         self.line = line
-        self.type = Type_BrkStmt
 
     def accept(self, visitor): 
         val = visitor.visit_BrkStmt(self)
@@ -199,12 +230,14 @@ class BrkStmt:
 
 
 class ClassDclr:
+    __slots__ = ('class_name', 'super', 'methods', 'line', 'captured')
+
     def __init__(self, class_name, super, methods, line):
         self.class_name = class_name
         self.super = super
         self.methods = methods
         self.line = line
-        self.type = Type_ClassDclr
+        self.captured = None
 
     def accept(self, visitor): 
         val = visitor.visit_ClassDclr(self)
@@ -212,11 +245,16 @@ class ClassDclr:
 
 
 class Get:
+    __slots__ = ('object', 'field_name', 'line', 'cached_class', 'cached_method', 'cached_shape', 'cached_index')
+
     def __init__(self, object, field_name, line):
         self.object = object
         self.field_name = field_name
         self.line = line
-        self.type = Type_Get
+        self.cached_class = None
+        self.cached_method = None
+        self.cached_shape = None
+        self.cached_index = None
 
     def accept(self, visitor): 
         val = visitor.visit_Get(self)
@@ -224,12 +262,16 @@ class Get:
 
 
 class Set:
+    __slots__ = ('object', 'field_name', 'right_side', 'line', 'cached_shape', 'cached_index', 'cached_transition')
+
     def __init__(self, object, field_name, right_side, line):
         self.object = object
         self.field_name = field_name
         self.right_side = right_side
         self.line = line
-        self.type = Type_Set
+        self.cached_shape = None
+        self.cached_index = None
+        self.cached_transition = None
 
     def accept(self, visitor): 
         val = visitor.visit_Set(self)
@@ -237,9 +279,12 @@ class Set:
 
 
 class ThisStmt:
+    __slots__ = ('token', 'depth', 'slot')
+
     def __init__(self, token):
         self.token = token
-        self.type = Type_ThisStmt
+        self.depth = None
+        self.slot = None
 
     def accept(self, visitor): 
         val = visitor.visit_ThisStmt(self)
@@ -247,9 +292,10 @@ class ThisStmt:
 
 
 class Construct:
+    __slots__ = ('line',)
+
     def __init__(self, line):
         self.line = line
-        self.type = Type_Construct
 
     def accept(self, visitor): 
         val = visitor.visit_Construct(self)
@@ -257,9 +303,13 @@ class Construct:
 
 
 class SuperCall:
+    __slots__ = ('token', 'depth', 'slot', 'this')
+
     def __init__(self, token):
         self.token = token
-        self.type = Type_SuperCall
+        self.depth = None
+        self.slot = None
+        self.this = None
 
     def accept(self, visitor): 
         val = visitor.visit_SuperCall(self)
@@ -0,0 +1,496 @@
+import plox_operators as operators
+import plox_syntax_trees as syntax_trees
+from plox_interpreter import *
+
+# Operators with a Python equivalent get it inlined behind a float check, anything else calls the handler
+inline_operators = {operators.add: "+", operators.subtract: "-", operators.multiply: "*", operators.divide: "/",
+                    operators.greater: ">", operators.less: "<", operators.greater_equal: ">=",
+                    operators.less_equal: "<="}
+boolean_operations = frozenset((operators.greater, operators.less, operators.greater_equal, operators.less_equal,
+                                operators.equal, operators.not_equal, operators.logical_not))
+
+
+class TranspiledProgram:
+    def __init__(self, source, statements, constants):
+        self.source = source
+        self.statements = statements  # Names of the defs running each top level statement, in order
+        self.constants = constants  # Syntax nodes and tokens the source refers to by name
+
+
+class PythonFunction:
+    '''
+    A def being generated. scopes mirrors the Environment's scopes, each declaration is a
+    (Python name, is a Cell) pair at the slot the Resolver gave it, so identifiers resolve to
+    Python locals at transpile time.
+    '''
+
+    def __init__(self, name, parameters, scopes, declaration=None):
+        self.name = name
+        self.parameters = parameters
+        self.scopes = scopes
+        self.declaration = declaration
+        self.lines = []
+        self.indentation = 0
+        self.temporaries = 0
+        self.loops = []  # One entry per enclosing while loop, True once a tail call breaks out of it
+        self.tail_loop = False  # The body runs in a loop that tail calls restart
+        self.tail_flag = False  # Some tail call had to break out of a while loop first
+
+
+class Transpiler:
+    '''
+    Generates Python source from resolved syntax trees. Every Lox function becomes a module level
+    def taking its upvalues, the PloxFunction it runs as and its parameters. Functions, classes
+    and instances are the Interpreter's own, so the runtime class model, bound methods and
+    property caches are shared with the other engines. Lox semantics that Python doesn't share,
+    float only arithmetic, the + string coercion and truthiness, are kept by inlining only the
+    float case and leaving everything else to the plox_operators handlers.
+    '''
+
+    def __init__(self, console_mode=False):
+        self.console_mode = console_mode
+        self.function = None
+        self.definitions = []
+        self.constants = {}
+        self.names = 0
+
+    def transpile(self, statements):
+        self.definitions = []
+        self.constants = {}
+        self.names = 0
+        names = []
+        for stmt in statements:
+            self.begin_function(self.unique_name("s", "statement"), [], [])
+            stmt.accept(self)
+            names.append(self.end_function())
+        return TranspiledProgram("\n\n".join(self.definitions) + "\n", names, self.constants)
+
+    def unique_name(self, prefix, name):
+        self.names += 1
+        return "%s_%s_%d" % (prefix, name, self.names)
+
+    def constant(self, prefix, value):
+        name = self.unique_name("c", prefix)
+        self.constants[name] = value
+        return name
+
+    def temporary(self):
+        self.function.temporaries += 1
+        return "t_%d" % self.function.temporaries
+
+    def emit(self, line):
+        self.function.lines.append("    " * (self.function.indentation + 1) + line)
+
+    def emit_suite(self, header, body):
+        # Emits header and runs body to fill the indented block under it
+        self.emit(header)
+        self.function.indentation += 1
+        length = len(self.function.lines)
+        body()
+        if len(self.function.lines) == length:
+            self.emit("pass")
+        self.function.indentation -= 1
+
+    def begin_function(self, name, parameters, scopes, declaration=None):
+        enclosing = self.function
+        self.function = PythonFunction(name, parameters, scopes, declaration)
+        return enclosing
+
+    def end_function(self, enclosing=None):
+        function = self.function
+        lines = function.lines
+        if function.tail_loop:
+            lines = ["    " + line for line in lines] + ["        return None"]
+            lines.insert(0, "    while True:")
+            if function.tail_flag:
+                lines.insert(0, "    tail_call = False")
+        if len(lines) == 0:
+            lines = ["    pass"]
+        comment = "" if function.declaration is None else "  # fun %s, line %d" % (function.declaration.handle,
+                                                                                    function.declaration.line)
+        header = "def %s(%s):%s" % (function.name, ", ".join(function.parameters), comment)
+        self.definitions.append("\n".join([header] + lines))
+        self.function = enclosing
+        return function.name
+
+    def push_scope(self, declarations=None):
+        self.function.scopes.append([] if declarations is None else declarations)
+
+    def pop_scope(self):
+        self.function.scopes.pop()
+
+    def declare_local(self, name, cell):
+        python_name = self.unique_name("v", name)
+        self.function.scopes[-1].append((python_name, cell))
+        return python_name
+
+    def is_global_scope(self):
+        return len(self.function.scopes) == 0
+
+    def variable(self, depth, slot, name, line, undeclared="undeclared"):
+        if depth == GLOBAL:
+            return "(G[%r] if %r in G else %s(%r, %d))" % (slot, slot, undeclared, slot, line)
+        if depth == UPVALUE:
+            return "upvalues[%d].value" % slot
+        python_name, cell = self.function.scopes[-1 - depth][slot]
+        return python_name + ".value" if cell else python_name
+
+    def cell(self, depth, slot):
+        # The Cell an upvalue descriptor names, see Environment.capture_upvalues
+        if depth == UPVALUE:
+            return "upvalues[%d]" % slot
+        return self.function.scopes[-1 - depth][slot][0]
+
+    def truth(self, expr):
+        code = expr.accept(self)
+        if self.is_boolean(expr):
+            return code
+        value = self.temporary()
+        return "not ((%s := %s) is None or %s == 0.0 or %s is False)" % (value, code, value, value)
+
+    def is_boolean(self, expr):
+        while type(expr) is syntax_trees.Grouping:
+            expr = expr.expr
+        if type(expr) in (syntax_trees.Binary, syntax_trees.Unary):
+            return expr.operation in boolean_operations
+        return type(expr) is syntax_trees.Literal and type(expr.literal.get_value()) is bool
+
+    def create_function(self, f_dclr):
+        parameters = []
+        scope = []
+        for name, captured in zip(f_dclr.parameters, f_dclr.captured_parameters):
+            python_name = self.unique_name("v", name)
+            parameters.append(python_name)
+            scope.append((python_name, captured))
+        enclosing = self.begin_function(self.unique_name("f", f_dclr.handle), ["upvalues", "function"] + parameters,
+                                        [scope], f_dclr)
+        for stmt in f_dclr.body.stmts:
+            stmt.accept(self)
+        name = self.end_function(enclosing)
+        upvalues = ", ".join(self.cell(depth, slot) for depth, slot in f_dclr.upvalues)
+        captured = tuple(f_dclr.captured_parameters) if any(f_dclr.captured_parameters) else None
+        return "PloxFunction(%r, %s, [%s], %r, %r, %d)" % (f_dclr.handle, name, upvalues, tuple(f_dclr.parameters),
+                                                           captured, f_dclr.line)
+
+    def visit_Literal(self, ltrl):
+        return repr(ltrl.literal.get_value())
+
+    def visit_Grouping(self, grouping):
+        return "(%s)" % grouping.expr.accept(self)
+
+    def visit_Idnt(self, idnt):
+        return self.variable(idnt.depth, idnt.slot, idnt.identifier.get_value(), idnt.identifier.line)
+
+    def visit_ThisStmt(self, this):
+        return self.variable(this.depth, this.slot, "this", this.token.line)
+
+    def visit_SuperCall(self, spr):
+        return self.variable(spr.depth, spr.slot, "super", spr.token.line)
+
+    def visit_Construct(self, construct):
+        raise PloxRuntimeError("Explicit invocation of a constructor is not allowed.", construct.line)
+
+    def visit_Binary(self, binary):
+        operation = binary.operation
+        left = binary.left_expr.accept(self)
+        right = binary.right_expr.accept(self)
+        if operation is operators.equal:
+            return "(%s == %s)" % (left, right)
+        if operation is operators.not_equal:
+            return "(%s != %s)" % (left, right)
+        operator = self.constant("op", binary.operator)
+        handler = operation.__name__
+        symbol = inline_operators.get(operation)
+        if symbol is None:
+            return "%s(%s, %s, %s)" % (handler, left, right, operator)
+        left_constant = type(binary.left_expr) is syntax_trees.Literal
+        right_constant = type(binary.right_expr) is syntax_trees.Literal
+        if right_constant and type(binary.right_expr.literal.get_value()) is float:
+            value = self.temporary()
+            return "(%s %s %s if type(%s := %s) is float else %s(%s, %s, %s))" % (
+                value, symbol, right, value, left, handler, value, right, operator)
+        if left_constant and type(binary.left_expr.literal.get_value()) is float:
+            value = self.temporary()
+            return "(%s %s %s if type(%s := %s) is float else %s(%s, %s, %s))" % (
+                left, symbol, value, value, right, handler, left, value, operator)
+        # & rather than and so the right operand is evaluated even when the left isn't a float
+        first, second = self.temporary(), self.temporary()
+        return "(%s %s %s if (type(%s := %s) is float) & (type(%s := %s) is float) else %s(%s, %s, %s))" % (
+            first, symbol, second, first, left, second, right, handler, first, second, operator)
+
+    def visit_Unary(self, unary):
+        value = self.temporary()
+        if unary.operation is operators.logical_not:
+            if self.is_boolean(unary.expr):
+                return "(not %s)" % unary.expr.accept(self)
+            return "((%s := %s) is None or %s == 0.0 or %s is False)" % (value, unary.expr.accept(self), value,
+                                                                          value)
+        return "(-%s if type(%s := %s) is float else %s(%s, %s))" % (value, value, unary.expr.accept(self),
+                                                                     unary.operation.__name__, value,
+                                                                     self.constant("op", unary.operator))
+
+    def visit_Assign(self, assign):
+        right_side = assign.right_side.accept(self)
+        if assign.depth == GLOBAL:
+            return "assign_global(%r, %s)" % (assign.slot, right_side)
+        if assign.depth == UPVALUE:
+            return "assign_cell(upvalues[%d], %s)" % (assign.slot, right_side)
+        python_name, cell = self.function.scopes[-1 - assign.depth][assign.slot]
+        if cell:
+            return "assign_cell(%s, %s)" % (python_name, right_side)
+        return "(%s := %s)" % (python_name, right_side)
+
+    def assign_statement(self, assign):
+        right_side = assign.right_side.accept(self)
+        if assign.depth == GLOBAL:
+            self.emit("G[%r] = %s" % (assign.slot, right_side))
+        elif assign.depth == UPVALUE:
+            self.emit("upvalues[%d].value = %s" % (assign.slot, right_side))
+        else:
+            python_name, cell = self.function.scopes[-1 - assign.depth][assign.slot]
+            self.emit("%s%s = %s" % (python_name, ".value" if cell else "", right_side))
+
+    def call(self, call):
+        callee = call.callee
+        if type(callee) is syntax_trees.Idnt:
+            callee_code = self.variable(callee.depth, callee.slot, callee.identifier.get_value(),
+                                        callee.identifier.line, "undeclared_function")
+        else:
+            callee_code = callee.accept(self)
+        function = self.temporary()
+        arguments = ", ".join(argument.accept(self) for argument in call.arguments)
+        return "(%s if callable(%s := %s) else not_callable(%d))(interpreter, [%s])" % (function, function,
+                                                                                       callee_code, call.line,
+                                                                                       arguments)
+
+    def visit_Call(self, call):
+        return self.call(call)
+
+    def visit_Get(self, get):
+        if type(get.object) is syntax_trees.SuperCall:
+            return "bind_super(%s, %s, %r, %d)" % (get.object.accept(self), get.object.this.accept(self),
+                                                   get.field_name, get.line)
+        return "get_property(%s, %s)" % (self.constant("get", get), get.object.accept(self))
+
+    def visit_Set(self, set):
+        # The value is evaluated before the object, like the Interpreter does
+        return "set_property(%s, %s, %s)" % (self.constant("set", set), set.right_side.accept(self),
+                                             set.object.accept(self))
+
+    def visit_ExprStmt(self, exprstmt):
+        expr = exprstmt.expr
+        if self.console_mode:
+            self.emit("console_print(%s)" % expr.accept(self))
+        elif type(expr) is syntax_trees.Assign:
+            self.assign_statement(expr)
+        else:
+            self.emit(expr.accept(self))
+
+    def visit_PrintStmt(self, prnt):
+        self.emit("print(str(%s), file=output)" % prnt.expr.accept(self))
+
+    def visit_Dclr(self, dclr):
+        if self.is_global_scope():
+            self.emit("declare_global(%r, None, %d)" % (dclr.var_name, dclr.line))
+            if dclr.assign_expr is not None:
+                self.assign_statement(dclr.assign_expr)
+            return
+        # The initializer can't refer to the new variable, so it is stored straight into the new local
+        right_side = "None" if dclr.assign_expr is None else dclr.assign_expr.right_side.accept(self)
+        python_name = self.declare_local(dclr.var_name, dclr.captured)
+        self.emit(("%s = Cell(%s)" if dclr.captured else "%s = %s") % (python_name, right_side))
+
+    def visit_Block(self, blk):
+        self.push_scope()
+        for stmt in blk.stmts:
+            stmt.accept(self)
+        self.pop_scope()
+
+    def visit_IfStmt(self, ifstmt):
+        self.emit_suite("if %s:" % self.truth(ifstmt.expr), lambda: ifstmt.if_block.accept(self))
+        if ifstmt.else_block is not None:
+            self.emit_suite("else:", lambda: ifstmt.else_block.accept(self))
+
+    def visit_WhileStmt(self, whilestmt):
+        function = self.function
+        function.loops.append(False)
+        self.emit_suite("while %s:" % self.truth(whilestmt.expr), lambda: whilestmt.while_block.accept(self))
+        if function.loops.pop():  # A tail call broke out of this loop, keep leaving until the function's loop
+            if function.loops:
+                function.loops[-1] = True
+                self.emit_suite("if tail_call:", lambda: self.emit("break"))
+            else:
+                self.emit_suite("if tail_call:", lambda: (self.emit("tail_call = False"), self.emit("continue")))
+
+    def visit_ReturnStmt(self, rtrn):
+        if rtrn.ret_val is None:
+            self.emit("return None")
+            return
+        if not rtrn.tail_call or rtrn.ret_val.callee.depth is None:
+            self.emit("return %s" % rtrn.ret_val.accept(self))
+            return
+        # A call to the running function itself reruns the body with new arguments instead of nesting
+        function = self.function
+        parameters = function.parameters[2:]
+        if len(rtrn.ret_val.arguments) != len(parameters):
+            self.emit("return %s" % rtrn.ret_val.accept(self))
+            return  # Left to PloxFunction to report
+        callee = rtrn.ret_val.callee
+        if callee.depth == GLOBAL:
+            lookup = "G.get(%r)" % callee.slot
+        else:
+            lookup = self.variable(callee.depth, callee.slot, callee.identifier.get_value(), callee.identifier.line)
+        arguments = [argument.accept(self) for argument in rtrn.ret_val.arguments]
+        captured = [cell for python_name, cell in function.scopes[0]]
+
+        def restart():
+            if parameters:
+                values = ["Cell(%s)" % argument if cell else argument for argument, cell in zip(arguments, captured)]
+                self.emit("%s = %s" % (", ".join(parameters), ", ".join(values)))
+            if function.loops:
+                function.loops[-1] = True
+                function.tail_flag = True
+                self.emit("tail_call = True")
+                self.emit("break")
+            else:
+                self.emit("continue")
+        function.tail_loop = True
+        self.emit_suite("if function is not None and %s is function:" % lookup, restart)
+        self.emit("return %s" % rtrn.ret_val.accept(self))
+
+    def visit_BrkStmt(self, bstmt):
+        self.emit("break")
+
+    def visit_FuncDclr(self, f_dclr):
+        if self.is_global_scope():
+            self.emit("declare_global(%r, %s, %d)" % (f_dclr.handle, self.create_function(f_dclr), f_dclr.line))
+        elif f_dclr.captured:
+            python_name = self.declare_local(f_dclr.handle, True)
+            self.emit("%s = Cell(None)" % python_name)
+            self.emit("%s.value = %s" % (python_name, self.create_function(f_dclr)))
+        else:
+            python_name = self.declare_local(f_dclr.handle, False)
+            self.emit("%s = %s" % (python_name, self.create_function(f_dclr)))
+
+    def visit_ClassDclr(self, clsdclr):
+        super_class = "None"
+        if clsdclr.super is not None:
+            super_class = self.temporary()
+            self.emit("%s = superclass(%s, %d)" % (super_class, clsdclr.super.accept(self), clsdclr.line))
+        python_name = None
+        if not self.is_global_scope():
+            python_name = self.declare_local(clsdclr.class_name, clsdclr.captured)
+            if clsdclr.captured:
+                self.emit("%s = Cell(None)" % python_name)
+        # Methods close over a "this" and "super" scope, "this" is only a placeholder a bound call replaces
+        this, super_cell = self.unique_name("v", "this"), self.unique_name("v", "super")
+        self.emit("%s = Cell(None)" % this)
+        self.emit("%s = Cell(%s)" % (super_cell, super_class))
+        self.push_scope([(this, True), (super_cell, True)])
+        methods = []
+        for method in clsdclr.methods:
+            this_upvalue = method.upvalues.index((0, 0)) if (0, 0) in method.upvalues else None
+            methods.append("(%r, %s, %r)" % (method.handle, self.create_function(method), this_upvalue))
+        self.pop_scope()
+        new_class = "create_class(%r, %s, [%s], %d)" % (clsdclr.class_name, super_class, ", ".join(methods),
+                                                        clsdclr.line)
+        if python_name is None:
+            self.emit("declare_global(%r, %s, %d)" % (clsdclr.class_name, new_class, clsdclr.line))
+        else:
+            self.emit("%s%s = %s" % (python_name, ".value" if clsdclr.captured else "", new_class))
+
+
+class TranspiledInterpreter(Interpreter):
+    '''
+    Runs programs through the Transpiler. Each program is compiled with compile() and every top
+    level statement runs as its own def, so errors are still reported statement by statement.
+    '''
+
+    def __init__(self, console_mode=False, output=None):
+        super().__init__(console_mode, output)
+        self.transpiler = Transpiler(console_mode)
+        self.runtime = {"G": self.environments[0].globals, "interpreter": self, "output": output,
+                        "Cell": Cell, "PloxFunction": PloxFunction, "console_print": self.console_print,
+                        "get_property": self.get_property, "set_property": self.store_property,
+                        "declare_global": self.declare_global, "assign_global": self.assign_global,
+                        "assign_cell": assign_cell, "undeclared": undeclared,
+                        "undeclared_function": undeclared_function, "not_callable": not_callable,
+                        "bind_super": bind_super, "superclass": superclass, "create_class": create_class}
+        for handler in list(operators.binary_operations.values()) + list(operators.unary_operations.values()) + \
+                [operators.unsupported]:
+            self.runtime[handler.__name__] = handler
+
+    def transpile(self, statements):
+        return self.transpiler.transpile(statements)
+
+    def interpret(self, statements):
+        self.has_error = False
+        try:
+            program = self.transpile(statements)
+        except PloxRuntimeError as e:
+            utilties.report_error(e, self.output)
+            self.has_error = True
+            return
+        namespace = dict(self.runtime)
+        namespace.update(program.constants)
+        exec(compile(program.source, "<plox>", "exec"), namespace)
+        super().interpret([namespace[name] for name in program.statements])
+
+    def execute(self, stmt):
+        return stmt()
+
+    def execute_function_body(self, func_body, call_args, upvalues, function=None):
+        self.return_value = func_body(upvalues, function, *[arg for param, arg in call_args])
+        return RETURN
+
+    def declare_global(self, name, value, line):
+        globals = self.environments[0].globals
+        if name in globals:
+            raise PloxRuntimeError("Redeclaration of variable %s" % name, line)
+        globals[name] = value
+
+    def assign_global(self, name, value):
+        self.environments[0].globals[name] = value
+        return value
+
+    def store_property(self, set, value, object):
+        self.set_property(set, object, value)
+
+
+def assign_cell(cell, value):
+    cell.value = value
+    return value
+
+
+def undeclared(name, line):
+    raise PloxRuntimeError("Implicit declaration of identifier %s." % name, line)
+
+
+def undeclared_function(name, line):
+    raise PloxRuntimeError("Implicit declaration of function %s." % name, line)
+
+
+def not_callable(line):
+    raise PloxRuntimeError("Attempting to call a non-callable object .", line)
+
+
+def bind_super(super_class, this, method_name, line):
+    try:
+        method = super_class.get_method(method_name)
+    except Exception:
+        raise PloxRuntimeError("Class %s has no such method %s" % (str(super_class), method_name), line)
+    return BoundMethod(this, method)
+
+
+def superclass(value, line):
+    if not isinstance(value, PloxClass):
+        raise PloxRuntimeError("Inheriting from something other than another class.", line)
+    return value
+
+
+def create_class(name, super_class, methods, line):
+    class_methods = {} if super_class is None else dict(super_class.methods)
+    for handle, method, this_upvalue in methods:
+        method.this_upvalue = this_upvalue
+        class_methods[handle] = method
+    return PloxClass(name, class_methods, super_class, line)
@@ -1,15 +1,3 @@
-import functools
-
-
-def singleton(cls):
-    @functools.wraps(cls)
-    def wrapper(*args, **kwargs):
-        if not wrapper.instance:
-            wrapper.instance = cls(*args, **kwargs)
-        return wrapper.instance
-    wrapper.instance = None
-    return wrapper
-
 class PloxError(Exception):
     def __init__(self, line, message):
         super().__init__(message)
@@ -65,7 +53,8 @@ class PloxIterator:
     def peek_next(self):
         return None if self.list_end() else self._list[self._index + 1]
 
-def report_error(error):
+def report_error(error, output=None):
+    # output is the stream of the context reporting the error, None prints to sys.stdout
     if not isinstance(error, PloxError):
         raise Exception("report_error can only report a Plox Exception!")
-    print("[ Line %d ] %s" % (error.line, error.get_error_message()))
\ No newline at end of file
+    print("[ Line %d ] %s" % (error.line, error.get_error_message()), file=output)
\ No newline at end of file
@@ -0,0 +1,394 @@
+import plox_utilities as utilities
+from plox_compiler import *
+from plox_interpreter import PloxRuntimeError
+
+
+class Closure:
+    __slots__ = ('function', 'upvalues')
+
+    def __init__(self, function, upvalues):
+        self.function = function
+        self.upvalues = upvalues
+
+    def __str__(self):
+        return str(self.function)
+
+
+class Upvalue:
+    __slots__ = ('index', 'value')
+
+    def __init__(self, index):
+        self.index = index  # Stack slot while the variable is live, -1 once it has been closed over
+        self.value = None
+
+
+class VMClass:
+    __slots__ = ('name', 'methods')
+
+    def __init__(self, name):
+        self.name = name
+        self.methods = {}
+
+    def __str__(self):
+        return self.name
+
+
+class VMInstance:
+    __slots__ = ('class_type', 'fields')
+
+    def __init__(self, cls):
+        self.class_type = cls
+        self.fields = {}
+
+    def __str__(self):
+        return self.class_type.name + " instance"
+
+
+class BoundMethod:
+    __slots__ = ('receiver', 'method')
+
+    def __init__(self, receiver, method):
+        self.receiver = receiver
+        self.method = method
+
+    def __str__(self):
+        return str(self.method)
+
+
+class CallFrame:
+    __slots__ = ('closure', 'ip', 'base')
+
+    def __init__(self, closure, base):
+        self.closure = closure
+        self.ip = 0
+        self.base = base
+
+
+class VM:
+
+    def __init__(self, console_mode=False, output=None):
+        self._console_mode = console_mode
+        self.output = output  # Stream the program prints to, None prints to sys.stdout
+        self.compiler = Compiler()
+        self.globals = {}
+        self.stack = []
+        self.frames = []
+        self.open_upvalues = {}
+        self.has_error = False
+
+    def error_occurred(self):
+        return self.has_error
+
+    def interpret(self, statements):
+        self.has_error = False
+        for stmt in statements:
+            function = self.compiler.compile(stmt, self._console_mode)
+            try:
+                self.call_script(function)
+            except PloxRuntimeError as e:
+                utilities.report_error(e, self.output)
+                self.has_error = True
+            finally:
+                self.reset_stack()
+
+    def reset_stack(self):
+        self.stack.clear()
+        self.frames.clear()
+        self.open_upvalues.clear()
+
+    def call_script(self, function):
+        script = Closure(function, [])
+        self.stack.append(script)
+        self.frames.append(CallFrame(script, 0))
+        self.run()
+
+    def console_print(self, result):
+        print("    Result: ", file=self.output)
+        print("            " + str(result), file=self.output)
+        print("", file=self.output)
+
+    def capture_upvalue(self, index):
+        upvalue = self.open_upvalues.get(index)
+        if upvalue is None:
+            upvalue = Upvalue(index)
+            self.open_upvalues[index] = upvalue
+        return upvalue
+
+    def close_upvalues(self, last):
+        open_upvalues = self.open_upvalues
+        stack = self.stack
+        for index in [i for i in open_upvalues if i >= last]:
+            upvalue = open_upvalues.pop(index)
+            upvalue.value = stack[index]
+            upvalue.index = -1
+
+    def call_value(self, callee, argc, line):
+        # Returns the frame to continue executing in, or None when the call completed immediately
+        stack = self.stack
+        if type(callee) is Closure:
+            return self.call_closure(callee, argc, line)
+        if type(callee) is BoundMethod:
+            stack[-argc - 1] = callee.receiver
+            return self.call_closure(callee.method, argc, line)
+        if type(callee) is VMClass:
+            stack[-argc - 1] = VMInstance(callee)
+            initializer = callee.methods.get("__init__")
+            if initializer is not None:
+                return self.call_closure(initializer, argc, line)
+            if argc > 0:
+                del stack[-argc:]
+            return None
+        raise PloxRuntimeError("Attempting to call a non-callable object .", line)
+
+    def call_closure(self, closure, argc, line):
+        function = closure.function
+        if argc != function.arity:
+            raise PloxRuntimeError("Function %s expects %d arguments but %d given." % (function.name,
+                                                                                       function.arity, argc),
+                                   line)
+        frame = CallFrame(closure, len(self.stack) - argc - 1)
+        self.frames.append(frame)
+        return frame
+
+    def get_property(self, obj, name, line):
+        if type(obj) is VMInstance:
+            fields = obj.fields
+            if name in fields:
+                return fields[name]
+            method = obj.class_type.methods.get(name)
+            if method is None:
+                raise PloxRuntimeError("Object %s has no such field %s" % (str(obj), name), line)
+            return BoundMethod(obj, method)
+        if type(obj) is VMClass:
+            method = obj.methods.get(name)
+            if method is None:
+                raise PloxRuntimeError("Class %s has no such method %s" % (str(obj), name), line)
+            return method
+        raise PloxRuntimeError("Attempting to access something other than a class or object instance", line)
+
+    def add(self, left, right, line):
+        if type(left) is str:
+            return left + str(right)
+        if type(left) is float and type(right) is float:
+            return left + right
+        if type(left) is float and type(right) is str:
+            return str(left) + right
+        raise PloxRuntimeError(" + Operator: Expected NUMBER or STRING", line)
+
+    def run(self):
+        stack = self.stack
+        frames = self.frames
+        push = stack.append
+        pop = stack.pop
+        globals = self.globals
+
+        frame = frames[-1]
+        closure = frame.closure
+        chunk = closure.function.chunk
+        code = chunk.code
+        constants = chunk.constants
+        lines = chunk.lines
+        upvalues = closure.upvalues
+        base = frame.base
+        ip = 0
+
+        while True:
+            op = code[ip]
+            ip += 1
+            if op == OP_GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op == OP_CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op == OP_GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals:
+                    raise PloxRuntimeError("Implicit declaration of identifier %s." % name, lines[ip - 1])
+                push(globals[name])
+            elif op == OP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False or value == 0.0:
+                    ip += code[ip] + 1
+                else:
+                    ip += 1
+            elif op == OP_LESS:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" < Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left < right
+            elif op == OP_ADD:
+                right = pop()
+                left = stack[-1]
+                if type(left) is float and type(right) is float:
+                    stack[-1] = left + right
+                else:
+                    stack[-1] = self.add(left, right, lines[ip - 1])
+            elif op == OP_SUBTRACT:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" - Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left - right
+            elif op == OP_SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op == OP_POP:
+                pop()
+            elif op == OP_LOOP:
+                ip -= code[ip]
+            elif op == OP_GET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                push(stack[upvalue.index] if upvalue.index >= 0 else upvalue.value)
+            elif op == OP_CALL:
+                argc = code[ip]
+                ip += 1
+                frame.ip = ip
+                new_frame = self.call_value(stack[-argc - 1], argc, lines[ip - 1])
+                if new_frame is not None:
+                    frame = new_frame
+                    closure = frame.closure
+                    chunk = closure.function.chunk
+                    code = chunk.code
+                    constants = chunk.constants
+                    lines = chunk.lines
+                    upvalues = closure.upvalues
+                    base = frame.base
+                    ip = 0
+            elif op == OP_RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self.close_upvalues(base)
+                frames.pop()
+                del stack[base:]
+                if len(frames) == 0:
+                    return result
+                push(result)
+                frame = frames[-1]
+                closure = frame.closure
+                chunk = closure.function.chunk
+                code = chunk.code
+                constants = chunk.constants
+                lines = chunk.lines
+                upvalues = closure.upvalues
+                base = frame.base
+                ip = frame.ip
+            elif op == OP_JUMP:
+                ip += code[ip] + 1
+            elif op == OP_GREATER:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" > Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left > right
+            elif op == OP_LESS_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" <= Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left <= right
+            elif op == OP_GREATER_EQUAL:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" >= Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left >= right
+            elif op == OP_MULTIPLY:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" * Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left * right
+            elif op == OP_DIVIDE:
+                right = pop()
+                left = stack[-1]
+                if type(left) is not float or type(right) is not float:
+                    raise PloxRuntimeError(" / Operator: Expected NUMBER", lines[ip - 1])
+                stack[-1] = left / right
+            elif op == OP_EQUAL:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == OP_GET_PROPERTY:
+                stack[-1] = self.get_property(stack[-1], constants[code[ip]], lines[ip])
+                ip += 1
+            elif op == OP_SET_UPVALUE:
+                upvalue = upvalues[code[ip]]
+                ip += 1
+                if upvalue.index >= 0:
+                    stack[upvalue.index] = stack[-1]
+                else:
+                    upvalue.value = stack[-1]
+            elif op == OP_SET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals:
+                    raise PloxRuntimeError("Implicit declaration of variable %s." % name, lines[ip - 1])
+                globals[name] = stack[-1]
+            elif op == OP_NIL:
+                push(None)
+            elif op == OP_NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False or value == 0.0
+            elif op == OP_NEGATE:
+                if type(stack[-1]) is not float:
+                    raise PloxRuntimeError(" Negation expects NUMBER", lines[ip - 1])
+                stack[-1] = -stack[-1]
+            elif op == OP_PRINT:
+                print(str(pop()), file=self.output)
+            elif op == OP_PRINT_RESULT:
+                self.console_print(pop())
+            elif op == OP_SET_PROPERTY:
+                obj = pop()
+                if type(obj) is not VMInstance:
+                    raise PloxRuntimeError("Accessing something other than an object instance", lines[ip])
+                obj.fields[constants[code[ip]]] = pop()
+                ip += 1
+                push(None)
+            elif op == OP_GET_SUPER:
+                super_class = pop()
+                name = constants[code[ip]]
+                method = super_class.methods.get(name)
+                if method is None:
+                    raise PloxRuntimeError("Class %s has no such method %s" % (str(super_class), name), lines[ip])
+                ip += 1
+                stack[-1] = BoundMethod(stack[-1], method)
+            elif op == OP_CLOSURE:
+                function = constants[code[ip]]
+                ip += 1
+                captured = []
+                for i in range(function.upvalue_count):
+                    if code[ip] == 1:
+                        captured.append(self.capture_upvalue(base + code[ip + 1]))
+                    else:
+                        captured.append(upvalues[code[ip + 1]])
+                    ip += 2
+                push(Closure(function, captured))
+            elif op == OP_CLOSE_UPVALUE:
+                self.close_upvalues(len(stack) - 1)
+                pop()
+            elif op == OP_DEFINE_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name in globals:
+                    raise PloxRuntimeError("Redeclaration of variable %s" % name, lines[ip - 1])
+                globals[name] = pop()
+            elif op == OP_CLASS:
+                cls = VMClass(constants[code[ip]])
+                if code[ip + 1] == 1:
+                    super_class = pop()
+                    if type(super_class) is not VMClass:
+                        raise PloxRuntimeError("Inheriting from something other than another class.", lines[ip])
+                    cls.methods.update(super_class.methods)
+                ip += 2
+                push(cls)
+            elif op == OP_METHOD:
+                method = pop()
+                stack[-1].methods[constants[code[ip]]] = method
+                ip += 1
+            elif op == OP_ERROR:
+                raise PloxRuntimeError(constants[code[ip]], lines[ip])
+            else:
+                raise PloxRuntimeError("Unknown instruction %d" % op, lines[ip - 1])
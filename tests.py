@@ -1,7 +1,22 @@
+import io
+import os
+import json
+import tempfile
+import tracemalloc
 import unittest
+import concurrent.futures
+import contextlib
 import plox_scanner as lex
 import plox_parser as par
 import plox_interpreter as itr
+import plox_resolver
+import plox_cache
+import plox_optimizer
+import plox_operators
+import plox_profiler
+import plox_sampler
+import plox_syntax_trees as syntax_trees
+import plox
 from plox import *
 
 
@@ -81,6 +96,62 @@ class ScannerTests(unittest.TestCase):
                                  "Syntax Tree output does not matched expected result.")
 
 
+class TestFastScanner(unittest.TestCase):
+
+    def scan_tokens(self, source, fast):
+        scanner = lex.Scanner()
+        with contextlib.redirect_stdout(io.StringIO()):
+            scanner.scan(source, fast=fast)
+        return [(t.type, t.literal, t.line) for t in scanner.get_scanned_tokens()], scanner.error_occurred()
+
+    def test_fast_scanner_matches_scanner(self):
+        sources = [ScannerTests.program_1, ScannerTests.program_2, ScannerTests.program_3,
+                   "var s = \"two\nlines\";\n\tprint s != nil; // note\nx >= 1.5 and y <= 2 or !z == false;",
+                   "print \"unterminated\n  ",
+                   "var x = 1.2.3;",
+                   "var a = 1;\n var b = $;"]
+        for source in sources:
+            self.assertEqual(self.scan_tokens(source, False), self.scan_tokens(source, True))
+
+    def test_streamed_tokens(self):
+        source = "var streamed = 0; while (streamed < 3) { streamed = streamed + 1; } print streamed;"
+        stream = lex.Scanner().tokenize(source, fast=True)
+        self.assertFalse(isinstance(stream, list))
+        tokens = par.TokenIterator(stream)
+        self.assertEqual(tokens.peek().type, lex.KEYWORD_VAR)
+        self.assertEqual(tokens.peek_next().type, lex.IDENTIFIER)
+        self.assertEqual(tokens.advance().type, lex.KEYWORD_VAR)
+        self.assertEqual(tokens.previous().type, lex.KEYWORD_VAR)
+        self.assertEqual(tokens.advance().literal, "streamed")
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program("{ " + source + " }", stream=True)
+            run_program("{ var bad = 1; $ }", stream=True)
+        self.assertEqual(output.getvalue().splitlines()[0], "3.0")
+        self.assertIn("Invalid symbols detected.", output.getvalue())
+
+    def test_token_buffer(self):
+        source = ScannerTests.program_1 + "\nvar s = \"two\nlines\"; print true != false;"
+        tokens, error = self.scan_tokens(source, False)
+        scanner = lex.Scanner()
+        for fast in (False, True):
+            with contextlib.redirect_stdout(io.StringIO()):
+                scanner.scan(source, fast=fast, buffer=True)
+            buffer = scanner.get_scanned_tokens()
+            self.assertTrue(isinstance(buffer, lex.TokenBuffer))
+            self.assertEqual([(t.type, t.literal, t.line) for t in buffer], tokens)
+        names = [buffer.get_literal(i) for i in range(len(buffer)) if buffer.get_type(i) == lex.IDENTIFIER]
+        self.assertIs(names[names.index("k", 1)], names[names.index("k")])
+
+        view = par.TokenBufferIterator(buffer)
+        self.assertTrue(view.match([lex.KEYWORD_IF]))
+        self.assertTrue(view.match_previous([lex.KEYWORD_IF]))
+        self.assertEqual(view.peek().type, lex.OPEN_PAREN)
+        self.assertEqual(view.advance().type, lex.OPEN_PAREN)
+        self.assertEqual(view.previous().type, lex.OPEN_PAREN)
+
+
 class TestPrograms(unittest.TestCase):
     prog_1 = "print (3 * 4) + (17 - 3);"
     prog_2 = "print 3*2 + (11 - 10) - 7;"
@@ -139,6 +210,29 @@ class TestPrograms(unittest.TestCase):
                   "print y;"
         run_program(program)
 
+    def test_local_redeclaration(self):
+        program = "{" \
+                  "    var slot_a = 1;" \
+                  "    var slot_a = 2;" \
+                  "    print slot_a;" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertIn("Redeclaration of variable slot_a", output.getvalue())
+        self.assertIn("Aborting program execution", output.getvalue())
+
+    def test_resolver_annotates_identifiers(self):
+        self.scanner.scan("var res_g = 1; { var res_a = 2; var res_b = res_a + res_g; }")
+        self.parser.parse(self.scanner.get_scanned_tokens())
+        statements = self.parser.get_parsed_statements()
+        plox_resolver.Resolver().resolve(statements)
+        sum_expr = statements[1].stmts[1].assign_expr.right_side
+        self.assertEqual((sum_expr.left_expr.depth, sum_expr.left_expr.slot), (0, 0))
+        self.assertEqual((sum_expr.right_expr.depth, sum_expr.right_expr.slot), (itr.GLOBAL, "res_g"))
+        self.assertFalse(hasattr(sum_expr, "__dict__"))
+        self.assertFalse(hasattr(sum_expr.left_expr, "__dict__"))
+
     def test_if_statment_true(self):
         program = "if(true)" \
                   "{" \
@@ -335,6 +429,42 @@ class TestPrograms(unittest.TestCase):
 
         run_program(program)
 
+    def test_closures_share_captured_variables(self):
+        program = "{" \
+                  "    fun adder(total)" \
+                  "    {" \
+                  "        fun add(x)" \
+                  "        {" \
+                  "            total = total + x;" \
+                  "            return total;" \
+                  "        }" \
+                  "        return add;" \
+                  "    }" \
+                  "    var add = adder(10);" \
+                  "    add(1);" \
+                  "    print add(1);" \
+                  "    var i = 0;" \
+                  "    var first = nil;" \
+                  "    while (i < 3)" \
+                  "    {" \
+                  "        var k = i;" \
+                  "        fun get()" \
+                  "        {" \
+                  "            return k;" \
+                  "        }" \
+                  "        if (i == 0)" \
+                  "        {" \
+                  "            first = get;" \
+                  "        }" \
+                  "        i = i + 1;" \
+                  "    }" \
+                  "    print first();" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(output.getvalue().split(), ["12.0", "0.0"])
+
     def test_break(self):
         program = "var i = 0;" \
                   "while(true)" \
@@ -351,6 +481,35 @@ class TestPrograms(unittest.TestCase):
 
         run_program(program)
 
+    def test_return_and_break_signals(self):
+        program = "fun find_first(limit)" \
+                  "{" \
+                  "    var n = 0;" \
+                  "    while (true)" \
+                  "    {" \
+                  "        var m = 0;" \
+                  "        while (true)" \
+                  "        {" \
+                  "            if (m >= 2) { break; }" \
+                  "            m = m + 1;" \
+                  "        }" \
+                  "        n = n + m;" \
+                  "        if (n > limit) { return n; }" \
+                  "    }" \
+                  "    return nil;" \
+                  "}" \
+                  "print find_first(5);" \
+                  "{ print signal_undeclared; }" \
+                  "var signal_after = find_first(1);" \
+                  "print signal_after;"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "6.0")
+        self.assertIn("Implicit declaration", lines[1])
+        self.assertEqual(lines[2], "2.0")
+
     def test_scoping(self):
         program = "var x = \"global\";" \
                   "{" \
@@ -482,6 +641,133 @@ class TestPrograms(unittest.TestCase):
 
         run_program(program)
 
+    def test_method_lookup_cache(self):
+        program = "{" \
+                  "    class CacheBase { fun name() { return \"base\"; } fun kind() { return \"base kind\"; } }" \
+                  "    class CacheMiddle > CacheBase { fun kind() { return \"middle kind\"; } }" \
+                  "    class CacheLeaf > CacheMiddle { }" \
+                  "    class CacheOther { fun name() { return \"other\"; } fun kind() { return \"other kind\"; } }" \
+                  "    var objects = CacheLeaf();" \
+                  "    var i = 0;" \
+                  "    while (i < 4)" \
+                  "    {" \
+                  "        var name = objects.name;" \
+                  "        if (i < 3) { print name(); } else { print name; }" \
+                  "        print objects.kind();" \
+                  "        if (i == 1) { objects = CacheOther(); }" \
+                  "        if (i == 2) { objects.name = \"field\"; }" \
+                  "        i = i + 1;" \
+                  "    }" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(output.getvalue().split("\n")[:-1],
+                         ["\"base\"", "\"middle kind\"", "\"base\"", "\"middle kind\"",
+                          "\"other\"", "\"other kind\"", "\"field\"", "\"other kind\""])
+
+    def test_bound_methods(self):
+        program = "{" \
+                  "    class Holder { fun __init__(n) { this.n = n; } fun get() { return this.n; } }" \
+                  "    class Wrapper > Holder { fun get() { return super.get() + 10; } }" \
+                  "    var first = Holder(1);" \
+                  "    var second = Holder(2);" \
+                  "    var get_first = first.get;" \
+                  "    var get_second = second.get;" \
+                  "    print get_first();" \
+                  "    print get_second();" \
+                  "    print Wrapper(3).get();" \
+                  "    print first;" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(output.getvalue().split("\n")[:-1], ["1.0", "2.0", "13.0", "Holder instance"])
+
+    def test_instance_shapes(self):
+        program = "{" \
+                  "    class Point { fun __init__(x, y) { this.x = x; this.y = y; } }" \
+                  "    fun set_z(point, z) { point.z = z; }" \
+                  "    fun get_z(point) { return point.z; }" \
+                  "    var first = Point(1, 2);" \
+                  "    var second = Point(3, 4);" \
+                  "    var third = Point(5, 6);" \
+                  "    third.w = 0;" \
+                  "    set_z(first, 7);" \
+                  "    set_z(third, 8);" \
+                  "    set_z(first, 9);" \
+                  "    print get_z(first);" \
+                  "    print get_z(third);" \
+                  "    print third.w + third.x;" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(output.getvalue().split("\n")[:-1], ["9.0", "8.0", "5.0"])
+
+        point = itr.PloxClass("Point", {})
+        first, second = itr.PloxInstance(point), itr.PloxInstance(point)
+        for instance in (first, second):
+            instance.set("x", 1.0)
+            instance.set("y", 2.0)
+        self.assertIs(first.shape, second.shape)
+        self.assertEqual(second.values, [1.0, 2.0])
+
+    tail_calls = "{" \
+                 "    fun sum(n, acc) { if (n <= 0) { return acc; } return sum(n - 1, acc + n); }" \
+                 "    print sum(100000, 0);" \
+                 "    fun countdown(n)" \
+                 "    {" \
+                 "        while (n > 0) { if (n == 1) { return countdown(0); } n = n - 1; }" \
+                 "        return \"done\";" \
+                 "    }" \
+                 "    print countdown(5);" \
+                 "    fun outer(n)" \
+                 "    {" \
+                 "        fun inner(k) { if (k <= 0) { return n; } return inner(k - 1); }" \
+                 "        return inner(50000);" \
+                 "    }" \
+                 "    print outer(7);" \
+                 "    fun step(n) { if (n <= 0) { return \"step\"; } return step(n - 1); }" \
+                 "    fun finish(n) { return \"finish\"; }" \
+                 "    var saved = step;" \
+                 "    step = finish;" \
+                 "    print saved(3);" \
+                 "    class Walker { fun walk(n) { if (n <= 0) { return \"walked\"; } return this.walk(n - 1); } }" \
+                 "    print Walker().walk(50);" \
+                 "}"
+    tail_call_output = ["5000050000.0", "\"done\"", "7.0", "\"finish\"", "\"walked\""]
+
+    def test_tail_calls(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(self.tail_calls)
+        self.assertEqual(output.getvalue().split("\n")[:-1], self.tail_call_output)
+
+    def test_method_calls_in_constant_memory(self):
+        program = "{" \
+                  "    class Counter { fun __init__() { this.count = 0; } fun step() { this.count = this.count + 1; } }" \
+                  "    var counter = Counter();" \
+                  "    var i = 0;" \
+                  "    while (i < %d) { counter.step(); i = i + 1; }" \
+                  "    print counter.count;" \
+                  "}"
+        peaks = []
+        for calls in (1000, 20000):
+            tracemalloc.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_program(program % calls)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        self.assertLess(peaks[1], peaks[0] + 64 * 1024)
+
+
+
+
+
+
+
+
 
 
 
@@ -490,8 +776,581 @@ class TestPrograms(unittest.TestCase):
 
 
 
+class TestVirtualMachine(unittest.TestCase):
+
+    def run_vm(self, program):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program, engine=ENGINE_VM)
+        return output.getvalue().split()
+
+    def test_vm_fibonacci(self):
+        program = "fun vm_fib(n)" \
+                  "{" \
+                  "   if (n <= 1)" \
+                  "   {" \
+                  "       return n;" \
+                  "   }" \
+                  "   return vm_fib(n - 1) + vm_fib(n - 2);" \
+                  "}" \
+                  "var vm_i = 0;" \
+                  "while (vm_i < 10)" \
+                  "{" \
+                  "    print vm_fib(vm_i);" \
+                  "    vm_i = vm_i + 1;" \
+                  "}"
+        self.assertEqual(self.run_vm(program), ["0.0", "1.0", "1.0", "2.0", "3.0", "5.0", "8.0", "13.0", "21.0",
+                                                "34.0"])
+
+    def test_vm_closures(self):
+        program = "fun vm_counter()" \
+                  "{" \
+                  "    var count = 0;" \
+                  "    fun increment()" \
+                  "    {" \
+                  "        count = count + 1;" \
+                  "        return count;" \
+                  "    }" \
+                  "    return increment;" \
+                  "}" \
+                  "var vm_first = vm_counter();" \
+                  "var vm_second = vm_counter();" \
+                  "print vm_first();" \
+                  "print vm_first();" \
+                  "print vm_second();"
+        self.assertEqual(self.run_vm(program), ["1.0", "2.0", "1.0"])
+
+    def test_vm_loop_closures_and_break(self):
+        program = "var vm_j = 0;" \
+                  "var vm_saved = nil;" \
+                  "while (true)" \
+                  "{" \
+                  "    var captured = vm_j;" \
+                  "    fun get()" \
+                  "    {" \
+                  "        return captured;" \
+                  "    }" \
+                  "    if (vm_j == 2)" \
+                  "    {" \
+                  "        vm_saved = get;" \
+                  "    }" \
+                  "    vm_j = vm_j + 1;" \
+                  "    if (vm_j > 4)" \
+                  "    {" \
+                  "        break;" \
+                  "    }" \
+                  "}" \
+                  "print vm_saved();" \
+                  "print vm_j;"
+        self.assertEqual(self.run_vm(program), ["2.0", "5.0"])
+
+    def test_vm_inheritance(self):
+        program = "class VMStore" \
+                  "{" \
+                  "    fun __init__(price)" \
+                  "    {" \
+                  "        this.price = price;" \
+                  "    }" \
+                  "    fun cost(amount)" \
+                  "    {" \
+                  "        return this.price * amount;" \
+                  "    }" \
+                  "}" \
+                  "class VMBakery > VMStore" \
+                  "{" \
+                  "    fun cost(amount)" \
+                  "    {" \
+                  "        return super.cost(amount) + 1;" \
+                  "    }" \
+                  "}" \
+                  "var vm_bakery = VMBakery(3);" \
+                  "print vm_bakery.cost(2);" \
+                  "print vm_bakery.price;"
+        self.assertEqual(self.run_vm(program), ["7.0", "3.0"])
+
+    def test_vm_runtime_error_continues(self):
+        program = "print vm_undeclared;" \
+                  "print \"vm_after\";"
+        output = self.run_vm(program)
+        self.assertIn("Implicit", output)
+        self.assertEqual(output[-1], "\"vm_after\"")
+
+    def test_operators_match_tree_walker(self):
+        program = "{" \
+                  "    print 1 != 2;" \
+                  "    print \"a\" != \"a\";" \
+                  "    print nil != false;" \
+                  "    print !(3 >= 2) == false;" \
+                  "    print -(4 - 6) * 3 / 2;" \
+                  "    print \"n\" + 1;" \
+                  "    print 2 - \"z\";" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(self.run_vm(program), output.getvalue().split())
+        self.assertEqual(output.getvalue().split()[:6], ["True", "False", "True", "True", "3.0", "\"n\"1.0"])
+        self.assertIn("Expected", output.getvalue())
+
 
+class TestStackInterpreter(unittest.TestCase):
 
+    def run_stack(self, program, **options):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program, engine=ENGINE_STACK, **options)
+        return output.getvalue().split("\n")[:-1]
 
+    def test_stack_deep_recursion(self):
+        program = "fun stack_depth(n)" \
+                  "{" \
+                  "    if (n <= 0)" \
+                  "    {" \
+                  "        return 0;" \
+                  "    }" \
+                  "    return stack_depth(n - 1) + 1;" \
+                  "}" \
+                  "print stack_depth(5000);"
+        self.assertEqual(self.run_stack(program), ["5000.0"])
 
+    def test_stack_call_depth_limit(self):
+        program = "fun stack_forever(n)" \
+                  "{" \
+                  "    return stack_forever(n + 1) + 0;" \
+                  "}" \
+                  "print stack_forever(0);" \
+                  "print \"stack_after\";"
+        output = io.StringIO()
+        context = PloxContext(ENGINE_STACK, output=output, max_call_depth=100)
+        context.run(program)
+        output = output.getvalue().split("\n")[:-1]
+        self.assertIn("Stack overflow, calls nested deeper than 100.", output[0])
+        self.assertEqual(output[1], "\"stack_after\"")
+        self.assertEqual(len(context.interpreter.environments), 1)
+
+    def test_stack_tail_calls(self):
+        self.assertEqual(self.run_stack(TestPrograms.tail_calls), TestPrograms.tail_call_output)
+        # Tail calls reuse the caller's place on the stack, so they don't count towards the limit
+        program = "{" \
+                  "    fun stack_loop(n) { if (n <= 0) { return \"stack_looped\"; } return stack_loop(n - 1); }" \
+                  "    print stack_loop(1000);" \
+                  "}"
+        self.assertEqual(self.run_stack(program, max_call_depth=100), ["\"stack_looped\""])
 
+    def test_stack_matches_tree_walker(self):
+        program = "{" \
+                  "    class StackStore { fun __init__(price) { this.price = price; } fun cost(n) { return this.price * n; } }" \
+                  "    class StackBakery > StackStore { fun cost(n) { return super.cost(n) + 1; } }" \
+                  "    fun counter()" \
+                  "    {" \
+                  "        var count = 0;" \
+                  "        fun increment() { count = count + 1; return count; }" \
+                  "        return increment;" \
+                  "    }" \
+                  "    var next = counter();" \
+                  "    var i = 0;" \
+                  "    while (true)" \
+                  "    {" \
+                  "        if (next() >= 3) { break; }" \
+                  "        i = i + 1;" \
+                  "    }" \
+                  "    print i;" \
+                  "    print StackBakery(2).cost(3);" \
+                  "    print -(1 + 2) * 2 != 6;" \
+                  "    print undeclared_in_stack;" \
+                  "}"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(self.run_stack(program), output.getvalue().split("\n")[:-1])
+
+
+class TestClosureEngine(unittest.TestCase):
+
+    def run_closure(self, program):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program, engine=ENGINE_CLOSURE)
+        return output.getvalue().split("\n")[:-1]
+
+    def run_tree(self, program):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        return output.getvalue().split("\n")[:-1]
+
+    def test_closure_matches_tree_walker(self):
+        program = "{" \
+                  "    class ClosureStore { fun __init__(price) { this.price = price; } fun cost(n) { return this.price * n; } }" \
+                  "    class ClosureBakery > ClosureStore { fun cost(n) { return super.cost(n) + 1; } }" \
+                  "    fun counter()" \
+                  "    {" \
+                  "        var count = 0;" \
+                  "        fun increment() { count = count + 1; return count; }" \
+                  "        return increment;" \
+                  "    }" \
+                  "    var next = counter();" \
+                  "    var i = 0;" \
+                  "    while (true)" \
+                  "    {" \
+                  "        if (next() >= 3) { break; }" \
+                  "        i = i + 1;" \
+                  "    }" \
+                  "    print i;" \
+                  "    print ClosureBakery(2).cost(3);" \
+                  "    var bakery = ClosureBakery(4);" \
+                  "    bakery.price = \"a\" + 1;" \
+                  "    print bakery.price;" \
+                  "    print -(1 + 2) * 2 != 6;" \
+                  "    print !(nil) == (1 < 2);" \
+                  "    print undeclared_in_closure;" \
+                  "}" \
+                  "var closure_global = 1;" \
+                  "fun closure_global_reader() { return closure_global; }" \
+                  "closure_global = closure_global + 1;" \
+                  "print closure_global_reader();" \
+                  "closure_global_reader(1);"
+        self.assertEqual(self.run_closure(program), self.run_tree(program))
+
+    def test_closure_tail_calls(self):
+        self.assertEqual(self.run_closure(TestPrograms.tail_calls), TestPrograms.tail_call_output)
+
+    def test_closure_runs_test_programs(self):
+        for program in (TestPrograms.prog_1, TestPrograms.prog_2, TestPrograms.prog_3):
+            self.assertEqual(self.run_closure(program), self.run_tree(program))
+
+
+class TestTranspiler(unittest.TestCase):
+
+    def run_python(self, program):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program, engine=ENGINE_PYTHON)
+        return output.getvalue().split("\n")[:-1]
+
+    def test_transpiled_matches_tree_walker(self):
+        program = "{" \
+                  "    class PyStore { fun __init__(price) { this.price = price; } fun cost(n) { return this.price * n; } }" \
+                  "    class PyBakery > PyStore { fun cost(n) { return super.cost(n) + 1; } }" \
+                  "    var first = nil;" \
+                  "    var i = 0;" \
+                  "    while (i < 3)" \
+                  "    {" \
+                  "        var captured = i;" \
+                  "        fun get() { return captured; }" \
+                  "        if (i == 0) { first = get; }" \
+                  "        i = i + 1;" \
+                  "    }" \
+                  "    print first() + i;" \
+                  "    var bakery = PyBakery(2);" \
+                  "    print bakery.cost(3);" \
+                  "    bakery.price = \"p\" + bakery.price;" \
+                  "    print bakery.price;" \
+                  "    print !(i) == (1 < 2);" \
+                  "    print -i * 2 / 4 >= -2;" \
+                  "    print undeclared_in_python;" \
+                  "}" \
+                  "var python_global = 1;" \
+                  "fun python_spin(n) { while (true) { if (n <= 0) { return python_global; } return python_spin(n - 1); } }" \
+                  "python_global = python_global + 1;" \
+                  "print python_spin(3000);" \
+                  "print -\"python\";"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(self.run_python(program), output.getvalue().split("\n")[:-1])
+
+    def test_transpiled_tail_calls(self):
+        self.assertEqual(self.run_python(TestPrograms.tail_calls), TestPrograms.tail_call_output)
+
+    def test_dump_python(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.lox")
+            with open(path, "w") as f:
+                f.write("fun dumped(n) { return n + 1; } print dumped(1);")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(plox.dump_python(path), EXIT_SUCCESS)
+        source = output.getvalue()
+        self.assertIn("def f_dumped_", source)
+        compile(source, "<dump>", "exec")
+
+    def test_contexts_are_independent(self):
+        first_output, second_output = io.StringIO(), io.StringIO()
+        first, second = PloxContext(output=first_output), PloxContext(output=second_output)
+        self.assertTrue(first.run("var shared = \"first\";"))
+        self.assertTrue(second.run("var shared = \"second\";"))
+        first.run("print shared;")
+        second.run("print shared;")
+        self.assertEqual(first_output.getvalue(), "\"first\"\n")
+        self.assertEqual(second_output.getvalue(), "\"second\"\n")
+
+    def test_concurrent_contexts(self):
+        program = "fun fib(n) { if (n <= 1) { return n; } return fib(n - 1) + fib(n - 2); }" \
+                  "class Counter { fun __init__(start) { this.count = start; } }" \
+                  "var counter = Counter(%d);" \
+                  "var i = 0;" \
+                  "while (i < 200) { counter.count = counter.count + 1; i = i + 1; }" \
+                  "print counter.count + fib(12);" \
+                  "print missing_%d;"
+
+        def run(index):
+            output = io.StringIO()
+            context = PloxContext(plox.engines[index % len(plox.engines)], output=output)
+            succeeded = context.run(program % (index, index))
+            return succeeded, output.getvalue().split("\n")[:-1]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(run, range(32)))
+        for index, (succeeded, output) in enumerate(results):
+            self.assertFalse(succeeded)
+            self.assertEqual(output[0], str(float(index + 344)))
+            self.assertIn("missing_%d" % index, output[1])
+            self.assertEqual(len(output), 2)
+
+
+class TestProgramCache(unittest.TestCase):
+
+    program = "{" \
+              "    fun cached_square(n)" \
+              "    {" \
+              "        return n * n;" \
+              "    }" \
+              "    print cached_square(7);" \
+              "}"
+
+    def test_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = plox_cache.ProgramCache(directory)
+            self.assertIsNone(cache.load(self.program))
+            for engine in engines:
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    run_program(self.program, engine=engine, cache_dir=directory)
+                    run_program(self.program, engine=engine, cache_dir=directory)
+                self.assertEqual(output.getvalue().split(), ["49.0", "49.0"])
+            self.assertEqual(os.listdir(directory), [cache.key(self.program) + plox_cache.CACHE_EXTENSION])
+            self.assertIsNotNone(cache.load(self.program))
+            self.assertIsNone(cache.load(self.program + " "))
+
+            with open(cache.path(self.program), "wb") as f:
+                f.write(b"truncated")
+            self.assertIsNone(cache.load(self.program))
+
+
+class TestSourceFiles(unittest.TestCase):
+
+    def run_file(self, text, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.lox")
+            with open(path, "w", newline="") as f:
+                f.write(text)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+                status = interpret_source(path, **options)
+        return status, output.getvalue().split()
+
+    def test_file_exit_status(self):
+        self.assertEqual(self.run_file("{ var file_a = 2;\r\n print file_a * 3; }\r\n"), (EXIT_SUCCESS, ["6.0"]))
+        status, output = self.run_file("print file_undefined;", engine=ENGINE_VM)
+        self.assertEqual(status, EXIT_PROGRAM_ERROR)
+        self.assertEqual(self.run_file("print $;")[0], EXIT_PROGRAM_ERROR)
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertEqual(interpret_source(os.path.join("missing", "program.lox")), EXIT_FILE_ERROR)
+
+    def test_batch(self):
+        scripts = {"a_fib.lox": "fun fib(n) { if (n <= 1) { return n; } return fib(n - 1) + fib(n - 2); } print fib(10);",
+                   "b_global.lox": "var batch_value = 1; print batch_value;",
+                   "c_again.lox": "var batch_value = 2; print batch_value;",
+                   "d_error.lox": "print batch_missing;",
+                   "e_loop.lox": "while (true) { }",
+                   "ignored.txt": "print 1;"}
+        with tempfile.TemporaryDirectory() as directory:
+            for name, text in scripts.items():
+                with open(os.path.join(directory, name), "w") as f:
+                    f.write(text)
+            results = plox.run_batch(directory, jobs=2, timeout=0.5)
+            self.assertEqual([os.path.basename(path) for path, status, seconds, output in results],
+                             ["a_fib.lox", "b_global.lox", "c_again.lox", "d_error.lox", "e_loop.lox"])
+            self.assertEqual([status for path, status, seconds, output in results],
+                             [plox.BATCH_OK, plox.BATCH_OK, plox.BATCH_OK, plox.BATCH_ERROR, plox.BATCH_TIMEOUT])
+            self.assertEqual([output for path, status, seconds, output in results[:3]], ["55.0\n", "1.0\n", "2.0\n"])
+            self.assertIn("batch_missing", results[3][3])
+            with contextlib.redirect_stdout(io.StringIO()) as report:
+                self.assertEqual(plox.interpret_batch(directory, jobs=1, timeout=0.5), EXIT_PROGRAM_ERROR)
+            self.assertIn("5 scripts (3 ok, 1 error, 1 timeout, 0 unreadable)", report.getvalue())
+
+    def test_memory_mapped_file(self):
+        threshold = plox.MMAP_THRESHOLD
+        plox.MMAP_THRESHOLD = 1
+        try:
+            self.assertEqual(self.run_file("{ print \"mapped\"; }", show_timings=True), (EXIT_SUCCESS, ["\"mapped\""]))
+        finally:
+            plox.MMAP_THRESHOLD = threshold
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def optimize(self, source, level=plox_optimizer.OPTIMIZE_PRUNE):
+        scanner = lex.Scanner()
+        parser = par.Parser()
+        scanner.scan(source)
+        parser.parse(scanner.get_scanned_tokens())
+        return plox_optimizer.Optimizer().optimize(parser.get_parsed_statements(), level)
+
+    def test_constant_folding(self):
+        statements = self.optimize("print (3 + 7) * (8 - 2); print !(1 >= 2); print \"a\" + 1; print 1 + x;")
+        values = [stmt.expr.literal.get_value() for stmt in statements[:3]]
+        self.assertEqual(values, [60.0, True, "\"a\"1.0"])
+        self.assertIsInstance(statements[3].expr, syntax_trees.Binary)
+        self.assertIsInstance(self.optimize("print 2 - \"b\";")[0].expr, syntax_trees.Binary)
+
+    def test_dead_branches(self):
+        source = "if (1 > 2) { print 1; } else { print 2; } while (false) { print 3; } if (nil == false) { print 4; }"
+        statements = self.optimize(source)
+        self.assertEqual(len(statements), 1)
+        self.assertIsInstance(statements[0], syntax_trees.Block)
+        self.assertEqual(len(self.optimize(source, plox_optimizer.OPTIMIZE_FOLD)), 3)
+
+    def test_optimized_programs_run_the_same(self):
+        program = "{" \
+                  "    var opt_total = 0;" \
+                  "    var opt_i = 0;" \
+                  "    while (opt_i < 3)" \
+                  "    {" \
+                  "        if (true) { opt_total = opt_total + (2 * 5) - -1; }" \
+                  "        while (false) { opt_total = 0; }" \
+                  "        opt_i = opt_i + 1;" \
+                  "    }" \
+                  "    print opt_total;" \
+                  "    print 1 / \"x\";" \
+                  "}"
+        for engine in engines:
+            outputs = []
+            for level in plox_optimizer.optimization_levels:
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    run_program(program, engine=engine, optimize=level)
+                outputs.append(output.getvalue())
+            self.assertEqual(outputs[0].splitlines()[0], "33.0")
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertEqual(outputs[0], outputs[2])
+
+
+class TestQuickening(unittest.TestCase):
+
+    def test_binary_nodes_quicken_and_deoptimise(self):
+        program = "fun quick_add(a, b) { return a + b; }" \
+                  "var quick_i = 0;" \
+                  "while (quick_i < 20) { quick_add(quick_i, 1); quick_i = quick_i + 1; }" \
+                  "print quick_add(quick_i, 0.5);"
+        output = io.StringIO()
+        context = PloxContext(output=output)
+        statements = context.analyse(program)
+        context.interpreter.interpret(statements)
+        binary = statements[0].body.stmts[0].ret_val
+        self.assertIs(binary.specialised, plox_operators.number_specialisations[plox_operators.add])
+        self.assertEqual((binary.left_type, binary.right_type), (float, float))
+
+        # A guard failure falls back to the generic handler for good, with the same results
+        context.run("print quick_add(\"quick\", quick_i); print quick_add(1, 2); print quick_add(true, 1);")
+        self.assertIsNone(binary.specialised)
+        self.assertEqual(binary.feedback, plox_operators.GENERIC)
+        self.assertEqual(output.getvalue().split("\n")[:3], ["20.5", "\"quick\"20.0", "3.0"])
+        self.assertIn("+ Operator: Expected NUMBER or STRING", output.getvalue())
+
+    def test_string_concatenation_quickens(self):
+        program = "{ var quick_s = \"\"; var quick_n = 0;" \
+                  "  while (quick_n < 12) { quick_s = quick_s + quick_n; quick_n = quick_n + 1; }" \
+                  "  print quick_s; }"
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run_program(program)
+        self.assertEqual(output.getvalue(), "\"\"" + "".join(str(float(n)) for n in range(12)) + "\n")
+        self.assertIs(plox_operators.specialise(plox_operators.add, str, float), plox_operators.concatenate)
+        self.assertIsNone(plox_operators.specialise(plox_operators.subtract, str, float))
+
+
+class TestProfiler(unittest.TestCase):
+
+    program = "fun profiled_fib(n) { if (n <= 1) { return n; } return profiled_fib(n - 1) + profiled_fib(n - 2); }\n" \
+              "class ProfiledStore\n" \
+              "{\n" \
+              "    fun __init__(price) { this.price = price; }\n" \
+              "    fun cost(n) { return profiled_fib(n) * this.price; }\n" \
+              "}\n" \
+              "print ProfiledStore(2).cost(10);"
+
+    def test_profiled_calls(self):
+        call = itr.PloxFunction.__call__
+        for engine in plox.profiled_engines:
+            profiler = plox_profiler.Profiler()
+            profiler.start()
+            try:
+                self.assertEqual(PloxContext(engine, output=io.StringIO()).run(self.program), True)
+            finally:
+                profiler.stop()
+            self.assertIs(itr.PloxFunction.__call__, call)
+            profiles = {(profile.name, profile.line): profile for profile in profiler.sorted_profiles()}
+            self.assertEqual(set(profiles), {("profiled_fib", 0), ("ProfiledStore", 1), ("__init__", 3),
+                                             ("cost", 4)})
+            self.assertEqual(profiles[("profiled_fib", 0)].calls, 177)
+            cost, fib = profiles[("cost", 4)], profiles[("profiled_fib", 0)]
+            self.assertLessEqual(fib.inclusive, cost.inclusive)
+            self.assertAlmostEqual(fib.exclusive, fib.inclusive)  # Recursive calls are only counted once
+            self.assertLess(cost.exclusive, cost.inclusive)
+
+    def test_profile_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.lox")
+            profile_path = os.path.join(directory, "profile.json")
+            with open(path, "w") as f:
+                f.write(self.program)
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as report:
+                self.assertEqual(interpret_source(path, profile=True, profile_json=profile_path), EXIT_SUCCESS)
+            with open(profile_path) as f:
+                profiles = json.load(f)
+        self.assertEqual(profiles[0]["name"], "cost")
+        self.assertEqual([profile["calls"] for profile in profiles if profile["name"] == "profiled_fib"], [177])
+        lines = report.getvalue().splitlines()
+        self.assertIn("exclusive (s)", lines[0])
+        self.assertTrue(lines[1].startswith("cost "))
+
+
+class TestSampler(unittest.TestCase):
+
+    program = "fun sampled_fib(n) { if (n <= 1) { return n; } return sampled_fib(n - 1) + sampled_fib(n - 2); }\n" \
+              "class SampledStore\n" \
+              "{\n" \
+              "    fun cost(n) { return sampled_fib(n) * 2; }\n" \
+              "}\n" \
+              "print SampledStore().cost(20);"
+
+    def test_sampled_stacks(self):
+        for engine in plox.engines:
+            sampler = plox_sampler.SamplingProfiler(0.001)
+            sampler.start()
+            try:
+                self.assertEqual(PloxContext(engine, output=io.StringIO()).run(self.program), True)
+            finally:
+                sampler.stop()
+            self.assertGreater(sampler.samples(), 0)
+            for stack in sampler.stacks:
+                self.assertEqual(stack[0], plox_sampler.ROOT_FRAME)
+                self.assertLessEqual(set(stack[1:]), {"sampled_fib:0", "cost:3"})
+                if "sampled_fib:0" in stack:
+                    self.assertEqual(stack[1], "cost:3")
+
+    def test_collapsed_output(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.lox")
+            sample_path = os.path.join(directory, "samples.txt")
+            with open(path, "w") as f:
+                f.write(self.program)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertEqual(interpret_source(path, sample=sample_path, sample_interval=0.001), EXIT_SUCCESS)
+            with open(sample_path) as f:
+                lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r"^<script>(;\w+:\d+)* \d+$")